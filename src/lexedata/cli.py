@@ -145,6 +145,24 @@ def add_log_controls(parser: argparse.ArgumentParser):
     logcontrol.add_argument("-v", action=ChangeLoglevel, const=-10, dest="loglevel")
 
 
+def add_cache_controls(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        default=False,
+        help="Keep the parsed tables of the dataset in your user cache directory ($XDG_CACHE_HOME/lexedata or ~/.cache/lexedata), and re-use them in later runs as long as the table files have not changed. The cache consists of pickle files, which can run arbitrary code when they are loaded, so never use cache files from somebody else. (default: Parse all tables from scratch)",
+    )
+
+
+def add_atomic_write_controls(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--atomic",
+        action="store_true",
+        default=False,
+        help="Stream every changed table into a temporary file, and only then move it into place, so that an interrupted run leaves the original table intact. (default: Rewrite the tables in place)",
+    )
+
+
 def setup_logging(args: argparse.Namespace):
     logger.setLevel(args.loglevel)
     return logger
@@ -162,12 +180,23 @@ def parser(description: str, **kwargs) -> argparse.ArgumentParser:
     return parser
 
 
-def enum_from_lower(enum: t.Type[enum.Enum]):
+def enum_from_lower(enum: t.Type[enum.Enum], append: bool = False):
+    """Create an argparse action that parses enum members by lowercase name.
+
+    With `append`, like argparse's "append" action, every use of the option
+    adds a member to a list.
+
+    """
+
     class FromLower(argparse.Action):
         def __call__(self, parser, namespace, values, option_string=None, **kwargs):
             enum_item = {
                 name.lower(): object for name, object in enum.__members__.items()
             }[values.lower()]
+            if append:
+                enum_item = list(getattr(namespace, self.dest, None) or []) + [
+                    enum_item
+                ]
             setattr(namespace, self.dest, enum_item)
 
     return FromLower
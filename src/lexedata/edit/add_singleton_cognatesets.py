@@ -82,6 +82,7 @@ def create_singletons(
     segment is in any cognate sets (False).
 
     """
+    dataset = util.DatasetSnapshot.of(dataset, logger=logger)
     forms = util.cache_table(dataset)
     c_j_id = dataset["CognateTable", "id"].name
     c_j_cogset = dataset["CognateTable", "cognatesetReference"].name
@@ -2,64 +2,53 @@ import pycldf
 import typing as t
 
 from lexedata.edit.add_status_column import add_status_column_to_table
+from lexedata.util.simplify_ids import foreign_keys_to, rewrite_ids
 import lexedata.cli as cli
 
-# TODO: use lexedata.edit.clean_ids.update_ids
 
+def concept_reference_columns(ds: pycldf.Dataset) -> t.Dict[str, t.Set[str]]:
+    """Find the columns, by table URL, that contain concept IDs.
 
-def substitute_many(
-    row, columns, old_values_to_new_values, status_update: t.Optional[str]
-):
-    for column in columns:
-        if type(row[column]) == list:
-            row[column] = [
-                old_values_to_new_values.get(val, val) for val in row[column]
-            ]
-            if status_update:
-                row["Status_Column"] = status_update
-        elif type(row[column]) == str:
-            row[column] = old_values_to_new_values.get(row[column], row[column])
-            if status_update:
-                row["Status_Column"] = status_update
-    return row
-
+    These are the #parameterReference columns, and the columns with a foreign
+    key to the ParameterTable. The ParameterTable itself is not included.
 
-def rename(
-    ds,
-    old_values_to_new_values,
-    logger: cli.logging.Logger,
-    status_update: t.Optional[str],
-):
+    """
     concepts = ds["ParameterTable"]
-
+    references = foreign_keys_to(ds, concepts)
+    references.pop(concepts.url.string, None)
     for table in ds.tables:
         if table == concepts:
             continue
         _, component = table.common_props["dc:conformsTo"].split("#")
         try:
             c_concept = ds[component, "parameterReference"]
-            columns = {c_concept.name}
+            references.setdefault(table.url.string, set()).add(c_concept.name)
         except KeyError:
-            columns = set()
-        for reference in table.tableSchema.foreignKeys:
-            if reference.reference.resource.string == concepts.url.string:
-                (column,) = reference.columnReference
-                columns.add(column)
-        if columns:
-            logger.info(f"Changing columns {columns:} in {component:}…")
-            ds.write(
-                **{
-                    component: [
-                        substitute_many(
-                            r,
-                            columns,
-                            old_values_to_new_values,
-                            status_update=status_update,
-                        )
-                        for r in table
-                    ]
-                }
-            )
+            pass
+    return references
+
+
+def rename(
+    ds,
+    old_values_to_new_values,
+    logger: cli.logging.Logger,
+    status_update: t.Optional[str],
+    atomic: bool = False,
+):
+    """Replace concept IDs in all tables that refer to concepts.
+
+    All references are found from the metadata first, and every affected
+    table is then read and written once, no matter how many IDs change.
+
+    """
+    rewrite_ids(
+        ds,
+        old_values_to_new_values,
+        concept_reference_columns(ds),
+        status_update=status_update,
+        atomic=atomic,
+        logger=logger,
+    )
 
 
 def replace_column(
@@ -70,6 +59,7 @@ def replace_column(
     smush: bool,
     status_update: t.Optional[str],
     logger: cli.logging.Logger = cli.logger,
+    atomic: bool = False,
 ) -> None:
     # add Status_column if not existing and status update given
     if status_update:
@@ -89,20 +79,25 @@ def replace_column(
             set(mapping.values())
         ), "Would collapse some concepts that were distinct before! Add '--smush' if that is intended."
         # dataset["ParameterTable"].tableSchema.columns["c_id"]
-        rename(dataset, mapping, logger, status_update=status_update)
+        rename(dataset, mapping, logger, status_update=status_update, atomic=atomic)
     else:
         concepts = dataset["ParameterTable"]
 
         c_id = dataset["ParameterTable", "id"].name
 
         logger.info(f"Changing {c_id:} of ParameterTable…")
-        dataset.write(
-            ParameterTable=[
-                substitute_many(r, [c_id], {original: replacement}, status_update=None)
-                for r in concepts
-            ]
+        columns = concept_reference_columns(dataset)
+        columns[concepts.url.string] = {c_id}
+        rewrite_ids(
+            dataset,
+            {original: replacement},
+            columns,
+            status_update=status_update,
+            atomic=atomic,
+            logger=logger,
         )
-        rename(dataset, {original: replacement}, logger, status_update=status_update)
+    if status_update:
+        dataset.write_metadata()
 
 
 if __name__ == "__main__":
@@ -127,6 +122,7 @@ if __name__ == "__main__":
         help="Text written to Status_Column. Set to 'None' for no status update. "
         "(default: Replaced column {original} by column {replacement}",
     )
+    cli.add_atomic_write_controls(parser)
     args = parser.parse_args()
     logger = cli.setup_logging(args)
 
@@ -141,8 +137,9 @@ if __name__ == "__main__":
         dataset=pycldf.Dataset.from_metadata(args.metadata),
         original=args.original,
         replacement=args.replacement,
-        column_replace=args.column_replace,
-        smush=args.smush,
+        column_replace=True,
+        smush=args.merge,
         status_update=args.status_update,
         logger=logger,
+        atomic=args.atomic,
     )
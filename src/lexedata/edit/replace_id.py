@@ -1,3 +1,6 @@
+import csv
+from pathlib import Path
+
 import pycldf
 
 import lexedata.cli as cli
@@ -12,10 +15,25 @@ if __name__ == "__main__":
         "table", type=str, help="The table to apply the replacement to", metavar="TABLE"
     )
     parser.add_argument(
-        "original", type=str, help="Original ID to be replaced", metavar="ORIGINAL"
+        "original",
+        type=str,
+        nargs="?",
+        help="Original ID to be replaced",
+        metavar="ORIGINAL",
+    )
+    parser.add_argument(
+        "replacement",
+        type=str,
+        nargs="?",
+        help="New ID of ORIGINAL",
+        metavar="REPLACEMENT",
     )
     parser.add_argument(
-        "replacement", type=str, help="New ID of ORIGINAL", metavar="REPLACEMENT"
+        "--mapping",
+        type=Path,
+        default=None,
+        metavar="CSV",
+        help="Instead of one ORIGINAL and REPLACEMENT, replace many IDs at once: Read them from a CSV file with a header row and two columns, original IDs and their replacements. All replacements are applied in one pass over each table.",
     )
     parser.add_argument(
         "--merge",
@@ -23,36 +41,61 @@ if __name__ == "__main__":
         default=False,
         help="When the replacement would lead to two IDs being merged, warn, but proceed.",
     )
+    cli.add_atomic_write_controls(parser)
     args = parser.parse_args()
     logger = cli.setup_logging(args)
 
+    if args.mapping:
+        if args.original or args.replacement:
+            cli.Exit.CLI_ARGUMENT_ERROR(
+                "Give either ORIGINAL and REPLACEMENT, or a --mapping file, not both."
+            )
+        with args.mapping.open(encoding="utf-8", newline="") as mapping_file:
+            rows = csv.reader(mapping_file)
+            next(rows, None)
+            mapping = {}
+            for row in rows:
+                if not row:
+                    continue
+                if len(row) != 2:
+                    cli.Exit.CLI_ARGUMENT_ERROR(
+                        f"Line {rows.line_num} of {args.mapping} has {len(row)} columns, but the mapping needs exactly two: an original ID and its replacement."
+                    )
+                mapping[row[0]] = row[1]
+    elif args.original and args.replacement:
+        mapping = {args.original: args.replacement}
+    else:
+        cli.Exit.CLI_ARGUMENT_ERROR(
+            "Give an ORIGINAL ID and its REPLACEMENT, or a --mapping file."
+        )
+
     dataset = pycldf.Dataset.from_metadata(args.metadata)
     id_column = dataset[args.table, "id"].name
     ids = {row[id_column] for row in dataset[args.table]}
-    if args.original not in ids:
-        logger.error(
-            "The original ID %s is not an ID in %s.", args.original, args.table
-        )
-        cli.Exit.INVALID_ID()
-
-    if args.replacement in ids:
-        if args.merge:
-            logger.info(
-                "The replacement ID %s is already an ID in %s. I have been told to merge them.",
-                args.replacement,
-                args.table,
-            )
-        else:
-            logger.error(
-                "The replacement ID %s is already an ID in %s. If you want to force conflation of the two rows in tables that reference this one, use --merge.",
-                args.replacement,
-                args.table,
-            )
+    for original, replacement in mapping.items():
+        if original not in ids:
+            logger.error("The original ID %s is not an ID in %s.", original, args.table)
             cli.Exit.INVALID_ID()
 
+        if replacement in ids:
+            if args.merge:
+                logger.info(
+                    "The replacement ID %s is already an ID in %s. I have been told to merge them.",
+                    replacement,
+                    args.table,
+                )
+            else:
+                logger.error(
+                    "The replacement ID %s is already an ID in %s. If you want to force conflation of the two rows in tables that reference this one, use --merge.",
+                    replacement,
+                    args.table,
+                )
+                cli.Exit.INVALID_ID()
+
     update_ids(
         ds=dataset,
         table=dataset[args.table],
-        mapping={args.original: args.replacement},
+        mapping=mapping,
         logger=logger,
+        atomic=args.atomic,
     )
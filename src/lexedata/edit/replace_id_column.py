@@ -30,6 +30,7 @@ if __name__ == "__main__":
         default=False,
         help="Use the REPLACEMENT literally, instead of simplifying it. (Run lexedata.edit.simplify_ids if you change your mind later.)",
     )
+    cli.add_atomic_write_controls(parser)
     args = parser.parse_args()
     logger = cli.setup_logging(args)
 
@@ -64,4 +65,5 @@ if __name__ == "__main__":
         table=dataset[args.table],
         mapping=replacement,
         logger=logger,
+        atomic=args.atomic,
     )
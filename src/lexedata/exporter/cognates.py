@@ -1,15 +1,18 @@
 # -*- coding: utf-8 -*-
 import re
 import abc
+import enum
 import typing as t
 import urllib.parse
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
 import pycldf
 import openpyxl as op
 
 from lexedata import types, cli, util
 from lexedata.util import parse_segment_slices
+from lexedata.util.excel import WriteOnlySheet
 from lexedata.edit.add_singleton_cognatesets import create_singletons
 
 
@@ -24,8 +27,23 @@ WARNING = "\u26A0"
 CognatesetID = str
 
 
+class Sharding(enum.Enum):
+    """How to split an export into several workbooks."""
+
+    PREFIX = 0
+    CONCEPT = 1
+    ROWS = 2
+
+
 class BaseExcelWriter:
-    """Class logic for matrix-shaped Excel export."""
+    """Class logic for matrix-shaped Excel export.
+
+    With `streaming=True`, the workbook is a write-only openpyxl workbook:
+    Each row block is written out as soon as it is complete, so the memory
+    needed does not grow with the size of the export, but the worksheet can
+    not be read back, only saved.
+
+    """
 
     row_table: str
     header: t.List[t.Tuple[str, str]]
@@ -35,6 +53,7 @@ class BaseExcelWriter:
         dataset: pycldf.Dataset,
         database_url: t.Optional[str] = None,
         logger: cli.logging.Logger = cli.logger,
+        streaming: bool = False,
     ):
         self.set_header(dataset)
         self.separators = {
@@ -45,8 +64,13 @@ class BaseExcelWriter:
 
         self.URL_BASE = database_url
 
-        self.wb = op.Workbook()
-        self.ws: op.worksheet.worksheet.Worksheet = self.wb.active
+        self.ws: t.Union[op.worksheet.worksheet.Worksheet, WriteOnlySheet]
+        if streaming:
+            self.wb = op.Workbook(write_only=True)
+            self.ws = WriteOnlySheet(self.wb.create_sheet())
+        else:
+            self.wb = op.Workbook()
+            self.ws = self.wb.active
 
         self.logger = logger
 
@@ -57,6 +81,12 @@ class BaseExcelWriter:
         judgements: t.Iterable[types.Judgement],
         forms,
         size_sort: bool = False,
+        forms_by_row: t.Optional[
+            t.Mapping[
+                types.Cognateset_ID,
+                t.Mapping[types.Form_ID, t.Sequence[types.Judgement]],
+            ]
+        ] = None,
     ) -> None:
         """Convert the initial CLDF into an Excel cognate view
 
@@ -67,6 +97,10 @@ class BaseExcelWriter:
         the same cognateset, these appear in different cells, one below the
         other.
 
+        If the judgements have already been grouped by `collect_forms_by_row`,
+        for example to sort the rows by size, pass that grouping as
+        `forms_by_row` to not group them again.
+
         """
         # Define the columns, i.e. languages and write to excel
         self.lan_dict: t.Dict[str, int] = {}
@@ -86,7 +120,8 @@ class BaseExcelWriter:
         # Again, row_index 2 is indeed row 2, row 1 is header
         row_index = 1 + 1
 
-        forms_by_row = self.collect_forms_by_row(judgements, rows)
+        if forms_by_row is None:
+            forms_by_row = self.collect_forms_by_row(judgements, rows)
 
         # iterate over all rows
         for row in cli.tq(
@@ -115,6 +150,10 @@ class BaseExcelWriter:
                 self.write_row_header(row, r)
 
             row_index = new_row_index
+            if isinstance(self.ws, WriteOnlySheet):
+                self.ws.flush(row_index)
+        if isinstance(self.ws, WriteOnlySheet):
+            self.ws.flush()
 
     def create_formcells(
         self,
@@ -188,6 +227,75 @@ class BaseExcelWriter:
             ].append(judgement)
         return all_forms
 
+    def row_concept(self, row_object: types.RowObject) -> str:
+        """Name the concept a row belongs to, for sharding by concept.
+
+        The rows of a concept matrix are concepts themselves.
+
+        """
+        return row_object["id"]
+
+    def shards(
+        self,
+        rows: t.Iterable[types.RowObject],
+        forms_by_row: t.Mapping[
+            types.Cognateset_ID, t.Mapping[types.Form_ID, t.Sequence[types.Judgement]]
+        ],
+        forms: t.Mapping[types.Form_ID, types.Form],
+        sharding: Sharding,
+        size: int,
+    ) -> t.List[t.Tuple[str, t.List[types.RowObject]]]:
+        """Split the rows into groups, each to be written to its own workbook.
+
+        With PREFIX, rows are grouped by the first `size` characters of their
+        ID; with CONCEPT, by `row_concept`. With ROWS, consecutive rows are
+        packed into shards of at most `size` Excel rows each – unless a single
+        row object needs more than that on its own.
+
+        Rows keep their order within each shard, and shards are ordered by
+        their first row. Rows without forms are not written by
+        `create_excel`, so they are left out.
+
+        """
+        shards: t.Dict[str, t.List[types.RowObject]] = {}
+        if sharding == Sharding.ROWS:
+            filled = size
+            for row in rows:
+                height = self.block_height(forms_by_row.get(row["id"], {}), forms)
+                if not height:
+                    continue
+                if filled + height > size:
+                    name = str(len(shards) + 1)
+                    shards[name] = []
+                    filled = 0
+                shards[name].append(row)
+                filled += height
+        else:
+            for row in rows:
+                if row["id"] not in forms_by_row:
+                    continue
+                if sharding == Sharding.PREFIX:
+                    name = str(row["id"])[:size]
+                elif sharding == Sharding.CONCEPT:
+                    name = self.row_concept(row)
+                else:
+                    raise TypeError(
+                        f"Value of sharding, {sharding}, did not correspond to a known Sharding."
+                    )
+                shards.setdefault(name, []).append(row)
+        return list(shards.items())
+
+    def block_height(
+        self,
+        row_forms: t.Mapping[types.Form_ID, t.Sequence[types.Judgement]],
+        forms: t.Mapping[types.Form_ID, types.Form],
+    ) -> int:
+        """Count the Excel rows that `create_formcells` needs for a row object."""
+        per_language: t.Counter[types.Language_ID] = t.Counter()
+        for form, judgements in row_forms.items():
+            per_language[forms[form]["languageReference"]] += len(judgements)
+        return max(per_language.values(), default=0)
+
     @abc.abstractmethod
     def write_row_header(self, row_object: types.RowObject, row_index: int):
         """Write a row header
@@ -224,8 +332,14 @@ class ExcelWriter(BaseExcelWriter):
         singleton_cognate: bool = False,
         singleton_status: t.Optional[str] = None,
         logger: cli.logging.Logger = cli.logger,
+        streaming: bool = False,
     ):
-        super().__init__(dataset=dataset, database_url=database_url, logger=logger)
+        super().__init__(
+            dataset=dataset,
+            database_url=database_url,
+            logger=logger,
+            streaming=streaming,
+        )
         # assert that all required tables are present in Dataset
         try:
             for _ in dataset["CognatesetTable"]:
@@ -249,6 +363,10 @@ class ExcelWriter(BaseExcelWriter):
                     f"You requested that I set the status of new singleton cognate sets to {self.singleton_status}, but your CognatesetTable has no Status_Column to write it to. If you want a Status "
                 )
 
+    def row_concept(self, cogset: types.CogSet) -> str:
+        """Name the central concept(s) of a cognateset, or '' if it has none."""
+        return ", ".join(util.ensure_list(cogset.get("parameterReference")))
+
     def write_row_header(self, cogset, row_number: int):
         for col, (db_name, header) in enumerate(self.header, 1):
             # db_name is '' when add_central_concepts is activated
@@ -413,26 +531,196 @@ def properties_as_key(data, columns):
             s[property] = s.pop(name, None)
 
 
+def cognateset_sizes(
+    judgements: t.Iterable[types.Judgement],
+) -> t.Counter[types.Cognateset_ID]:
+    """Count the judgements of each cognateset.
+
+    >>> cognateset_sizes([
+    ...     {"cognatesetReference": "s1"}, {"cognatesetReference": "s2"},
+    ...     {"cognatesetReference": "s1"}])
+    Counter({'s1': 2, 's2': 1})
+
+    """
+    return t.Counter(j["cognatesetReference"] for j in judgements)
+
+
 def sort_cognatesets(
     cogsets: t.List[types.CogSet],
-    judgements: t.Sequence[types.Judgement] = [],
-    sort_column: t.Optional[str] = None,
+    judgements: t.Iterable[types.Judgement] = [],
+    sort_column: t.Union[None, str, t.Sequence[str]] = None,
     size: bool = True,
+    sizes: t.Optional[t.Mapping[types.Cognateset_ID, int]] = None,
 ) -> None:
-    """Sort cognatesets by a given column, and optionally by size."""
-    # Sort first by size, then by the specified column, so that if both
-    # happen, the cognatesets are globally sorted by the specified column
-    # and within one group by size.
+    """Sort cognatesets by given columns, and optionally by size.
+
+    The cognatesets are sorted globally by the sort column, or by several
+    sort columns in order, and within one group by size, biggest first.
+    Cognatesets that compare equal keep their order.
+
+    The size of a cognateset is its number of judgements. If the sizes are
+    already known, pass them as `sizes`, otherwise they are counted from the
+    judgements.
+
+    >>> cogsets = [
+    ...     {"id": "s1", "group": "b"}, {"id": "s2", "group": "a"},
+    ...     {"id": "s3", "group": "b"}]
+    >>> sort_cognatesets(cogsets, sizes={"s1": 1, "s2": 1, "s3": 2},
+    ...     sort_column="group")
+    >>> [c["id"] for c in cogsets]
+    ['s2', 's3', 's1']
+
+    """
+    if isinstance(sort_column, str):
+        sort_columns: t.Sequence[str] = [sort_column]
+    else:
+        sort_columns = sort_column or []
+    if size and sizes is None:
+        sizes = cognateset_sizes(judgements)
+
     if size:
-        cogsets.sort(
-            key=lambda x: len(
-                [j for j in judgements if j["cognatesetReference"] == x["id"]]
-            ),
-            reverse=True,
+        assert sizes is not None
+
+        def key(c):
+            return tuple(c[column] for column in sort_columns) + (
+                -sizes.get(c["id"], 0),
+            )
+
+    elif sort_columns:
+
+        def key(c):
+            return tuple(c[column] for column in sort_columns)
+
+    else:
+        return
+    cogsets.sort(key=key)
+
+
+def shard_path(excel: Path, i: int, n: int) -> Path:
+    """Name the file for shard i of n, next to the requested workbook.
+
+    >>> shard_path(Path("out/cognates.xlsx"), 3, 12).as_posix()
+    'out/cognates_03.xlsx'
+
+    """
+    return excel.with_name(
+        "{:}_{:0{:d}d}{:}".format(excel.stem, i, len(str(n)), excel.suffix)
+    )
+
+
+def write_shard(
+    writer_class: t.Type[BaseExcelWriter],
+    metadata: Path,
+    writer_arguments: t.Mapping[str, t.Any],
+    languages: t.Sequence[types.Language],
+    rows: t.Sequence[types.RowObject],
+    forms_by_row: t.Mapping[
+        types.Cognateset_ID, t.Mapping[types.Form_ID, t.Sequence[types.Judgement]]
+    ],
+    forms: t.Mapping[types.Form_ID, types.Form],
+    filename: Path,
+) -> Path:
+    """Write one shard of an export to its own workbook."""
+    writer = writer_class(pycldf.Dataset.from_metadata(metadata), **writer_arguments)
+    writer.create_excel(
+        rows=rows,
+        languages=languages,
+        judgements=[],
+        forms=forms,
+        forms_by_row=forms_by_row,
+    )
+    writer.wb.save(filename=filename)
+    return filename
+
+
+def write_shards(
+    writer_class: t.Type[BaseExcelWriter],
+    metadata: Path,
+    shards: t.Sequence[t.Tuple[str, t.Sequence[types.RowObject]]],
+    languages: t.Sequence[types.Language],
+    forms_by_row: t.Mapping[
+        types.Cognateset_ID, t.Mapping[types.Form_ID, t.Sequence[types.Judgement]]
+    ],
+    forms: t.Mapping[types.Form_ID, types.Form],
+    excel: Path,
+    writer_arguments: t.Mapping[str, t.Any] = {},
+    jobs: int = 1,
+    logger: cli.logging.Logger = cli.logger,
+) -> t.List[Path]:
+    """Write each shard to a workbook named by `shard_path`, in parallel.
+
+    Each shard is written by a fresh `writer_class(dataset,
+    **writer_arguments)`, where the dataset is opened from `metadata` again
+    – pycldf datasets cannot always be sent to other processes. Each worker
+    is only sent the rows, judgements and forms of its shard.
+
+    """
+    arguments = []
+    for i, (name, rows) in enumerate(shards, 1):
+        shard_forms_by_row = {
+            row["id"]: forms_by_row[row["id"]]
+            for row in rows
+            if row["id"] in forms_by_row
+        }
+        shard_forms = {
+            f: forms[f] for row_forms in shard_forms_by_row.values() for f in row_forms
+        }
+        filename = shard_path(excel, i, len(shards))
+        logger.info(
+            "Writing %d rows of shard %s to %s.", len(rows), name or "''", filename
         )
+        arguments.append(
+            (
+                writer_class,
+                metadata,
+                writer_arguments,
+                languages,
+                rows,
+                shard_forms_by_row,
+                shard_forms,
+                filename,
+            )
+        )
+    if jobs > 1 and len(arguments) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(write_shard, *zip(*arguments)))
+    return [write_shard(*a) for a in arguments]
+
+
+def add_shard_arguments(parser) -> None:
+    """Add the arguments for sharded Excel export to a CLI parser."""
+    parser.add_argument(
+        "--shard-by",
+        action=cli.enum_from_lower(Sharding),
+        default=None,
+        help="""Instead of one workbook, write several, named like the output file with
+        a number added: `prefix` puts the rows whose IDs start with the same
+        --shard-size characters into one workbook, `concept` puts cognatesets
+        with the same central concept (or, for a concept matrix, each concept)
+        into one workbook, and `rows` fills each workbook with up to
+        --shard-size Excel rows. (default: Write a single workbook)""",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=None,
+        metavar="N",
+        help="The ID prefix length for --shard-by=prefix (default: 1), or the maximum number of Excel rows per workbook for --shard-by=rows (default: 10000).",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Write shards in N parallel processes. (default: 1)",
+    )
 
-    if sort_column:
-        cogsets.sort(key=lambda c: c[sort_column])
+
+def shard_size(sharding: Sharding, size: t.Optional[int]) -> int:
+    """Fill in the default --shard-size of a sharding."""
+    if size is not None:
+        return size
+    return 10000 if sharding == Sharding.ROWS else 1
 
 
 def parser():
@@ -454,7 +742,9 @@ def parser():
     )
     parser.add_argument(
         "--sort-cognatesets-by",
-        help="The name of a column in the CognatesetTable to sort cognates by in the output",
+        action="append",
+        default=[],
+        help="The name of a column in the CognatesetTable to sort cognates by in the output. Give it several times to sort by several columns, the first one taking priority.",
     )
     parser.add_argument(
         "--url-template",
@@ -483,6 +773,13 @@ def parser():
         action="store_true",
         help="If adding singletons: Instead of creating singleton cognate sets only for forms that are not cognate coded at all, make sure every contiguous set of segments in every form is in a cognate set.",
     )
+    parser.add_argument(
+        "--streaming",
+        default=False,
+        action="store_true",
+        help="Write the workbook row by row in openpyxl's write-only mode, which keeps memory use bounded for very large exports.",
+    )
+    add_shard_arguments(parser)
     return parser
 
 
@@ -502,8 +799,8 @@ def cogsets_and_judgements(
         properties_as_key(cogsets, dataset["CognatesetTable"].tableSchema.columns)
         properties_as_key(judgements, dataset["CognateTable"].tableSchema.columns)
     else:
-        cogsets = util.cache_table(dataset, "CognatesetTable").values()
-        judgements = util.cache_table(dataset, "CognateTable").values()
+        cogsets = list(util.cache_table(dataset, "CognatesetTable").values())
+        judgements = list(util.cache_table(dataset, "CognateTable").values())
 
     return cogsets, judgements
 
@@ -524,24 +821,36 @@ if __name__ == "__main__":  # pragma: no cover
         dataset,
         database_url=args.url_template,
         logger=logger,
+        streaming=args.streaming,
     )
 
     cogsets, judgements = cogsets_and_judgements(
         dataset, args.add_singletons_with_status, args.by_segment, logger
     )
 
-    try:
-        cogset_order = (
-            util.cldf_property(
-                dataset["CognatesetTable", args.sort_cognatesets_by].propertyUrl
+    cogset_order = []
+    for column in args.sort_cognatesets_by:
+        try:
+            cogset_order.append(
+                util.cldf_property(dataset["CognatesetTable", column].propertyUrl)
+                or dataset["CognatesetTable", column].name
             )
-            or dataset["CognatesetTable", args.sort_cognatesets_by].name
-        )
-    except (KeyError):
-        cli.Exit.INVALID_COLUMN_NAME(
-            f"No column '{args.sort_cognatesets_by}' in your CognatesetTable."
-        )
-    sort_cognatesets(cogsets, judgements, cogset_order, size=args.size_sort)
+        except KeyError:
+            cli.Exit.INVALID_COLUMN_NAME(
+                f"No column '{column}' in your CognatesetTable."
+            )
+    # Group the judgements once, and take the sizes of the cognatesets from
+    # that grouping.
+    forms_by_row = E.collect_forms_by_row(judgements, cogsets)
+    sort_cognatesets(
+        cogsets,
+        sort_column=cogset_order,
+        size=args.size_sort,
+        sizes={
+            cogset: sum(len(js) for js in by_form.values())
+            for cogset, by_form in forms_by_row.items()
+        },
+    )
 
     # TODO: wrap the following two blocks into a
     # get_sorted_languages() -> t.OrderedDict[languageReference, Column Header/Titel/Name]
@@ -558,13 +867,37 @@ if __name__ == "__main__":  # pragma: no cover
 
     forms = util.cache_table(dataset)
 
-    E.create_excel(
-        size_sort=args.size_sort,
-        languages=languages,
-        rows=cogsets,
-        judgements=judgements,
-        forms=forms,
-    )
-    E.wb.save(
-        filename=args.excel,
-    )
+    if args.shard_by is not None:
+        write_shards(
+            ExcelWriter,
+            args.metadata,
+            E.shards(
+                cogsets,
+                forms_by_row,
+                forms,
+                args.shard_by,
+                shard_size(args.shard_by, args.shard_size),
+            ),
+            languages,
+            forms_by_row,
+            forms,
+            args.excel,
+            writer_arguments={
+                "database_url": args.url_template,
+                "streaming": args.streaming,
+            },
+            jobs=args.jobs,
+            logger=logger,
+        )
+    else:
+        E.create_excel(
+            size_sort=args.size_sort,
+            languages=languages,
+            rows=cogsets,
+            judgements=judgements,
+            forms=forms,
+            forms_by_row=forms_by_row,
+        )
+        E.wb.save(
+            filename=args.excel,
+        )
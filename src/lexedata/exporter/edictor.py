@@ -9,6 +9,7 @@ integers.
 # TODO: Underscores are treated specially by Edictor in a way we cannot support yet.
 
 import csv
+import hashlib
 import itertools
 import typing as t
 from pathlib import Path
@@ -34,6 +35,27 @@ def rename(form_column):
     }.get(form_column, form_column)
 
 
+# Extra column holding a hash of the content of each exported row, so the
+# importer can tell which rows were edited in Edictor.
+HASH_COLUMN = "_row_hash"
+
+
+def row_hash(values: t.Iterable[t.Optional[str]]) -> str:
+    """Hash the cells of one row of an Edictor file.
+
+    The hash covers the cells as they are written to the TSV file, so the
+    importer can recompute it from the cells it reads back.
+
+    >>> row_hash(["1", "ð ə f o m", None]) == row_hash(["1", "ð ə f o m", ""])
+    True
+    >>> row_hash(["1", "ð ə f o m", ""]) == row_hash(["2", "ð ə f o m", ""])
+    False
+
+    """
+    content = "\t".join("" if v is None else str(v) for v in values)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:12]
+
+
 def glue_in_alignment(
     global_alignment, cogsets, new_alignment, new_cogset, segments: slice
 ):
@@ -148,6 +170,9 @@ def forms_to_tsv(
     cognatesets: t.Iterable[str],
     logger: cli.logging.Logger = cli.logger,
 ):
+    # FormTable and CognateTable are needed here and in the non-concatenative
+    # morpheme report, so read them only once.
+    dataset = util.DatasetSnapshot.of(dataset, logger=logger)
     try:
         dataset["FormTable", "segments"].name
     except KeyError:
@@ -301,8 +326,14 @@ def write_edictor_file(
     forms: t.Mapping[types.Form_ID, t.Mapping[str, t.Any]],
     judgements_about_form,
     cognateset_numbers,
+    row_hashes: bool = False,
 ):
-    """Write the judgements of a dataset to file, in edictor format."""
+    """Write the judgements of a dataset to file, in edictor format.
+
+    With row_hashes, add a column containing a hash of each row, which lets
+    the importer skip the rows that were not changed in Edictor.
+
+    """
     delimiters = {
         util.cldf_property(c.propertyUrl) or c.name: c.separator
         for c in dataset["FormTable"].tableSchema.columns
@@ -319,6 +350,8 @@ def write_edictor_file(
     tsv_header.append("alignment")
     if "parameterReference" in delimiters:
         tsv_header.append("_parameterReference")
+    if row_hashes:
+        tsv_header.append(HASH_COLUMN)
 
     # write output to tsv
     out = csv.DictWriter(
@@ -355,6 +388,10 @@ def write_edictor_file(
             .replace(")", " )")
             .replace(" ) ( ", " ")
         )
+        if row_hashes:
+            this_form[HASH_COLUMN] = row_hash(
+                this_form.get(c) for c in tsv_header[1:-1]
+            )
 
         # add integer form id
         out.writerow(this_form)
@@ -441,9 +478,21 @@ if __name__ == "__main__":
         default="cognate.tsv",
         help="Path to the output file",
     )
+    parser.add_argument(
+        "--no-row-hashes",
+        action="store_false",
+        dest="row_hashes",
+        default=True,
+        help="Do not add a column with a hash of each row. Without these hashes, the importer cannot tell which rows were changed in Edictor and re-imports all of them.",
+    )
+    cli.add_cache_controls(parser)
     args = parser.parse_args()
     logger = cli.setup_logging(args)
-    dataset = pycldf.Dataset.from_metadata(args.metadata)
+    dataset = util.DatasetSnapshot(
+        pycldf.Dataset.from_metadata(args.metadata),
+        logger=logger,
+        cache=args.cache,
+    )
 
     forms, judgements_about_form, cognateset_mapping = forms_to_tsv(
         dataset=dataset,
@@ -455,5 +504,10 @@ if __name__ == "__main__":
 
     with args.output_file.open("w", encoding="utf-8") as file:
         write_edictor_file(
-            dataset, file, forms, judgements_about_form, cognateset_mapping
+            dataset,
+            file,
+            forms,
+            judgements_about_form,
+            cognateset_mapping,
+            row_hashes=args.row_hashes,
         )
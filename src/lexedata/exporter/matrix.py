@@ -7,7 +7,12 @@ from pathlib import Path
 import pycldf
 import openpyxl as op
 
-from lexedata.exporter.cognates import BaseExcelWriter
+from lexedata.exporter.cognates import (
+    BaseExcelWriter,
+    add_shard_arguments,
+    shard_size,
+    write_shards,
+)
 from lexedata import cli, types, util
 
 
@@ -21,8 +26,14 @@ class MatrixExcelWriter(BaseExcelWriter):
         dataset: pycldf.Dataset,
         database_url: t.Optional[str] = None,
         logger: cli.logging.Logger = cli.logger,
+        streaming: bool = False,
     ):
-        super().__init__(dataset=dataset, database_url=database_url, logger=logger)
+        super().__init__(
+            dataset=dataset,
+            database_url=database_url,
+            logger=logger,
+            streaming=streaming,
+        )
 
     def set_header(self, dataset):
         self.header = [("id", "ID")]
@@ -98,6 +109,13 @@ if __name__ == "__main__":
         " point to lexibank, you would use https://lexibank.clld.org/values/{:}."
         " (default: https://example.org/lexicon/{:})",
     )
+    parser.add_argument(
+        "--streaming",
+        default=False,
+        action="store_true",
+        help="Write the workbook row by row in openpyxl's write-only mode, which keeps memory use bounded for very large exports.",
+    )
+    add_shard_arguments(parser)
     args = parser.parse_args()
     logger = cli.setup_logging(args)
 
@@ -106,6 +124,7 @@ if __name__ == "__main__":
         dataset,
         database_url=args.url_template,
         logger=logger,
+        streaming=args.streaming,
     )
     forms = util.cache_table(dataset)
     languages = sorted(
@@ -117,9 +136,33 @@ if __name__ == "__main__":
         for parameter in util.ensure_list(f["parameterReference"])
     ]
     parameters = util.cache_table(dataset, "ParameterTable").values()
-    E.create_excel(
-        rows=parameters, judgements=judgements, forms=forms, languages=languages
-    )
-    E.wb.save(
-        filename=args.excel,
-    )
+    if args.shard_by is not None:
+        forms_by_row = E.collect_forms_by_row(judgements, parameters)
+        write_shards(
+            MatrixExcelWriter,
+            args.metadata,
+            E.shards(
+                parameters,
+                forms_by_row,
+                forms,
+                args.shard_by,
+                shard_size(args.shard_by, args.shard_size),
+            ),
+            languages,
+            forms_by_row,
+            forms,
+            args.excel,
+            writer_arguments={
+                "database_url": args.url_template,
+                "streaming": args.streaming,
+            },
+            jobs=args.jobs,
+            logger=logger,
+        )
+    else:
+        E.create_excel(
+            rows=parameters, judgements=judgements, forms=forms, languages=languages
+        )
+        E.wb.save(
+            filename=args.excel,
+        )
@@ -1,9 +1,20 @@
+import io
+import os
+import abc
+import csv
 import sys
 import enum
+import json
+import hashlib
+import tempfile
+import contextlib
 import typing as t
 from pathlib import Path
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 import lxml.etree as ET
 
+import numpy
 import pycldf
 
 from lexedata import util
@@ -106,20 +117,25 @@ def read_wordlist(
 ) -> t.MutableMapping[types.Language_ID, t.MutableMapping[types.Parameter_ID, t.Set]]:
     col_map = dataset.column_names
 
+    # All tables are read through util.read_columns, which only looks at the
+    # columns we need, instead of letting csvw convert every cell of every row.
     if code_column:
         # Just in case that column was specified by property URL. We
         # definitely want the name. In any case, this will also throw a
         # helpful KeyError when the column does not exist.
-        form_table_form = col_map.forms.form
         form_table_column = col_map.forms.id
-        cognatesets = util.cache_table(
-            dataset,
-            columns={
-                "form": form_table_column,
-                "transcription": form_table_form,
-                "code": dataset["FormTable", code_column].name,
-            },
-            filter=lambda row: bool(row[col_map.forms.form]),
+        judgements = (
+            judgement
+            for judgement in util.read_columns(
+                dataset,
+                "FormTable",
+                {
+                    "form": form_table_column,
+                    "transcription": col_map.forms.form,
+                    "code": dataset["FormTable", code_column].name,
+                },
+            )
+            if judgement["transcription"]
         )
     else:
         # We search for cognatesetReferences in the FormTable or a separate
@@ -131,17 +147,13 @@ def read_wordlist(
         if code_column:
             # This is not the CLDF way, warn the user.
             form_table_column = col_map.forms.id
-            form_table_form = col_map.forms.form
             logger.warning(
                 "Your dataset has a cognatesetReference in the FormTable. Consider running lexedata.edit.add_cognate_table to create an explicit cognate table."
             )
-            cognatesets = util.cache_table(
+            judgements = util.read_columns(
                 dataset,
-                columns={
-                    "form": form_table_column,
-                    "transcription": form_table_form,
-                    "code": code_column,
-                },
+                "FormTable",
+                {"form": form_table_column, "code": code_column},
             )
         else:
             # There was no cognatesetReference in the form table. If we
@@ -160,7 +172,7 @@ def read_wordlist(
                     if key.columnReference == [form_reference]
                 ]
                 (form_table_column,) = foreign_key.reference.columnReference
-                cognatesets = util.cache_table(
+                judgements = util.read_columns(
                     dataset,
                     "CognateTable",
                     {"form": form_reference, "code": code_column},
@@ -173,11 +185,11 @@ def read_wordlist(
                     "specify code_column explicitly?"
                 )
 
-    # Cognate sets have been loaded. Consolidate.
-    cognates_by_form: t.MutableMapping[
-        types.Form_ID, t.Set[types.Cognateset_ID]
-    ] = t.DefaultDict(set)
-    for judgement in cognatesets.values():
+    # Consolidate the cognate judgements by form.
+    cognates_by_form: t.MutableMapping[types.Form_ID, t.Set[types.Cognateset_ID]] = (
+        t.DefaultDict(set)
+    )
+    for judgement in judgements:
         cognates_by_form[judgement["form"]].add(judgement["code"])
     parameter_column = col_map.forms.parameterReference
 
@@ -202,42 +214,52 @@ def read_wordlist(
             if key.columnReference == [dataset["FormTable", "languageReference"].name]
         ]
         ref_col = langref_target.reference.columnReference[0]
-        data = {lang[ref_col]: t.DefaultDict(set) for lang in dataset["LanguageTable"]}
+        data = {
+            lang["id"]: t.DefaultDict(set)
+            for lang in util.read_columns(dataset, "LanguageTable", {"id": ref_col})
+        }
     else:
         data = t.DefaultDict(lambda: t.DefaultDict(set))
-    for row in dataset["FormTable"].iterdicts():
-        if not row[col_map.forms.form]:
+    columns = {
+        "id": col_map.forms.id,
+        "form": col_map.forms.form,
+        "language": col_map.forms.languageReference,
+        "parameter": parameter_column,
+        "reference": form_table_column,
+    }
+    for row in util.read_columns(dataset, "FormTable", columns):
+        if not row["form"]:
             # Transcription is empty, should not be a form. Skip, but maybe
             # warn if it was in a cognateset.
-            if cognates_by_form[row[form_table_column]]:
+            if cognates_by_form[row["reference"]]:
                 logger.warning(
                     "Form %s was given as empty (i.e. the source noted that the form is unknown), but it was judged to be in cognateset %s. I will ignore that cognate judgement.",
-                    row[col_map.forms.id],
-                    cognates_by_form[row[form_table_column]],
+                    row["id"],
+                    cognates_by_form[row["reference"]],
                 )
             continue
 
-        language = row[col_map.forms.languageReference]
-        if row[col_map.forms.form] == "-":
-            if cognates_by_form[row[form_table_column]]:
+        language = row["language"]
+        if row["form"] == "-":
+            if cognates_by_form[row["reference"]]:
                 logger.warning(
                     "Form %s was given as '-' (i.e. “concept is not available in language %s”), but it was judged to be in cognateset %s. I will ignore that cognate judgement.",
-                    row[col_map.forms.id],
+                    row["id"],
                     language,
-                    cognates_by_form[row[form_table_column]],
+                    cognates_by_form[row["reference"]],
                 )
-                cognates_by_form[row[form_table_column]] = set()
-            for parameter in all_parameters(row[parameter_column]):
+                cognates_by_form[row["reference"]] = set()
+            for parameter in all_parameters(row["parameter"]):
                 if data[language][parameter]:
                     logger.warning(
                         "Form %s claims concept %s is not available in language %s, but cognatesets %s are allocated to that concept in that language already.",
-                        row[col_map.forms.id],
+                        row["id"],
                         parameter,
-                        row[col_map.forms.languageReference],
+                        language,
                         data[language][parameter],
                     )
-        for parameter in all_parameters(row[parameter_column]):
-            data[language][parameter] |= cognates_by_form[row[form_table_column]]
+        for parameter in all_parameters(row["parameter"]):
+            data[language][parameter] |= cognates_by_form[row["reference"]]
     return data
 
 
@@ -353,6 +375,9 @@ def apply_heuristics(
         types.WorldSet[types.Parameter_ID], t.AbstractSet[types.Parameter_ID]
     ] = types.WorldSet(),
     logger: cli.logging.Logger = cli.logger,
+    form_concepts: t.Optional[
+        t.Mapping[types.Form_ID, t.Iterable[types.Parameter_ID]]
+    ] = None,
 ) -> t.Mapping[types.Cognateset_ID, t.Set[types.Parameter_ID]]:
     """Compute the relevant concepts for cognatesets, depending on the heuristic.
 
@@ -408,6 +433,18 @@ def apply_heuristics(
     ...     's1': {'c1', 'c2'}}
     True
 
+    The concepts of each form are read from the FormTable, unless an index
+    from form IDs to their concepts, like the one built by
+    `form_concept_index`, is passed as `form_concepts`. Pass a DatasetSnapshot
+    that is shared with the other steps of an export, such as
+    `read_wordlist`, so that the CognateTable is parsed only once.
+
+    >>> apply_heuristics(
+    ...     ds, heuristic=AbsenceHeuristic.HALFPRIMARYCONCEPTS,
+    ...     form_concepts={"f1": ["c1"], "f2": ["c3"]}) == {
+    ...     's1': {'c1', 'c3'}}
+    True
+
 
     NOTE: This function cannot guarantee that every concept has at least one
     relevant concept, there may be cognatesets without! A cognateset with 0
@@ -429,29 +466,43 @@ def apply_heuristics(
     ] = t.DefaultDict(set)
 
     if heuristic is AbsenceHeuristic.HALFPRIMARYCONCEPTS:
-        c_f = dataset["CognateTable", "formReference"].name
-        c_s = dataset["CognateTable", "cognatesetReference"].name
-        concepts = util.cache_table(
+        if form_concepts is None:
+            form_concepts = form_concept_index(dataset)
+        # Group the judgements by cognateset first, so that each form's
+        # concepts are merged into a cognateset only once.
+        forms_by_cognateset: t.DefaultDict[
+            types.Cognateset_ID, t.Set[types.Form_ID]
+        ] = t.DefaultDict(set)
+        for judgement in util.read_columns(
             dataset,
-            "FormTable",
-            {"concepts": dataset["FormTable", "parameterReference"].name},
-        )
-        for j in dataset["CognateTable"]:
-            form = concepts[j[c_f]]
-            for concept in util.ensure_list(form["concepts"]):
-                relevant_concepts[j[c_s]].add(concept)
+            "CognateTable",
+            {
+                "form": dataset["CognateTable", "formReference"].name,
+                "cognateset": dataset["CognateTable", "cognatesetReference"].name,
+            },
+        ):
+            forms_by_cognateset[judgement["cognateset"]].add(judgement["form"])
+        for cognateset, forms in forms_by_cognateset.items():
+            relevant_concepts[cognateset] = set().union(
+                *[form_concepts[form] for form in forms]
+            )
 
     elif heuristic is AbsenceHeuristic.CENTRALCONCEPT:
-        c_cognateset_concept = dataset["CognatesetTable", "parameterReference"].name
-        c_id = dataset["CognatesetTable", "id"].name
-        for c in dataset["CognatesetTable"]:
-            for concept in util.ensure_list(c[c_cognateset_concept]):
+        for c in util.read_columns(
+            dataset,
+            "CognatesetTable",
+            {
+                "id": dataset["CognatesetTable", "id"].name,
+                "concepts": dataset["CognatesetTable", "parameterReference"].name,
+            },
+        ):
+            for concept in util.ensure_list(c["concepts"]):
                 if concept not in primary_concepts:
                     logger.warning(
-                        f"The central concept {concept} of cognateset {c[c_id]} was not part of your list of primary concepts to be included in the coding, so the cognateset will be ignored."
+                        f"The central concept {concept} of cognateset {c['id']} was not part of your list of primary concepts to be included in the coding, so the cognateset will be ignored."
                     )
                 else:
-                    relevant_concepts[c[c_id]].add(concept)
+                    relevant_concepts[c["id"]].add(concept)
 
     else:
         raise TypeError(
@@ -461,6 +512,145 @@ def apply_heuristics(
     return relevant_concepts
 
 
+def form_concept_index(
+    dataset: types.Wordlist,
+) -> t.Dict[types.Form_ID, t.List[types.Parameter_ID]]:
+    """Map each form ID to the list of concepts of that form.
+
+    >>> ds = util.fs.new_wordlist(FormTable=[
+    ...     {"ID": "f1", "Parameter_ID": "c1", "Language_ID": "l1", "Form": "x"},
+    ...     {"ID": "f2", "Parameter_ID": "c2", "Language_ID": "l1", "Form": ""}])
+    >>> form_concept_index(ds)
+    {'f1': ['c1'], 'f2': ['c2']}
+
+    """
+    return {
+        form["id"]: util.ensure_list(form["concepts"])
+        for form in util.read_columns(
+            dataset,
+            "FormTable",
+            {
+                "id": dataset["FormTable", "id"].name,
+                "concepts": dataset["FormTable", "parameterReference"].name,
+            },
+        )
+    }
+
+
+def relevant_concept_incidence(
+    relevant_concepts: t.Mapping[types.Cognateset_ID, t.Iterable[types.Parameter_ID]],
+    roots: t.Sequence[types.Cognateset_ID],
+) -> t.Tuple[t.List[types.Parameter_ID], numpy.ndarray, numpy.ndarray]:
+    """Build the sparse incidence matrix of roots and their relevant concepts.
+
+    Return the sorted list of relevant concepts, and the incidence in
+    compressed sparse row form: The relevant concepts of `roots[i]` are the
+    concepts at `indices[indptr[i]:indptr[i + 1]]`.
+
+    >>> concepts, indptr, indices = relevant_concept_incidence(
+    ...     {"c1": ["m1"], "c2": ["m1", "m2"], "c3": []}, ["c1", "c2", "c3"])
+    >>> concepts
+    ['m1', 'm2']
+    >>> indptr.tolist(), indices.tolist()
+    ([0, 1, 3, 3], [0, 0, 1])
+
+    """
+    relevant = [list(relevant_concepts[root]) for root in roots]
+    concepts = sorted({concept for root in relevant for concept in root})
+    concept_index = {concept: c for c, concept in enumerate(concepts)}
+    indptr = numpy.zeros(len(roots) + 1, dtype=numpy.int64)
+    indptr[1:] = numpy.cumsum([len(root) for root in relevant])
+    indices = numpy.array(
+        [concept_index[concept] for root in relevant for concept in root],
+        dtype=numpy.int64,
+    )
+    return concepts, indptr, indices
+
+
+def half_attested(
+    attestation: numpy.ndarray,
+    n_concepts: int,
+    indptr: numpy.ndarray,
+    indices: numpy.ndarray,
+    block_size: int = 256,
+) -> numpy.ndarray:
+    """Check for each language and root whether half its concepts are attested.
+
+    `attestation` is the language × concept attestation matrix with its bits
+    packed along the concepts (see `numpy.packbits`), and `indptr` and
+    `indices` give the root → relevant concept incidence as returned by
+    `relevant_concept_incidence`. The number of attested relevant concepts of
+    each root is the sparse product of the two, which is computed as the
+    difference of cumulative sums over the gathered concept columns, for
+    `block_size` languages at a time.
+
+    A root without relevant concepts counts as half attested, because 0 is at
+    least half of 0.
+
+    >>> attestation = numpy.packbits([[1, 0], [0, 0]], axis=1)
+    >>> half_attested(attestation, 2, numpy.array([0, 1, 3, 3]), numpy.array([0, 0, 1]))
+    array([[ True,  True,  True],
+           [False, False,  True]])
+
+    """
+    n_relevant = numpy.diff(indptr)
+    result = numpy.empty((attestation.shape[0], len(indptr) - 1), dtype=bool)
+    for start in range(0, attestation.shape[0], block_size):
+        attested = numpy.unpackbits(
+            attestation[start : start + block_size], axis=1, count=n_concepts
+        )
+        counts = numpy.zeros((attested.shape[0], len(indices) + 1), dtype=numpy.int32)
+        numpy.cumsum(attested[:, indices], axis=1, out=counts[:, 1:])
+        filled = counts[:, indptr[1:]] - counts[:, indptr[:-1]]
+        result[start : start + block_size] = 2 * filled >= n_relevant
+    return result
+
+
+def root_presence_absence(
+    dataset: t.Mapping[
+        types.Language_ID, t.Mapping[types.Parameter_ID, t.Set[types.Cognateset_ID]]
+    ],
+    relevant_concepts: t.Mapping[types.Cognateset_ID, t.Iterable[types.Parameter_ID]],
+    logger: cli.logging.Logger = cli.logger,
+) -> t.Tuple[t.List[types.Cognateset_ID], numpy.ndarray, numpy.ndarray]:
+    """Decide for each language and root whether it is present or absent.
+
+    Return the sorted roots, and two boolean language × root matrices: which
+    roots are attested in each language, and which are considered absent by
+    the heuristic described in `root_presence_code`. Roots that are neither
+    are unknown.
+
+    """
+    roots = sorted(relevant_concepts)
+    root_index = {root: r for r, root in enumerate(roots)}
+    concepts, indptr, indices = relevant_concept_incidence(relevant_concepts, roots)
+    concept_index = {concept: c for c, concept in enumerate(concepts)}
+
+    present = numpy.zeros((len(dataset), len(roots)), dtype=bool)
+    attestation = numpy.zeros(
+        (len(dataset), (len(concepts) + 7) // 8), dtype=numpy.uint8
+    )
+    for row, (language, lexicon) in enumerate(dataset.items()):
+        attested = numpy.zeros(len(concepts), dtype=bool)
+        for concept, cognatesets in lexicon.items():
+            if not cognatesets:
+                logger.warning(
+                    f"The root presence coder script got a language ({language}) with an improper lexicon: There is a form associated with Concept {concept}, but no cognate sets are associated with it."
+                )
+                continue
+            c = concept_index.get(concept)
+            if c is not None:
+                attested[c] = True
+            for cognateset in cognatesets:
+                r = root_index.get(cognateset)
+                if r is not None:
+                    present[row, r] = True
+        attestation[row] = numpy.packbits(attested)
+
+    absent = ~present & half_attested(attestation, len(concepts), indptr, indices)
+    return roots, present, absent
+
+
 def root_presence_code(
     dataset: t.Mapping[
         types.Language_ID, t.Mapping[types.Parameter_ID, t.Set[types.Cognateset_ID]]
@@ -516,41 +706,16 @@ def root_presence_code(
     [('0', '0', '1', '?'), ('0', '1', '1', '1')]
 
     """
-    all_roots: t.Set[types.Cognateset_ID] = set(relevant_concepts)
-    language_roots: t.MutableMapping[
-        types.Language_ID, t.Set[types.Cognateset_ID]
-    ] = t.DefaultDict(set)
-    for language, lexicon in dataset.items():
-        for concept, cognatesets in lexicon.items():
-            if not cognatesets:
-                logger.warning(
-                    f"The root presence coder script got a language ({language}) with an improper lexicon: There is a form associated with Concept {concept}, but no cognate sets are associated with it."
-                )
-            for cognateset in cognatesets:
-                language_roots[language].add(cognateset)
-
-    all_roots_sorted: t.Sequence[types.Cognateset_ID] = sorted(all_roots)
+    all_roots, present, absent = root_presence_absence(
+        dataset, relevant_concepts, logger=logger
+    )
+    symbols = numpy.array(["?", "0", "1"])
+    codes = numpy.where(present, 2, absent.astype(numpy.uint8))
 
     alignment = {}
-    roots = {}
-    for language, lexicon in dataset.items():
-        alignment[language] = list(ascertainment)
-        for root in all_roots_sorted:
-            roots[root] = len(alignment[language])
-            if root in language_roots[language]:
-                alignment[language].append("1")
-            else:
-                n_concepts = 0
-                n_filled_concepts = 0
-                for concept in relevant_concepts[root]:
-                    n_concepts += 1
-                    if lexicon.get(concept):
-                        n_filled_concepts += 1
-                if 2 * n_filled_concepts >= n_concepts:
-                    alignment[language].append("0")
-                else:
-                    alignment[language].append("?")
-
+    for language, row in zip(dataset, codes):
+        alignment[language] = list(ascertainment) + symbols[row].tolist()
+    roots = {root: r for r, root in enumerate(all_roots, len(ascertainment))}
     return alignment, roots
 
 
@@ -589,67 +754,729 @@ def multistate_code(
     [2, 2]
 
     """
-    roots: t.Dict[types.Parameter_ID, t.Set[types.Cognateset_ID]] = t.DefaultDict(set)
+    state_of = multistate_states(dataset)
+    states: t.List[int] = [len(roots) for roots in state_of.values()]
+
+    alignment: t.MutableMapping[types.Language_ID, t.List[t.Set[int]]] = t.DefaultDict(
+        list
+    )
     for language, lexicon in dataset.items():
+        for concept, concept_states in state_of.items():
+            alignment[language].append(
+                {concept_states[entry] for entry in lexicon.get(concept, ())}
+            )
+    return alignment, states
+
+
+def multistate_states(
+    dataset: t.Mapping[
+        types.Language_ID, t.Mapping[types.Parameter_ID, t.Set[types.Cognateset_ID]]
+    ],
+) -> t.Dict[types.Parameter_ID, t.Dict[types.Cognateset_ID, int]]:
+    """Number the roots of each concept, as states of a multistate character.
+
+    Concepts are sorted, and each concept maps its roots, in sorted order, to
+    consecutive states.
+
+    >>> multistate_states(
+    ...     {"l1": {"m2": {"c1"}},
+    ...      "l2": {"m1": {"c2"}, "m2": {"c3", "c1"}}})
+    {'m1': {'c2': 0}, 'm2': {'c1': 0, 'c3': 1}}
+
+    """
+    roots: t.Dict[types.Parameter_ID, t.Set[types.Cognateset_ID]] = t.DefaultDict(set)
+    for lexicon in dataset.values():
         for concept, cognatesets in lexicon.items():
             roots[concept].update(cognatesets)
-    sorted_roots: t.Mapping[types.Parameter_ID, t.Sequence[types.Cognateset_ID]] = {
-        concept: sorted(cognatesets) for concept, cognatesets in sorted(roots.items())
+    return {
+        concept: {root: s for s, root in enumerate(sorted(roots[concept]))}
+        for concept in sorted(roots)
     }
 
-    states: t.List[int] = [len(roots) for _, roots in sorted_roots.items()]
 
-    alignment: t.MutableMapping[types.Language_ID, t.List[t.Set[int]]] = t.DefaultDict(
-        list
-    )
-    for language, lexicon in dataset.items():
-        for concept, possible_roots in sorted_roots.items():
-            entries = lexicon.get(concept)
-            alignment[language].append(set())
-            if entries:
+def bitmask_states(mask: int) -> t.List[int]:
+    """List the states set in a bitmask of states, in increasing order.
+
+    >>> bitmask_states(0b10110)
+    [1, 2, 4]
+
+    """
+    states = []
+    while mask:
+        lowest = mask & -mask
+        states.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return states
+
+
+class CharacterMatrix:
+    """A coded character matrix, stored as integer arrays.
+
+    `states` has one row per language and one column per character, holding
+    the (smallest, for polymorphic cells) state of each cell. `missing` marks
+    the cells that are unknown, written as ‘?’. Cells of a multistate matrix
+    that have more than one state are rare, so their states are kept in the
+    sparse `polymorphisms` mapping from (row, column) to a bitmask of the
+    states, where bit `s` is set if the cell has state `s`.
+
+    `characters` names each column; `cognatesets` gives the root coded by a
+    binary column, or None for ascertainment columns and multistate
+    characters; and `partitions` lists the column indices of each concept,
+    where the coding procedure has such blocks. The first `n_ascertainment`
+    columns are constant columns for ascertainment correction.
+
+    >>> matrix = CharacterMatrix.root_meaning(
+    ...   {"l1": {"m1": {"c1"}},
+    ...    "l2": {"m1": {"c2"}, "m2": {"c1", "c3"}}})
+    >>> list(matrix.sequences())
+    ['010??', '00111']
+    >>> matrix.partitions
+    {'m1': [1, 2], 'm2': [3, 4]}
+    >>> list(matrix.select(matrix.cognateset_mask({"c1"})).sequences())
+    ['01?', '001']
+
+    """
+
+    def __init__(
+        self,
+        languages: t.Sequence[types.Language_ID],
+        states: numpy.ndarray,
+        missing: numpy.ndarray,
+        characters: t.Sequence[str],
+        cognatesets: t.Sequence[t.Optional[types.Cognateset_ID]],
+        datatype: Literal["binary", "multistate"] = "binary",
+        partitions: t.Optional[t.Mapping[str, t.Sequence[int]]] = None,
+        polymorphisms: t.Optional[t.Mapping[t.Tuple[int, int], int]] = None,
+        n_ascertainment: int = 0,
+    ):
+        self.languages = list(languages)
+        self.states = states
+        self.missing = missing
+        self.characters = list(characters)
+        self.cognatesets = list(cognatesets)
+        self.datatype = datatype
+        self.partitions = {
+            name: list(indices) for name, indices in (partitions or {}).items()
+        }
+        self.polymorphisms = dict(polymorphisms or {})
+        self.n_ascertainment = n_ascertainment
+
+    @property
+    def n_characters(self) -> int:
+        return self.states.shape[1]
+
+    @property
+    def n_symbols(self) -> int:
+        if self.datatype == "binary":
+            return 2
+        max_code = max(
+            [int(self.states[~self.missing].max(initial=0))]
+            + [mask.bit_length() - 1 for mask in self.polymorphisms.values()]
+        )
+        return max_code + 1
+
+    @staticmethod
+    def _ascertainment(
+        n_languages: int, ascertainment: t.Sequence[Literal["0", "1", "?"]]
+    ) -> t.Tuple[numpy.ndarray, numpy.ndarray]:
+        row = numpy.array([s == "1" for s in ascertainment], dtype=numpy.uint8)
+        gaps = numpy.array([s == "?" for s in ascertainment], dtype=bool)
+        return (
+            numpy.tile(row, (n_languages, 1)),
+            numpy.tile(gaps, (n_languages, 1)),
+        )
+
+    @classmethod
+    def root_meaning(
+        cls,
+        dataset: t.Mapping[
+            types.Language_ID,
+            t.Mapping[types.Parameter_ID, t.Set[types.Cognateset_ID]],
+        ],
+        core_concepts: t.Set[types.Parameter_ID] = types.WorldSet(),
+        ascertainment: t.Sequence[Literal["0", "1", "?"]] = ["0"],
+    ) -> "CharacterMatrix":
+        """Code the dataset like `root_meaning_code`, but into arrays."""
+        roots: t.Dict[types.Parameter_ID, t.Set[types.Cognateset_ID]] = {}
+        for lexicon in dataset.values():
+            for concept, cognatesets in lexicon.items():
+                if core_concepts is None or concept in core_concepts:
+                    roots.setdefault(concept, set()).update(cognatesets)
+
+        concepts = sorted(roots)
+        concept_index = {concept: c for c, concept in enumerate(concepts)}
+        columns: t.Dict[t.Tuple[types.Parameter_ID, types.Cognateset_ID], int] = {}
+        characters = ["ascertainment" for _ in ascertainment]
+        cognatesets: t.List[t.Optional[types.Cognateset_ID]] = [
+            None for _ in ascertainment
+        ]
+        column_concept: t.List[int] = []
+        partitions: t.Dict[str, t.List[int]] = {}
+        for concept in concepts:
+            for root in sorted(roots[concept]):
+                columns[concept, root] = len(characters)
+                partitions.setdefault(concept, []).append(len(characters))
+                characters.append(f"{concept}:{root}")
+                cognatesets.append(root)
+                column_concept.append(concept_index[concept])
+
+        languages = list(dataset)
+        attested = numpy.zeros((len(languages), len(concepts)), dtype=bool)
+        rows: t.List[int] = []
+        cols: t.List[int] = []
+        for r, lexicon in enumerate(dataset.values()):
+            for concept, entries in lexicon.items():
+                c = concept_index.get(concept)
+                if c is None:
+                    continue
+                attested[r, c] = True
                 for entry in entries:
-                    state = possible_roots.index(entry)
-                    alignment[language][-1].add(state)
-    return alignment, states
+                    rows.append(r)
+                    cols.append(columns[concept, entry])
 
+        prefix_states, prefix_missing = cls._ascertainment(
+            len(languages), ascertainment
+        )
+        states = numpy.zeros((len(languages), len(characters)), dtype=numpy.uint8)
+        states[:, : len(ascertainment)] = prefix_states
+        states[rows, cols] = 1
+        missing = numpy.zeros((len(languages), len(characters)), dtype=bool)
+        missing[:, : len(ascertainment)] = prefix_missing
+        missing[:, len(ascertainment) :] = ~attested[
+            :, numpy.array(column_concept, dtype=int)
+        ]
+        return cls(
+            languages,
+            states,
+            missing,
+            characters,
+            cognatesets,
+            partitions=partitions,
+            n_ascertainment=len(ascertainment),
+        )
 
-def raw_binary_alignment(alignment):
-    return ["".join(data) for language, data in alignment.items()]
+    @classmethod
+    def root_presence(
+        cls,
+        dataset: t.Mapping[
+            types.Language_ID,
+            t.Mapping[types.Parameter_ID, t.Set[types.Cognateset_ID]],
+        ],
+        relevant_concepts: t.Mapping[
+            types.Cognateset_ID, t.Iterable[types.Parameter_ID]
+        ],
+        ascertainment: t.Sequence[Literal["0", "1", "?"]] = ["0"],
+        logger: cli.logging.Logger = cli.logger,
+    ) -> "CharacterMatrix":
+        """Code the dataset like `root_presence_code`, but into arrays."""
+        languages = list(dataset)
+        roots, present, absent = root_presence_absence(
+            dataset, relevant_concepts, logger=logger
+        )
+        prefix_states, prefix_missing = cls._ascertainment(
+            len(languages), ascertainment
+        )
+        return cls(
+            languages,
+            numpy.hstack([prefix_states, present.astype(numpy.uint8)]),
+            numpy.hstack([prefix_missing, ~(present | absent)]),
+            ["ascertainment" for _ in ascertainment] + roots,
+            [None for _ in ascertainment] + roots,
+            n_ascertainment=len(ascertainment),
+        )
 
+    @classmethod
+    def multistate(
+        cls,
+        dataset: t.Mapping[
+            types.Language_ID,
+            t.Mapping[types.Parameter_ID, t.Set[types.Cognateset_ID]],
+        ],
+    ) -> "CharacterMatrix":
+        """Code the dataset like `multistate_code`, but into arrays."""
+        state_of = multistate_states(dataset)
+        concepts = list(state_of)
+        concept_index = {concept: c for c, concept in enumerate(concepts)}
+
+        languages = list(dataset)
+        dtype = numpy.min_scalar_type(
+            max([len(r) for r in state_of.values()], default=0)
+        )
+        states = numpy.zeros((len(languages), len(concepts)), dtype=dtype)
+        missing = numpy.ones((len(languages), len(concepts)), dtype=bool)
+        polymorphisms: t.Dict[t.Tuple[int, int], int] = {}
+        for row, lexicon in enumerate(dataset.values()):
+            for concept, entries in lexicon.items():
+                if not entries:
+                    continue
+                c = concept_index[concept]
+                concept_states = state_of[concept]
+                mask = 0
+                for entry in entries:
+                    mask |= 1 << concept_states[entry]
+                states[row, c] = (mask & -mask).bit_length() - 1
+                missing[row, c] = False
+                if mask & (mask - 1):
+                    polymorphisms[row, c] = mask
+        return cls(
+            languages,
+            states,
+            missing,
+            concepts,
+            [None for _ in concepts],
+            datatype="multistate",
+            polymorphisms=polymorphisms,
+        )
 
-def raw_multistate_alignment(alignment, long_sep: str = ","):
-    max_code = max(
-        c for seq in alignment.values() for character in seq for c in character
-    )
+    @classmethod
+    def concatenate(cls, matrices: t.Sequence["CharacterMatrix"]) -> "CharacterMatrix":
+        """Join matrices of the same languages side by side.
+
+        The ascertainment columns of the result are those of the first
+        matrix.
+
+        """
+        first = matrices[0]
+        offsets = numpy.cumsum([0] + [m.n_characters for m in matrices]).tolist()
+        partitions: t.Dict[str, t.List[int]] = {}
+        polymorphisms: t.Dict[t.Tuple[int, int], int] = {}
+        for matrix, offset in zip(matrices, offsets):
+            if matrix.languages != first.languages:
+                raise ValueError("Only matrices of the same languages can be joined.")
+            for name, indices in matrix.partitions.items():
+                partitions.setdefault(name, []).extend(offset + i for i in indices)
+            for (row, col), mask in matrix.polymorphisms.items():
+                polymorphisms[row, offset + col] = mask
+        return cls(
+            first.languages,
+            numpy.hstack([m.states for m in matrices]),
+            numpy.hstack([m.missing for m in matrices]),
+            [c for m in matrices for c in m.characters],
+            [c for m in matrices for c in m.cognatesets],
+            datatype=first.datatype,
+            partitions=partitions,
+            polymorphisms=polymorphisms,
+            n_ascertainment=first.n_ascertainment,
+        )
 
-    if max_code < 10:
+    def cognateset_mask(
+        self, cognatesets: t.Container[types.Cognateset_ID]
+    ) -> numpy.ndarray:
+        """Mark the columns to keep when restricting to some cognatesets.
 
-        def encode(s: t.Set[int]):
-            if not s:
-                return "?"
-            elif len(s) == 1:
-                return str(s.pop())
-            else:
-                return "({})".format("".join(str(c) for c in sorted(s)))
+        Columns that do not code a root, such as the ascertainment columns,
+        are always kept.
 
-        separator = ""
+        """
+        return numpy.array(
+            [c is None or c in cognatesets for c in self.cognatesets], dtype=bool
+        )
 
-    else:
+    def select(self, keep: numpy.ndarray) -> "CharacterMatrix":
+        """Restrict the matrix to the columns marked in a boolean mask.
+
+        Partitions are renumbered to the remaining columns, and partitions
+        without any remaining columns are dropped.
+
+        """
+        return self.subset(columns=numpy.flatnonzero(keep))
+
+    def subset(
+        self,
+        rows: t.Optional[t.Sequence[int]] = None,
+        columns: t.Optional[t.Sequence[int]] = None,
+        partitions: t.Optional[t.Mapping[str, t.Sequence[int]]] = None,
+    ) -> "CharacterMatrix":
+        """Take some of the rows and columns of the matrix, in the given order.
+
+        Rows and columns may be repeated. Unless new `partitions` are given,
+        the existing ones are renumbered to the new columns, with all copies
+        of a repeated column, and partitions without any remaining columns
+        are dropped.
+
+        >>> matrix = CharacterMatrix.root_meaning(
+        ...   {"l1": {"m1": {"c1"}},
+        ...    "l2": {"m1": {"c2"}, "m2": {"c1", "c3"}}})
+        >>> subset = matrix.subset(rows=[1], columns=[0, 3, 4, 3])
+        >>> list(subset.sequences()), subset.partitions
+        (['0111'], {'m2': [1, 2, 3]})
+
+        """
+        rows = numpy.arange(len(self.languages)) if rows is None else rows
+        columns = numpy.arange(self.n_characters) if columns is None else columns
+        rows = numpy.asarray(rows, dtype=int)
+        columns = numpy.asarray(columns, dtype=int)
+
+        new_rows: t.DefaultDict[int, t.List[int]] = t.DefaultDict(list)
+        for i, r in enumerate(rows.tolist()):
+            new_rows[r].append(i)
+        new_columns: t.DefaultDict[int, t.List[int]] = t.DefaultDict(list)
+        for j, c in enumerate(columns.tolist()):
+            new_columns[c].append(j)
+
+        if partitions is None:
+            partitions = {
+                name: sorted(j for i in indices for j in new_columns.get(i, []))
+                for name, indices in self.partitions.items()
+            }
+        n_ascertainment = 0
+        for c in columns.tolist():
+            if c >= self.n_ascertainment:
+                break
+            n_ascertainment += 1
+        return CharacterMatrix(
+            [self.languages[r] for r in rows],
+            self.states[numpy.ix_(rows, columns)],
+            self.missing[numpy.ix_(rows, columns)],
+            [self.characters[c] for c in columns],
+            [self.cognatesets[c] for c in columns],
+            datatype=self.datatype,
+            partitions={name: p for name, p in partitions.items() if p},
+            polymorphisms={
+                (i, j): mask
+                for (row, col), mask in self.polymorphisms.items()
+                for i in new_rows.get(row, [])
+                for j in new_columns.get(col, [])
+            },
+            n_ascertainment=n_ascertainment,
+        )
 
-        def encode(s: t.Set[int]):
-            if not s:
-                return "?"
-            elif len(s) == 1:
-                return str(s.pop())
+    def _polymorphisms_by_row(
+        self,
+    ) -> t.Mapping[int, t.List[t.Tuple[int, t.Sequence[int]]]]:
+        by_row: t.DefaultDict[int, t.List[t.Tuple[int, t.Sequence[int]]]] = (
+            t.DefaultDict(list)
+        )
+        for (row, col), mask in self.polymorphisms.items():
+            by_row[row].append((col, bitmask_states(mask)))
+        return by_row
+
+    def rows(self) -> t.Iterator[t.Tuple[types.Language_ID, t.List[str]]]:
+        """Encode the matrix, yielding each language with its coded cells.
+
+        Missing cells are given as ‘?’, and polymorphic cells list their
+        states in parentheses, separated by commas if there are more than 10
+        states.
+
+        """
+        n_symbols = self.n_symbols
+        symbols = numpy.array([str(i) for i in range(max(n_symbols, 2))] + ["?"])
+        inner = "," if n_symbols > 10 else ""
+        polymorphisms = self._polymorphisms_by_row()
+        for r, language in enumerate(self.languages):
+            codes = numpy.where(self.missing[r], len(symbols) - 1, self.states[r])
+            cells = symbols[codes].tolist()
+            for col, states in polymorphisms.get(r, ()):
+                cells[col] = "({})".format(inner.join(str(s) for s in states))
+            yield language, cells
+
+    def sequences(self, long_sep: str = ",") -> t.Iterator[str]:
+        """Encode the matrix as one string per language.
+
+        Characters are concatenated directly, unless the matrix has more than
+        10 symbols, in which case they are separated by `long_sep`.
+
+        """
+        if self.n_symbols > 10:
+            for _, cells in self.rows():
+                yield long_sep.join(cells)
+            return
+        # With single-digit symbols, each row can be encoded as bytes in one
+        # step, and only polymorphic cells need patching afterwards.
+        symbols = numpy.frombuffer(b"0123456789?", dtype=numpy.uint8)
+        polymorphisms = self._polymorphisms_by_row()
+        for r in range(len(self.languages)):
+            codes = numpy.where(self.missing[r], 10, self.states[r])
+            sequence = symbols[codes].tobytes().decode("ascii")
+            if r in polymorphisms:
+                cells = list(sequence)
+                for col, states in polymorphisms[r]:
+                    cells[col] = "({})".format("".join(str(s) for s in states))
+                sequence = "".join(cells)
+            yield sequence
+
+
+def concept_fingerprints(
+    dataset: t.Mapping[
+        types.Language_ID, t.Mapping[types.Parameter_ID, t.Set[types.Cognateset_ID]]
+    ],
+) -> t.Dict[types.Parameter_ID, str]:
+    """Hash, for each concept, which cognatesets each language has for it.
+
+    The coding of a concept block depends on nothing else, so a concept with
+    an unchanged fingerprint does not need to be coded again.
+
+    >>> fingerprints = concept_fingerprints(
+    ...   {"l1": {"m1": {"c1"}, "m2": {"c2", "c3"}}, "l2": {"m1": set()}})
+    >>> fingerprints == concept_fingerprints(
+    ...   {"l1": {"m2": {"c3", "c2"}, "m1": {"c1"}}, "l2": {"m1": set()}})
+    True
+    >>> fingerprints["m1"] == concept_fingerprints(
+    ...   {"l1": {"m1": {"c1"}}, "l2": {}})["m1"]
+    False
+
+    """
+    entries: t.DefaultDict[types.Parameter_ID, t.List] = t.DefaultDict(list)
+    for language, lexicon in dataset.items():
+        for concept, cognatesets in lexicon.items():
+            entries[concept].append([language, sorted(cognatesets)])
+    return {
+        concept: hashlib.sha256(json.dumps(e).encode("utf-8")).hexdigest()
+        for concept, e in entries.items()
+    }
+
+
+class IncrementalCoding:
+    """A coded matrix, with the per-concept fingerprints of the data it codes.
+
+    Root-meaning and multistate matrices consist of one independent block of
+    characters per concept. When the data changes, `update` codes only the
+    concepts whose fingerprint changed, and splices the new blocks into the
+    previous matrix. Everything is coded from scratch if the languages or
+    the coding procedure differ from the stored matrix.
+
+    >>> coding = IncrementalCoding.code(
+    ...   {"l1": {"m1": {"c1"}, "m2": {"c3"}},
+    ...    "l2": {"m1": {"c2"}, "m2": {"c1", "c3"}}},
+    ...   CodingProcedure.ROOTMEANING)
+    >>> coding.update(
+    ...   {"l1": {"m1": {"c1"}, "m2": {"c1"}},
+    ...    "l2": {"m1": {"c2"}, "m2": {"c1", "c3"}}})
+    ['m2']
+    >>> list(coding.matrix.sequences())
+    ['01010', '00111']
+
+    """
+
+    VERSION = 3
+
+    def __init__(
+        self,
+        coding: CodingProcedure,
+        matrix: CharacterMatrix,
+        fingerprints: t.Mapping[types.Parameter_ID, str],
+        blocks: t.Mapping[types.Parameter_ID, t.Sequence[int]],
+    ):
+        self.coding = coding
+        self.matrix = matrix
+        self.fingerprints = dict(fingerprints)
+        self.blocks = {concept: list(block) for concept, block in blocks.items()}
+
+    @staticmethod
+    def _code_blocks(
+        dataset: t.Mapping[
+            types.Language_ID,
+            t.Mapping[types.Parameter_ID, t.Set[types.Cognateset_ID]],
+        ],
+        coding: CodingProcedure,
+    ) -> t.Tuple[CharacterMatrix, t.Dict[types.Parameter_ID, t.List[int]]]:
+        concepts = {concept for lexicon in dataset.values() for concept in lexicon}
+        if coding == CodingProcedure.ROOTMEANING:
+            matrix = CharacterMatrix.root_meaning(dataset)
+            blocks = {
+                concept: matrix.partitions.get(concept, []) for concept in concepts
+            }
+        elif coding == CodingProcedure.MULTISTATE:
+            matrix = CharacterMatrix.multistate(dataset)
+            blocks = {concept: [c] for c, concept in enumerate(matrix.characters)}
+        else:
+            raise ValueError(
+                f"Coding procedure {coding} does not consist of independent concept blocks, so it cannot be coded incrementally."
+            )
+        return matrix, blocks
+
+    @classmethod
+    def code(
+        cls,
+        dataset: t.Mapping[
+            types.Language_ID,
+            t.Mapping[types.Parameter_ID, t.Set[types.Cognateset_ID]],
+        ],
+        coding: CodingProcedure,
+    ) -> "IncrementalCoding":
+        """Code a dataset from scratch."""
+        matrix, blocks = cls._code_blocks(dataset, coding)
+        return cls(coding, matrix, concept_fingerprints(dataset), blocks)
+
+    def update(
+        self,
+        dataset: t.Mapping[
+            types.Language_ID,
+            t.Mapping[types.Parameter_ID, t.Set[types.Cognateset_ID]],
+        ],
+        logger: cli.logging.Logger = cli.logger,
+    ) -> t.List[types.Parameter_ID]:
+        """Re-code the concepts that changed, and return them.
+
+        If the languages changed, code everything again.
+
+        """
+        fingerprints = concept_fingerprints(dataset)
+        if list(dataset) != self.matrix.languages:
+            logger.info("The languages changed, so I have to code all concepts again.")
+            self.matrix, self.blocks = self._code_blocks(dataset, self.coding)
+            self.fingerprints = fingerprints
+            return sorted(fingerprints)
+
+        changed = sorted(
+            concept
+            for concept, fingerprint in fingerprints.items()
+            if self.fingerprints.get(concept) != fingerprint
+        )
+        logger.info(
+            "Coding %d changed of %d concepts again.", len(changed), len(fingerprints)
+        )
+        changed_set = set(changed)
+        new, new_blocks = self._code_blocks(
+            {
+                language: {c: v for c, v in lexicon.items() if c in changed_set}
+                for language, lexicon in dataset.items()
+            },
+            self.coding,
+        )
+
+        # Take each block from the old or from the new matrix, which follows
+        # the old one in the combined matrix.
+        offset = self.matrix.n_characters
+        columns = list(range(self.matrix.n_ascertainment))
+        blocks: t.Dict[types.Parameter_ID, t.List[int]] = {}
+        for concept in sorted(fingerprints):
+            if concept in changed_set:
+                source = [offset + c for c in new_blocks[concept]]
             else:
-                return "({})".format(",".join(str(c) for c in sorted(s)))
+                source = self.blocks[concept]
+            blocks[concept] = list(range(len(columns), len(columns) + len(source)))
+            columns.extend(source)
+        self.matrix = CharacterMatrix.concatenate([self.matrix, new]).subset(
+            columns=columns,
+            partitions=(
+                {concept: block for concept, block in blocks.items() if block}
+                if self.matrix.partitions or new.partitions
+                else {}
+            ),
+        )
+        self.blocks = blocks
+        self.fingerprints = fingerprints
+        return changed
+
+    @classmethod
+    def load(
+        cls,
+        path: Path,
+        coding: CodingProcedure,
+        logger: cli.logging.Logger = cli.logger,
+    ) -> t.Optional["IncrementalCoding"]:
+        """Load a stored coding, if there is a usable one at path.
+
+        The matrix is rebuilt from the plain arrays and lists that `store`
+        wrote, so stored codings do not depend on where the classes live.
+
+        """
+        try:
+            with numpy.load(path, allow_pickle=False) as stored:
+                content = json.loads(str(stored["metadata"]))
+                if (
+                    content["version"] != cls.VERSION
+                    or content["coding"] != coding.name
+                ):
+                    return None
+                matrix = CharacterMatrix(
+                    content["languages"],
+                    stored["states"],
+                    stored["missing"],
+                    content["characters"],
+                    content["cognatesets"],
+                    datatype=content["datatype"],
+                    partitions=content["partitions"],
+                    polymorphisms={
+                        (row, column): mask
+                        for row, column, mask in content["polymorphisms"]
+                    },
+                    n_ascertainment=content["n_ascertainment"],
+                )
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.debug("Could not use the stored coding in %s: %s", path, e)
+            return None
+        logger.debug("Loading previous coding from %s", path)
+        return cls(coding, matrix, content["fingerprints"], content["blocks"])
+
+    def store(self, path: Path, logger: cli.logging.Logger = cli.logger) -> None:
+        """Store the coding at path, as arrays and JSON metadata."""
+        matrix = self.matrix
+        metadata = {
+            "version": self.VERSION,
+            "coding": self.coding.name,
+            "languages": matrix.languages,
+            "characters": matrix.characters,
+            "cognatesets": matrix.cognatesets,
+            "datatype": matrix.datatype,
+            "partitions": matrix.partitions,
+            "polymorphisms": [
+                [row, column, mask]
+                for (row, column), mask in matrix.polymorphisms.items()
+            ],
+            "n_ascertainment": matrix.n_ascertainment,
+            "fingerprints": self.fingerprints,
+            "blocks": self.blocks,
+        }
+        try:
+            util.snapshot.make_cache_directory(path.parent)
+            handle, temporary = tempfile.mkstemp(dir=path.parent)
+            with os.fdopen(handle, "wb") as stored:
+                numpy.savez(
+                    stored,
+                    states=matrix.states,
+                    missing=matrix.missing,
+                    metadata=numpy.array(json.dumps(metadata, default=int)),
+                )
+            os.replace(temporary, path)
+        except OSError as e:
+            logger.warning("Could not store the coded matrix in %s: %s", path, e)
 
-        separator = long_sep
 
-    return [
-        separator.join([encode(c) for c in sequence])
-        for language, sequence in alignment.items()
-    ], max_code + 1
+def raw_binary_alignment(alignment):
+    return ["".join(data) for language, data in alignment.items()]
+
+
+def raw_multistate_alignment(alignment, long_sep: str = ","):
+    """Encode a multistate alignment as one string per language.
+
+    Whether cells need separators is only known once all states have been
+    seen, so the cells are sorted into their states while looking for the
+    largest state, and then joined. The sets in `alignment` are not changed.
+
+    >>> alignment = {"l1": [{0}, set(), {1, 0}], "l2": [{1}, {0}, {0}]}
+    >>> raw_multistate_alignment(alignment)
+    (['0?(01)', '100'], 2)
+    >>> alignment["l1"]
+    [{0}, set(), {0, 1}]
+
+    """
+    max_code = -1
+    rows: t.List[t.List[t.Sequence[int]]] = []
+    for sequence in alignment.values():
+        row = []
+        for character in sequence:
+            states = sorted(character)
+            if states and states[-1] > max_code:
+                max_code = states[-1]
+            row.append(states)
+        rows.append(row)
+
+    inner, separator = ("", "") if max_code < 10 else (",", long_sep)
+    symbols = [str(c) for c in range(max_code + 1)]
+
+    def encode(states: t.Sequence[int]) -> str:
+        if not states:
+            return "?"
+        elif len(states) == 1:
+            return symbols[states[0]]
+        else:
+            return "({})".format(inner.join(symbols[c] for c in states))
+
+    return [separator.join([encode(c) for c in row]) for row in rows], max_code + 1
 
 
 def format_nexus(
@@ -691,53 +1518,16 @@ def format_nexus(
     End;
 
     """
-    max_length = max([len(str(lang)) for lang in languages])
-
-    sequences = [
-        "{} {} {}".format(lang, " " * (max_length - len(str(lang))), seq)
-        for lang, seq in zip(languages, sequences)
-    ]
-
-    if partitions:
-        charsetstrings = [
-            "CharSet {id}={indices};".format(
-                id=id, indices=" ".join(str(k) for k in indices)
-            )
-            for id, indices in partitions.items()
-        ]
-        charsets = """Begin Sets;
-  {:}
-End;""".format(
-            "\n  ".join(charsetstrings)
-        )
-    else:
-        charsets = ""
-    return """#NEXUS
-Begin Taxa;
-  Dimensions ntax={len_taxa:d};
-  TaxLabels {taxa:s};
-End;
-
-Begin Characters;
-  Dimensions NChar={len_alignment:d};
-  Format Datatype={datatype} Missing=? Gap=- Symbols="{symbols:s}" {tokens:s};
-  Matrix
-    [The first column is constant zero, for programs with ascertainment correction]
-    {sequences:s}
-  ;
-End;
-
-{charsets}
-""".format(
-        len_taxa=len(languages),
-        taxa=" ".join([str(language) for language in languages]),
-        charsets=charsets,
-        len_alignment=n_characters,
-        datatype="Restriction" if datatype == "binary" else "Standard",
-        symbols=" ".join(str(i) for i in range(n_symbols)),
-        tokens="Tokens" if n_symbols >= 10 else "",
-        sequences="\n    ".join(sequences),
+    output = io.StringIO()
+    NexusWriter(output).write_sequences(
+        languages,
+        sequences,
+        n_symbols=n_symbols,
+        n_characters=n_characters,
+        datatype=datatype,
+        partitions=partitions,
     )
+    return output.getvalue()
 
 
 def fill_beast(data_object: ET.Element, languages, sequences) -> None:
@@ -774,7 +1564,7 @@ def fill_beast(data_object: ET.Element, languages, sequences) -> None:
     ET.SubElement(plate, "taxon", id="$(language)", spec="Taxon")
 
 
-def compress_indices(indices: t.Set[int]) -> t.Iterator[slice]:
+def compress_indices(indices: t.Iterable[int]) -> t.Iterator[slice]:
     """Turn groups of largely contiguous indices into slices.
 
     >>> list(compress_indices(set(range(10))))
@@ -783,39 +1573,587 @@ def compress_indices(indices: t.Set[int]) -> t.Iterator[slice]:
     >>> list(compress_indices([1, 2, 5, 6, 7]))
     [slice(1, 3, None), slice(5, 8, None)]
     """
-    if not indices:
-        return
-    minimum = min(indices)
-    maximum = minimum
-    while maximum in indices:
-        indices.remove(maximum)
-        maximum += 1
-    yield slice(minimum, maximum)
-    for sl in compress_indices(indices):
-        yield sl
+    start = stop = None
+    for i in sorted(set(indices)):
+        if i != stop:
+            if start is not None:
+                yield slice(start, stop)
+            start = i
+        stop = i + 1
+    if start is not None:
+        yield slice(start, stop)
+
+
+def partition_filters(
+    partitions: t.Mapping[str, t.Iterable[int]],
+) -> t.Dict[str, t.List[t.Tuple[int, int]]]:
+    """Compress the indices of all partitions into ranges, in one sorted pass.
+
+    Return, for each partition, the list of (start, stop) ranges of its
+    indices, in order.
+
+    >>> partition_filters({"a": [1, 2, 5], "b": [7, 3, 4, 6, 4], "c": []})
+    {'a': [(1, 3), (5, 6)], 'b': [(3, 5), (6, 8)], 'c': []}
+    >>> partition_filters({})
+    {}
+
+    """
+    names = list(partitions)
+    indices_by_partition = [list(partitions[name]) for name in names]
+    if not any(indices_by_partition):
+        return {name: [] for name in names}
+    labels = numpy.repeat(
+        numpy.arange(len(names)), [len(i) for i in indices_by_partition]
+    )
+    indices = numpy.fromiter(
+        (i for partition in indices_by_partition for i in partition),
+        dtype=int,
+        count=len(labels),
+    )
+    order = numpy.lexsort((indices, labels))
+    labels, indices = labels[order], indices[order]
+    # Drop repeated indices, then start a new range wherever the partition
+    # changes or the indices jump.
+    unique = numpy.ones(len(indices), dtype=bool)
+    unique[1:] = (labels[1:] != labels[:-1]) | (indices[1:] != indices[:-1])
+    labels, indices = labels[unique], indices[unique]
+    starts = numpy.ones(len(indices), dtype=bool)
+    starts[1:] = (labels[1:] != labels[:-1]) | (indices[1:] != indices[:-1] + 1)
+    first = numpy.flatnonzero(starts)
+    last = numpy.append(first[1:], len(indices)) - 1
+
+    ranges: t.Dict[str, t.List[t.Tuple[int, int]]] = {name: [] for name in names}
+    for label, start, stop in zip(
+        labels[first].tolist(), indices[first].tolist(), (indices[last] + 1).tolist()
+    ):
+        ranges[names[label]].append((start, stop))
+    return ranges
+
+
+def filtered_alignment(
+    name: str, ranges: t.Iterable[t.Tuple[int, int]], data_id: str = "vocabulary"
+) -> ET._Element:
+    """Create the BEAST FilteredAlignment for a partition of an alignment.
+
+    BEAST counts characters from 1, and the filter always includes the first
+    (ascertainment) character.
+
+    """
+    return ET.Element(
+        "data",
+        {
+            "id": "concept:" + name,
+            "spec": "FilteredAlignment",
+            "filter": "1,"
+            + ",".join("{:d}-{:d}".format(start + 1, stop) for start, stop in ranges),
+            "data": "@" + data_id,
+            "ascertained": "true",
+            "excludefrom": "0",
+            "excludeto": "1",
+        },
+    )
 
 
 def add_partitions(data_object: ET.Element, partitions):
+    """Add a FilteredAlignment for each partition after the data_object.
+
+    >>> xml = ET.fromstring('<beast><data id="vocabulary"/></beast>')
+    >>> add_partitions(xml.find("data"), {"one": [1, 2, 5], "two": [3, 4]})
+    >>> for data in xml.iterfind("data[@spec='FilteredAlignment']"):
+    ...     print(data.get("id"), data.get("filter"))
+    concept:one 1,2-3,6-6
+    concept:two 1,4-5
+
+    """
     previous_alignment = data_object
-    for name, indices in partitions.items():
-        indices_set = compress_indices(set(indices))
-        indices_string = ",".join(
-            "{:d}-{:d}".format(s.start + 1, s.stop) for s in indices_set
+    for name, ranges in partition_filters(partitions).items():
+        alignment = filtered_alignment(name, ranges, data_object.attrib["id"])
+        previous_alignment.addnext(alignment)
+        previous_alignment = alignment
+
+
+class MatrixWriter(abc.ABC):
+    """Write a character matrix to an open file, one language at a time.
+
+    Writers hold only one encoded row in memory at any time, so apart from the
+    matrix itself, their memory use is bounded by the longest row, not by the
+    size of the output.
+
+    """
+
+    def __init__(self, file: t.IO):
+        self.file = file
+
+    @abc.abstractmethod
+    def write(self, matrix: CharacterMatrix) -> None:
+        "Write the matrix to the file"
+
+
+class RawWriter(MatrixWriter):
+    """Write one language name per row, followed by its character states."""
+
+    def write(self, matrix: CharacterMatrix) -> None:
+        max_length = max([len(str(lang)) for lang in matrix.languages])
+        for language, sequence in zip(matrix.languages, matrix.sequences()):
+            print(
+                language,
+                " " * (max_length - len(language)),
+                sequence,
+                file=self.file,
+            )
+
+
+class CsvWriter(MatrixWriter):
+    """Write a CSV table with languages in rows and characters in columns."""
+
+    def write(self, matrix: CharacterMatrix) -> None:
+        writer = csv.writer(self.file)
+        writer.writerow(["Language_ID"] + matrix.characters)
+        for language, cells in matrix.rows():
+            writer.writerow([language] + cells)
+
+
+class NexusWriter(MatrixWriter):
+    """Write a Nexus file with Taxa, Characters, and Sets blocks."""
+
+    def write(self, matrix: CharacterMatrix) -> None:
+        self.write_sequences(
+            matrix.languages,
+            matrix.sequences(),
+            n_symbols=matrix.n_symbols,
+            n_characters=matrix.n_characters,
+            datatype=matrix.datatype,
+            # Nexus counts characters from 1.
+            partitions={
+                concept: [i + 1 for i in indices]
+                for concept, indices in matrix.partitions.items()
+            },
         )
-        previous_alignment.addnext(
-            data_object.makeelement(
-                "data",
-                {
-                    "id": "concept:" + name,
-                    "spec": "FilteredAlignment",
-                    "filter": "1," + indices_string,
-                    "data": "@" + data_object.attrib["id"],
-                    "ascertained": "true",
-                    "excludefrom": "0",
-                    "excludeto": "1",
-                },
+
+    def write_sequences(
+        self,
+        languages: t.Iterable[str],
+        sequences: t.Iterable[str],
+        n_symbols: int,
+        n_characters: int,
+        datatype: str,
+        partitions: t.Optional[t.Mapping[str, t.Iterable[int]]] = None,
+    ) -> None:
+        """Write already encoded sequences, without any validity checks."""
+        languages = list(languages)
+        max_length = max([len(str(lang)) for lang in languages])
+        self.file.write(
+            """#NEXUS
+Begin Taxa;
+  Dimensions ntax={len_taxa:d};
+  TaxLabels {taxa:s};
+End;
+
+Begin Characters;
+  Dimensions NChar={len_alignment:d};
+  Format Datatype={datatype} Missing=? Gap=- Symbols="{symbols:s}" {tokens:s};
+  Matrix
+    [The first column is constant zero, for programs with ascertainment correction]""".format(
+                len_taxa=len(languages),
+                taxa=" ".join([str(language) for language in languages]),
+                len_alignment=n_characters,
+                datatype="Restriction" if datatype == "binary" else "Standard",
+                symbols=" ".join(str(i) for i in range(n_symbols)),
+                tokens="Tokens" if n_symbols >= 10 else "",
             )
         )
+        for lang, seq in zip(languages, sequences):
+            self.file.write(
+                "\n    {} {} {}".format(lang, " " * (max_length - len(str(lang))), seq)
+            )
+        self.file.write("\n  ;\nEnd;\n\n")
+        if partitions:
+            self.file.write("Begin Sets;")
+            for id, indices in partitions.items():
+                self.file.write(
+                    "\n  CharSet {id}={indices};".format(
+                        id=id, indices=" ".join(str(k) for k in indices)
+                    )
+                )
+            self.file.write("\nEnd;")
+        self.file.write("\n")
+
+
+class BeastWriter(MatrixWriter):
+    """Write a BEAST XML file, streaming the alignment into its first <data>.
+
+    The output is based on a template tree, by default just
+    ``<beast><data /></beast>``. Its first `data` element is replaced by the
+    alignment, followed by one `FilteredAlignment` for each partition.
+    `{languages}` and `{partitions}` plate ranges in the template are filled
+    in. The template is serialized as it is, so it keeps its own layout.
+
+    The file must be opened in binary mode.
+
+    >>> import io
+    >>> output = io.BytesIO()
+    >>> BeastWriter(output).write_sequences(
+    ...     ["L1", "L2"], ["0110", "0011"], {"c1": [1, 2], "c2": [3]})
+    >>> print(output.getvalue().decode("utf-8"))
+    <?xml version='1.0' encoding='utf-8'?>
+    <beast>
+      <data id="vocabulary" dataType="integer" spec="Alignment">
+    <sequence id="language_data_vocabulary:L1" taxon="L1" value="0110"/>
+    <sequence id="language_data_vocabulary:L2" taxon="L2" value="0011"/>
+    <taxonset id="taxa" spec="TaxonSet"><plate var="language" range="L1,L2"><taxon id="$(language)" spec="Taxon"/></plate></taxonset></data>
+      <data id="concept:c1" spec="FilteredAlignment" filter="1,2-3" data="@vocabulary" ascertained="true" excludefrom="0" excludeto="1"/>
+      <data id="concept:c2" spec="FilteredAlignment" filter="1,4-4" data="@vocabulary" ascertained="true" excludefrom="0" excludeto="1"/>
+    </beast>
+    <BLANKLINE>
+
+    """
+
+    def __init__(
+        self,
+        file: t.BinaryIO,
+        template: t.Optional[ET._Element] = None,
+        encoding: str = "utf-8",
+    ):
+        super().__init__(file)
+        if template is None:
+            template = ET.fromstring("<beast>\n  <data />\n</beast>")
+        self.template = template
+        self.encoding = encoding
+
+    def write(self, matrix: CharacterMatrix) -> None:
+        self.write_sequences(matrix.languages, matrix.sequences(), matrix.partitions)
+
+    def write_sequences(
+        self,
+        languages: t.Iterable[str],
+        sequences: t.Iterable[str],
+        partitions: t.Optional[t.Mapping[str, t.Iterable[int]]] = None,
+    ) -> None:
+        """Write already encoded sequences, with partitions indexed from 0."""
+        languages = list(languages)
+        root = self.template
+        data_object = next(root.iter("data"))
+        if partitions:
+            for plate in root.iterfind(".//plate[@range='{partitions}']"):
+                plate.set("range", ",".join(partitions))
+        for plate in root.iterfind(".//plate[@range='{languages}']"):
+            plate.set("range", ",".join(languages))
+
+        # Incremental writers accept no text outside the root element, so
+        # write the prolog and epilog directly.
+        newline = "\n".encode(self.encoding)
+        self.file.write(
+            f"<?xml version='1.0' encoding='{self.encoding}'?>".encode(self.encoding)
+            + newline
+        )
+        for sibling in reversed(list(root.itersiblings(preceding=True))):
+            self.file.write(
+                ET.tostring(sibling, encoding=self.encoding, with_tail=False) + newline
+            )
+        with ET.xmlfile(self.file, encoding=self.encoding) as xf:
+            self._write_element(
+                xf, root, data_object, languages, sequences, partitions or {}
+            )
+        self.file.write(newline)
+        for sibling in root.itersiblings():
+            self.file.write(
+                ET.tostring(sibling, encoding=self.encoding, with_tail=False) + newline
+            )
+
+    def _write_element(
+        self,
+        xf,
+        element: ET._Element,
+        data_object: ET._Element,
+        languages: t.List[str],
+        sequences: t.Iterable[str],
+        partitions: t.Mapping[str, t.Iterable[int]],
+    ) -> None:
+        if element is data_object:
+            self._write_alignment(xf, languages, sequences)
+            # Indent the partitions like the alignment itself.
+            previous = data_object.getprevious()
+            indentation = (
+                data_object.getparent().text if previous is None else previous.tail
+            )
+            if not indentation or indentation.strip():
+                indentation = "\n"
+            for name, ranges in partition_filters(partitions).items():
+                xf.write(indentation)
+                xf.write(filtered_alignment(name, ranges))
+        elif any(d is data_object for d in element.iterdescendants()):
+            with xf.element(element.tag, dict(element.attrib), nsmap=element.nsmap):
+                if element.text:
+                    xf.write(element.text)
+                for child in element:
+                    self._write_element(
+                        xf, child, data_object, languages, sequences, partitions
+                    )
+        else:
+            xf.write(element, with_tail=False)
+        if element.tail and element is not self.template:
+            xf.write(element.tail)
+
+    @staticmethod
+    def _write_alignment(
+        xf, languages: t.List[str], sequences: t.Iterable[str]
+    ) -> None:
+        with xf.element(
+            "data", {"id": "vocabulary", "dataType": "integer", "spec": "Alignment"}
+        ):
+            xf.write("\n")
+            for language, sequence in zip(languages, sequences):
+                xf.write(
+                    ET.Element(
+                        "sequence",
+                        id=f"language_data_vocabulary:{language:}",
+                        taxon=f"{language:}",
+                        value=f"{sequence:}",
+                    )
+                )
+                xf.write("\n")
+            taxa = ET.Element("taxonset", id="taxa", spec="TaxonSet")
+            plate = ET.SubElement(
+                taxa, "plate", var="language", range=",".join(languages)
+            )
+            ET.SubElement(plate, "taxon", id="$(language)", spec="Taxon")
+            xf.write(taxa)
+
+
+WRITERS: t.Mapping[str, t.Type[MatrixWriter]] = {
+    "raw": RawWriter,
+    "csv": CsvWriter,
+    "nexus": NexusWriter,
+    "beast": BeastWriter,
+}
+
+
+def write_matrix(
+    matrix: CharacterMatrix,
+    format: str,
+    output_file: t.Optional[Path] = None,
+    template: t.Optional[bytes] = None,
+) -> None:
+    """Write a matrix in one of the WRITERS formats to a file, or to stdout.
+
+    For the BEAST format, `template` is the XML document to place the
+    alignment into.
+
+    """
+    if format == "beast":
+        beast_template = None
+        encoding = "utf-8"
+        if template is not None:
+            beast_template = ET.fromstring(
+                template, parser=ET.XMLParser(resolve_entities=False)
+            )
+            encoding = beast_template.getroottree().docinfo.encoding
+        with (
+            contextlib.nullcontext(sys.stdout.buffer)
+            if output_file is None
+            else output_file.open("wb")
+        ) as output:
+            BeastWriter(output, beast_template, encoding).write(matrix)
+    else:
+        with (
+            contextlib.nullcontext(sys.stdout)
+            if output_file is None
+            else output_file.open(
+                "w", encoding="utf-8", newline="" if format == "csv" else None
+            )
+        ) as output:
+            WRITERS[format](output).write(matrix)
+
+
+class Resampling(enum.Enum):
+    BOOTSTRAP = 0
+    JACKKNIFELANGUAGES = 1
+    JACKKNIFECHARACTERS = 2
+
+
+def resample(
+    matrix: CharacterMatrix,
+    resampling: Resampling,
+    rng: numpy.random.Generator,
+    fraction: float = 0.5,
+) -> CharacterMatrix:
+    """Draw one replicate of a matrix.
+
+    BOOTSTRAP draws concepts with replacement, as many as there are, and
+    keeps the whole block of characters of each drawn concept, so a concept
+    drawn twice contributes two partitions. Matrices without partitions, such
+    as multistate matrices (where each character is a concept) or
+    root-presence matrices, are bootstrapped by character. JACKKNIFELANGUAGES
+    and JACKKNIFECHARACTERS drop the given fraction of languages or of
+    characters, respectively, without replacement. Ascertainment columns are
+    always kept.
+
+    >>> matrix = CharacterMatrix.root_meaning(
+    ...   {"l1": {"m1": {"c1"}, "m2": {"c3"}},
+    ...    "l2": {"m1": {"c2"}, "m2": {"c1", "c3"}}})
+    >>> replicate = resample(matrix, Resampling.BOOTSTRAP, numpy.random.default_rng(0))
+    >>> replicate.partitions
+    {'m2': [1, 2], 'm2.2': [3, 4]}
+    >>> list(replicate.sequences())
+    ['00101', '01111']
+
+    """
+    characters = numpy.arange(matrix.n_ascertainment, matrix.n_characters)
+    fixed = list(range(matrix.n_ascertainment))
+    if resampling == Resampling.BOOTSTRAP:
+        units = list(matrix.partitions.items()) or [
+            (matrix.characters[c], [c]) for c in characters.tolist()
+        ]
+        columns = fixed
+        partitions: t.Dict[str, t.List[int]] = {}
+        copies: t.Counter[str] = t.Counter()
+        for u in rng.integers(len(units), size=len(units)).tolist():
+            name, indices = units[u]
+            copies[name] += 1
+            if matrix.partitions:
+                if copies[name] > 1:
+                    name = f"{name}.{copies[name]}"
+                partitions[name] = list(
+                    range(len(columns), len(columns) + len(indices))
+                )
+            columns = columns + list(indices)
+        return matrix.subset(columns=columns, partitions=partitions)
+    elif resampling == Resampling.JACKKNIFELANGUAGES:
+        n_keep = len(matrix.languages) - round(fraction * len(matrix.languages))
+        rows = rng.choice(len(matrix.languages), size=n_keep, replace=False)
+        return matrix.subset(rows=numpy.sort(rows))
+    elif resampling == Resampling.JACKKNIFECHARACTERS:
+        n_keep = len(characters) - round(fraction * len(characters))
+        kept = rng.choice(characters, size=n_keep, replace=False)
+        return matrix.subset(columns=fixed + numpy.sort(kept).tolist())
+    else:
+        raise TypeError(
+            f"Value of resampling, {resampling}, did not correspond to a known Resampling."
+        )
+
+
+def replicate_path(output_file: Path, i: int, n: int) -> Path:
+    """Name the file for replicate i of n, next to the output file.
+
+    >>> replicate_path(Path("out/matrix.nex"), 7, 100).as_posix()
+    'out/matrix_007.nex'
+
+    """
+    return output_file.with_name(
+        "{:}_{:0{:d}d}{:}".format(output_file.stem, i, len(str(n)), output_file.suffix)
+    )
+
+
+def write_replicate(
+    matrix: CharacterMatrix,
+    resampling: Resampling,
+    seed: numpy.random.SeedSequence,
+    fraction: float,
+    format: str,
+    output_file: Path,
+    template: t.Optional[bytes] = None,
+) -> Path:
+    """Draw one replicate of the matrix and write it to output_file."""
+    replicate = resample(matrix, resampling, numpy.random.default_rng(seed), fraction)
+    write_matrix(replicate, format, output_file, template)
+    return output_file
+
+
+def write_replicates(
+    matrix: CharacterMatrix,
+    resampling: Resampling,
+    n: int,
+    format: str,
+    output_file: Path,
+    template: t.Optional[bytes] = None,
+    fraction: float = 0.5,
+    seed: t.Optional[int] = None,
+    jobs: int = 1,
+    logger: cli.logging.Logger = cli.logger,
+) -> t.List[Path]:
+    """Write n resampled replicates of a coded matrix, in parallel.
+
+    Each replicate gets its own random stream spawned from `seed`, so the
+    replicates do not depend on the number of jobs. The replicates are
+    written to files named by `replicate_path`, which are returned.
+
+    """
+    seeds = numpy.random.SeedSequence(seed).spawn(n)
+    paths = [replicate_path(output_file, i, n) for i in range(1, n + 1)]
+    arguments = (
+        repeat(matrix),
+        repeat(resampling),
+        seeds,
+        repeat(fraction),
+        repeat(format),
+        paths,
+        repeat(template),
+    )
+    if jobs > 1 and n > 1:
+        # Tasks that are sent to a worker together share one copy of the
+        # matrix, so send each worker one chunk.
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            written = list(
+                cli.tq(
+                    pool.map(write_replicate, *arguments, chunksize=-(-n // jobs)),
+                    task="Writing replicates",
+                    logger=logger,
+                    total=n,
+                )
+            )
+    else:
+        written = list(
+            cli.tq(
+                map(write_replicate, *arguments),
+                task="Writing replicates",
+                logger=logger,
+                total=n,
+            )
+        )
+    return written
+
+
+def export_jobs(
+    formats: t.Sequence[str],
+    codings: t.Sequence[CodingProcedure],
+    output_files: t.Sequence[Path],
+) -> t.List[t.Tuple[CodingProcedure, str, t.Optional[Path]]]:
+    """Pair up the requested codings, formats and output files.
+
+    The i-th output file is written with the i-th format and coding. A
+    format or coding that is given only once applies to all output files.
+    Without output files, there is a single export to stdout.
+
+    >>> export_jobs(["nexus", "csv"], [CodingProcedure.MULTISTATE],
+    ...     [Path("a.nex"), Path("a.csv")]) == [
+    ...   (CodingProcedure.MULTISTATE, "nexus", Path("a.nex")),
+    ...   (CodingProcedure.MULTISTATE, "csv", Path("a.csv"))]
+    True
+    >>> export_jobs(["raw"], [CodingProcedure.ROOTMEANING], [])
+    [(<CodingProcedure.ROOTMEANING: 1>, 'raw', None)]
+    >>> export_jobs(["raw", "csv"], [CodingProcedure.ROOTMEANING], [])
+    Traceback (most recent call last):
+      ...
+    ValueError: Several exports need an output file each.
+
+    """
+    n = max(len(formats), len(codings), len(output_files), 1)
+    if not output_files and n > 1:
+        raise ValueError("Several exports need an output file each.")
+    if len(set(output_files)) < len(output_files):
+        raise ValueError("Each export needs its own output file.")
+    if len(formats) not in (1, n) or len(codings) not in (1, n):
+        raise ValueError(
+            f"There are {n} exports, so give either one --format and one --coding, or one for each export."
+        )
+    return [
+        (
+            codings[i] if len(codings) > 1 else codings[0],
+            formats[i] if len(formats) > 1 else formats[0],
+            output_files[i] if output_files else None,
+        )
+        for i in range(n)
+    ]
 
 
 def parser():
@@ -827,15 +2165,18 @@ def parser():
     parser.add_argument(
         "--format",
         choices=("csv", "raw", "beast", "nexus"),
-        default="raw",
+        action="append",
+        default=[],
         help="""Output format: `raw` for one language name per row, followed by spaces and
             the character state vector; `nexus` for a complete Nexus file; `beast`
             for the <data> tag to copy to a BEAST file; `csv` for a CSV
-            with languages in rows and characters in columns. (default: raw)""",
+            with languages in rows and characters in columns. Can be given
+            once per --output-file, to write several formats in one run.
+            (default: raw)""",
     )
     parser.add_argument(
         "-b",
-        action="store_const",
+        action="append_const",
         const="beast",
         dest="format",
         help="""Short form of --format=beast""",
@@ -844,8 +2185,14 @@ def parser():
         "--output-file",
         "-o",
         type=Path,
+        action="append",
+        default=[],
         help="""File to write output to. (If format=beast and output file exists, replace the
-            first `data` tag in there.) (default: Write to stdout)""",
+            first `data` tag in there.) Can be given several times: The i-th
+            output file is written in the i-th --format and --coding, or in the
+            only one if a format or coding is given only once. The data are
+            loaded once, and each coding is computed only once for all
+            outputs. (default: Write to stdout)""",
     )
     parser.add_argument(
         "--languages",
@@ -864,8 +2211,8 @@ def parser():
     )
     parser.add_argument(
         "--coding",
-        action=cli.enum_from_lower(CodingProcedure),
-        default="RootMeaning",
+        action=cli.enum_from_lower(CodingProcedure, append=True),
+        default=[],
         help="""Coding method: In the `RootMeaning` coding method, every character
         describes the presence or absence of a particular root morpheme or
         cognate class in the word(s) for a given meaning; In the
@@ -874,7 +2221,7 @@ def parser():
         of a root (morpheme) in the language, independet of which meaning that
         root is attested in; And in the `Multistate` coding, each character
         describes, possibly including uniform ambiguities, the cognate class of
-        a meaning. (default: RootMeaning)""",
+        a meaning. Can be given once per --output-file. (default: RootMeaning)""",
     )
     parser.add_argument(
         "--absence-heuristic",
@@ -892,16 +2239,86 @@ def parser():
     parser.add_argument(
         "--stats-file",
         type=Path,
-        help="Path to a TeX file that will be filled with LaTeX command definitions for some summary statistics. (default: Don't write a stats file)",
+        help="Path to a TeX file that will be filled with LaTeX command definitions for some summary statistics, of the first export. (default: Don't write a stats file)",
     )
+    parser.add_argument(
+        "--replicates",
+        type=int,
+        default=0,
+        metavar="N",
+        help="""Instead of the coded matrix, write N resampled replicates of it, to files
+        named like the --output-file with a replicate number added. The dataset
+        is loaded and coded only once. If the format is beast and the output
+        file exists, it is used as template for every replicate. (default: 0,
+        write the matrix itself)""",
+    )
+    parser.add_argument(
+        "--resampling",
+        action=cli.enum_from_lower(Resampling),
+        default=Resampling.BOOTSTRAP,
+        help="""How to draw the replicates: `Bootstrap` draws as many concepts as there
+        are, with replacement, keeping all characters of each drawn concept
+        (or draws characters, for codings without concept partitions);
+        `JackknifeLanguages` and `JackknifeCharacters` drop a random fraction
+        of the languages or characters. (default: Bootstrap)""",
+    )
+    parser.add_argument(
+        "--jackknife-fraction",
+        type=float,
+        default=0.5,
+        metavar="F",
+        help="Fraction of languages or characters to drop in each jackknife replicate. (default: 0.5)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Random seed for drawing replicates. (default: Draw a seed from the system)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Write replicates in N parallel processes. (default: 1)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        default=False,
+        help="""Keep the coded matrix, together with a fingerprint of the data of each
+        concept, in the same per-user cache directory as --cache. In later
+        runs, code only the concepts whose forms or cognate judgements
+        changed, and splice them into the stored matrix. Only available for
+        the RootMeaning and Multistate codings. (default: Code all concepts
+        from scratch)""",
+    )
+    cli.add_cache_controls(parser)
     return parser
 
 
 if __name__ == "__main__":
     args = parser().parse_args()
     logger = cli.setup_logging(args)
+    try:
+        jobs = export_jobs(
+            args.format or ["raw"],
+            args.coding or [CodingProcedure.ROOTMEANING],
+            args.output_file,
+        )
+    except ValueError as e:
+        cli.Exit.CLI_ARGUMENT_ERROR(str(e))
+    if args.replicates and any(output_file is None for _, _, output_file in jobs):
+        cli.Exit.CLI_ARGUMENT_ERROR(
+            "Replicates are written to files named after the --output-file, so you need to specify one."
+        )
+
     # Step 1: Load the raw data.
-    dataset = pycldf.Dataset.from_metadata(args.metadata)
+    dataset = util.DatasetSnapshot(
+        pycldf.Dataset.from_metadata(args.metadata),
+        logger=logger,
+        cache=args.cache,
+    )
 
     # Step 1: Load the raw data.
     ds: t.Mapping[Language_ID, t.Mapping[Parameter_ID, t.Set[Cognateset_ID]]] = {
@@ -912,136 +2329,76 @@ if __name__ == "__main__":
 
     logger.info(f"Imported languages {set(ds)}.")
 
-    # Step 2: Code the data
-    n_symbols, datatype = 2, "binary"
-    partitions = None
-    alignment: t.Mapping[Language_ID, str]
-    if args.coding == CodingProcedure.ROOTPRESENCE:
-        relevant_concepts = apply_heuristics(
-            dataset, args.absence_heuristic, primary_concepts=args.concepts
-        )
-        binal, cognateset_indices = root_presence_code(
-            ds, relevant_concepts=relevant_concepts, logger=logger
-        )
-        exclude = {
-            index
-            for cognateset, index in cognateset_indices.items()
-            if cognateset not in args.cognatesets
-        }
-        n_characters = len(next(iter(binal.values())))
-        alignment = {
-            key: "".join([v for i, v in enumerate(value) if i not in exclude])
-            for key, value in binal.items()
-        }
-        sequences = raw_binary_alignment(alignment)
-    elif args.coding == CodingProcedure.ROOTMEANING:
-        binal, concept_cognateset_indices = root_meaning_code(ds)
-        n_characters = len(next(iter(binal.values())))
-        exclude = {
-            index
-            for concept, cognateset_indices in concept_cognateset_indices.items()
-            for cognateset, index in cognateset_indices.items()
-            if cognateset not in args.cognatesets
-        }
-        alignment = {
-            key: "".join([v for i, v in enumerate(value) if i not in exclude])
-            for key, value in binal.items()
-        }
-        sequences = raw_binary_alignment(alignment)
-        partitions = {
-            concept: cognatesets.values()
-            for concept, cognatesets in concept_cognateset_indices.items()
-        }
-    elif args.coding == CodingProcedure.MULTISTATE:
-        multial, concept_indices = multistate_code(ds)
-        n_characters = len(next(iter(multial.values())))
-        sequences, n_symbols = raw_multistate_alignment(multial, long_sep=",")
-        datatype = "multistate"
-    else:
-        raise ValueError("Coding schema {:} unknown.".format(args.coding))
-
-    # Step 3: Format the data for output
-    if args.format == "raw":
-        if args.output_file is None:
-            output_file = sys.stdout
-        else:
-            output_file = args.output_file.open("w", encoding="utf-8")
-
-        max_length = max([len(str(lang)) for lang in ds])
-        for language, sequence in zip(ds, sequences):
-            print(
-                language,
-                " " * (max_length - len(language)),
-                sequence,
-                file=output_file,
+    # Step 2: Code the data, once for each coding procedure.
+    matrices: t.Dict[CodingProcedure, CharacterMatrix] = {}
+    for coding_procedure, _, _ in jobs:
+        if coding_procedure in matrices:
+            continue
+        matrix: CharacterMatrix
+        if args.incremental and coding_procedure == CodingProcedure.ROOTPRESENCE:
+            logger.warning(
+                "Root presence coding does not consist of independent concept blocks, so I code it from scratch."
             )
-
-    elif args.format == "nexus":
-        if args.output_file is None:
-            output_file = sys.stdout
-        else:
-            output_file = args.output_file.open("w", encoding="utf-8")
-
-        output_file.write(
-            format_nexus(
-                ds,
-                sequences,
-                n_symbols=n_symbols,
-                n_characters=n_characters,
-                datatype=datatype,
-                partitions=partitions,
+        if args.incremental and coding_procedure != CodingProcedure.ROOTPRESENCE:
+            stored = (
+                dataset.cache_directory
+                or util.snapshot.default_cache_directory(dataset)
+            ) / f"phylogenetics-{coding_procedure.name.lower()}.npz"
+            coding = IncrementalCoding.load(stored, coding_procedure, logger=logger)
+            if coding is None:
+                coding = IncrementalCoding.code(ds, coding_procedure)
+            else:
+                coding.update(ds, logger=logger)
+            coding.store(stored, logger=logger)
+            matrix = coding.matrix
+        elif coding_procedure == CodingProcedure.ROOTPRESENCE:
+            relevant_concepts = apply_heuristics(
+                dataset, args.absence_heuristic, primary_concepts=args.concepts
             )
-        )
-
-    elif args.format == "beast":
-        # Prepare the output file.
-        xmlparser = ET.XMLParser(remove_blank_text=True, resolve_entities=False)
-        if args.output_file is None:
-            root = ET.fromstring(
-                """<beast><data /></beast> """,
-                parser=xmlparser,
+            matrix = CharacterMatrix.root_presence(
+                ds, relevant_concepts=relevant_concepts, logger=logger
             )
-
-        elif args.output_file.exists():
-            for line in args.output_file.open("rb"):
-                xmlparser.feed(line)
-            root = xmlparser.close()
+        elif coding_procedure == CodingProcedure.ROOTMEANING:
+            matrix = CharacterMatrix.root_meaning(ds)
+        elif coding_procedure == CodingProcedure.MULTISTATE:
+            matrix = CharacterMatrix.multistate(ds)
         else:
-            root = ET.fromstring(
-                """<beast><data /></beast>""",
-                parser=xmlparser,
-            )
-        et = root.getroottree()
-        datas = list(root.iter("data"))
-        data_object = datas[0]
-
-        fill_beast(data_object, ds, sequences)
-        if partitions:
-            add_partitions(data_object, partitions)
-            for language_plate in root.iterfind(".//plate[@range='{partitions}']"):
-                language_plate.set("range", ",".join(partitions))
-        for language_plate in root.iterfind(".//plate[@range='{languages}']"):
-            language_plate.set("range", ",".join(ds))
-        if args.output_file:
-            et.write(
-                args.output_file.open("wb"),
-                pretty_print=True,
-                xml_declaration=True,
-                encoding=et.docinfo.encoding,
+            raise ValueError("Coding schema {:} unknown.".format(coding_procedure))
+        if matrix.datatype == "binary":
+            matrix = matrix.select(matrix.cognateset_mask(args.cognatesets))
+        matrices[coding_procedure] = matrix
+
+    # Step 3: Format the data for output. Read all templates before any
+    # output file overwrites them.
+    templates = {
+        output_file: output_file.read_bytes()
+        for _, format, output_file in jobs
+        if format == "beast" and output_file is not None and output_file.exists()
+    }
+    for coding_procedure, format, output_file in jobs:
+        matrix = matrices[coding_procedure]
+        template = templates.get(output_file)
+        if args.replicates:
+            write_replicates(
+                matrix,
+                args.resampling,
+                args.replicates,
+                format,
+                output_file,
+                template=template,
+                fraction=args.jackknife_fraction,
+                seed=args.seed,
+                jobs=args.jobs,
+                logger=logger,
             )
         else:
-            print(
-                ET.tostring(
-                    root,
-                    pretty_print=True,
-                    xml_declaration=True,
-                ).decode("utf-8")
-            )
+            write_matrix(matrix, format, output_file, template)
 
     # Step 4: Maybe print some statistics to file.
     if args.stats_file:
         countlects = len(ds)
         countconcepts = len(next(iter(ds.values())))
+        n_characters = matrices[jobs[0][0]].n_characters
         with args.stats_file.open("w", encoding="utf-8") as s:
             print(
                 f"""
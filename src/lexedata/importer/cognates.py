@@ -9,7 +9,7 @@ from lexedata import cli
 from lexedata.types import Language, RowObject, CogSet
 import lexedata.util.excel as cell_parsers
 from lexedata.importer.excel_matrix import ExcelCognateParser
-from lexedata.util.excel import clean_cell_value, get_cell_comment
+from lexedata.util.excel import clean_cell_value, get_cell_comment, StreamingSheet
 
 
 class CognateEditParser(ExcelCognateParser):
@@ -96,17 +96,29 @@ def header_from_cognate_excel(
 
 
 def import_cognates_from_excel(
-    ws: openpyxl.worksheet.worksheet.Worksheet,
+    ws: t.Union[
+        openpyxl.worksheet.worksheet.Worksheet,
+        t.Sequence[openpyxl.worksheet.worksheet.Worksheet],
+    ],
     dataset: pycldf.Dataset,
     extractor: re.Pattern = re.compile("/(?P<ID>[^/]*)/?$"),
     logger: cli.logging.Logger = cli.logger,
 ) -> None:
+    """Replace the cognatesets and judgements of the dataset by those in Excel.
+
+    `ws` can also be a sequence of worksheets, such as the shards written by
+    `lexedata.exporter.cognates --shard-by`. They are parsed into the same
+    cache, one after the other, and the cognate tables are written once, so
+    together the sheets replace all cognate data.
+
+    """
+    sheets = [ws] if hasattr(ws, "iter_rows") else list(ws)
     logger.info("Loading sheet…")
     logger.info(
-        f"Importing cognate sets from sheet {ws.title}, into {dataset.tablegroup._fname}…"
+        f"Importing cognate sets from sheet(s) {', '.join(s.title for s in sheets)}, into {dataset.tablegroup._fname}…"
     )
 
-    row_header, _ = header_from_cognate_excel(ws, dataset, logger=logger)
+    row_header, _ = header_from_cognate_excel(sheets[0], dataset, logger=logger)
     excel_parser_cognate = CognateEditParser(
         dataset,
         top=2,
@@ -125,7 +137,12 @@ def import_cognates_from_excel(
     excel_parser_cognate.db.drop_from_cache("CognatesetTable")
     excel_parser_cognate.db.drop_from_cache("CognateTable")
     logger.info("Parsing cognate Excel…")
-    excel_parser_cognate.parse_cells(ws, status_update=None)
+    for sheet in sheets:
+        if header_from_cognate_excel(sheet, dataset, logger=logger)[0] != row_header:
+            raise ValueError(
+                f"Sheet {sheet.title} has different cognateset columns than sheet {sheets[0].title}, so they cannot be imported together."
+            )
+        excel_parser_cognate.parse_cells(sheet, status_update=None)
     excel_parser_cognate.db.write_dataset_from_cache(
         ["CognateTable", "CognatesetTable"]
     )
@@ -135,9 +152,9 @@ if __name__ == "__main__":
     parser = cli.parser(description=__doc__)
     parser.add_argument(
         "cogsets",
-        nargs="?",
-        default="cognates.xlsx",
-        help="Path to an Excel file containing cogsets and cognatejudgements (default: cognates.xlsx). The data will be imported from the *active sheet* (probably the last one you had open in Excel) of that spreadsheet.",
+        nargs="*",
+        default=["cognates.xlsx"],
+        help="Path to an Excel file containing cogsets and cognatejudgements (default: cognates.xlsx). The data will be imported from the *active sheet* (probably the last one you had open in Excel) of that spreadsheet. Give several files, such as all shards of a sharded export, to import them together.",
         metavar="COGSETS",
     )
     parser.add_argument(
@@ -150,11 +167,18 @@ if __name__ == "__main__":
     args = parser.parse_args()
     logger = cli.setup_logging(args)
 
-    ws = openpyxl.load_workbook(args.cogsets).active
+    workbooks = [
+        openpyxl.load_workbook(cogsets, read_only=True) for cogsets in args.cogsets
+    ]
 
     import_cognates_from_excel(
-        ws,
+        [
+            StreamingSheet(wb.active, cogsets)
+            for wb, cogsets in zip(workbooks, args.cogsets)
+        ],
         pycldf.Dataset.from_metadata(args.metadata),
         extractor=re.compile(args.formid_regex),
         logger=logger,
     )
+    for wb in workbooks:
+        wb.close()
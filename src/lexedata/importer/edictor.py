@@ -4,9 +4,11 @@ from tqdm import tqdm
 import collections
 import typing as t
 
+import networkx
 import pycldf
 
 from lexedata import util, cli, types
+from lexedata.exporter.edictor import HASH_COLUMN, row_hash
 
 
 def extract_partial_judgements(
@@ -64,17 +66,29 @@ def load_forms_from_tsv(
     ],
     input_file: Path,
     logger: cli.logging.Logger = cli.logger,
-) -> t.Mapping[int, t.Sequence[t.Tuple[types.Form_ID, range, t.Sequence[str]]]]:
-    """
+) -> t.Tuple[
+    t.Mapping[int, t.Sequence[t.Tuple[types.Form_ID, range, t.Sequence[str]]]],
+    t.Set[types.Form_ID],
+]:
+    """Read forms and cognate judgements from an Edictor file.
+
+    Return the cognate sets found in the file, keyed by their Edictor COGID,
+    and the IDs of the forms whose rows need to be re-imported.
+
+    If the file has the row hash column written by the Edictor exporter, rows
+    whose content still matches their hash are left alone. Their judgements
+    are still returned, because they are needed to match Edictor's cognate
+    sets with the dataset's, but their forms are not counted as affected.
 
     Side effects
     ============
-    This function overwrites dataset's FormTable
+    This function overwrites dataset's FormTable, unless no row was changed.
     """
-    input = csv.DictReader(
+    input = csv.reader(
         input_file.open(encoding="utf-8"),
         delimiter="\t",
     )
+    fieldnames = next(input)
 
     # These days, all dicts are ordered by default. Still, better make this explicit.
     forms = util.cache_table(dataset)
@@ -99,58 +113,73 @@ def load_forms_from_tsv(
             "TOKENS": "segments",
             "CLDF_ID": "id",
             "ID": "",
+            HASH_COLUMN.upper(): HASH_COLUMN,
         }
     )
-    if "_PARAMETERREFERENCE" in [f.upper() for f in input.fieldnames]:
+    if "_PARAMETERREFERENCE" in [f.upper() for f in fieldnames]:
         form_table_upper["_PARAMETERREFERENCE"] = "parameterReference"
         form_table_upper["CONCEPT"] = ""
 
+    hash_index: t.Optional[int] = None
     separators: t.MutableMapping[str, t.Optional[str]] = {}
     # TODO: What's the logic behind going backwards through this? We are not modifying fieldnames.
-    for i in range(len(input.fieldnames)):
-        if i == 0 and input.fieldnames[0] != "ID":
+    for i in range(len(fieldnames)):
+        if i == 0 and fieldnames[0] != "ID":
             raise ValueError(
                 "When importing from Edictor, expected the first column to be named 'ID', but found %s",
-                input.fieldnames["ID"],
+                fieldnames[0],
             )
 
-        lingpy = input.fieldnames[i]
+        lingpy = fieldnames[i]
         try:
-            input.fieldnames[i] = form_table_upper[lingpy.upper()]
+            fieldnames[i] = form_table_upper[lingpy.upper()]
         except KeyError:
             logger.warning(
                 "Your edictor file contained a column %s, which I could not interpret.",
                 lingpy,
             )
 
-        if input.fieldnames[i] == "cognatesetReference":
-            separators[input.fieldnames[i]] = " "
-        elif input.fieldnames[i] == "alignment":
-            separators[input.fieldnames[i]] = " "
+        if fieldnames[i] == "cognatesetReference":
+            separators[fieldnames[i]] = " "
+        elif fieldnames[i] == "alignment":
+            separators[fieldnames[i]] = " "
+        elif fieldnames[i] == HASH_COLUMN:
+            hash_index = i
 
         try:
-            separators[input.fieldnames[i]] = dataset[
-                "FormTable", input.fieldnames[i]
-            ].separator
+            separators[fieldnames[i]] = dataset["FormTable", fieldnames[i]].separator
         except KeyError:
             pass
 
     logger.info(
-        "The header of your edictor file will be interpreted as %s.", input.fieldnames
+        "The header of your edictor file will be interpreted as %s.", fieldnames
     )
+    if hash_index is None:
+        logger.info(
+            "Your edictor file has no %s column, so I will re-import all its rows.",
+            HASH_COLUMN,
+        )
 
     affected_forms: t.Set[types.Form_ID] = set()
-    for line in cli.tq(
+    unchanged = 0
+    for row in cli.tq(
         input, task="Importing form rows from edictor…", total=len(forms)
     ):
-        # Column "" is the re-named Lingpy-ID column, so the first one.
-        if not any(line.values()) or line[""].startswith("#"):
+        if not any(row) or row[0].startswith("#"):
             # One of Edictor's comment rows, storing settings
             continue
 
-        for (key, value) in line.items():
+        changed = (
+            hash_index is None
+            or len(row) <= hash_index
+            or row[hash_index]
+            != row_hash(v for i, v in enumerate(row) if i not in {0, hash_index})
+        )
+
+        line: t.Dict[str, t.Any] = {}
+        for key, value in zip(fieldnames, row):
             value = value.replace("\\!t", "\t").replace("\\!n", "\n")
-            sep = separators[key]
+            sep = separators.get(key)
             if sep is not None:
                 if not value:
                     line[key] = []
@@ -159,7 +188,10 @@ def load_forms_from_tsv(
             else:
                 line[key] = value
 
-        affected_forms.add(line["id"])
+        if changed:
+            affected_forms.add(line["id"])
+        else:
+            unchanged += 1
 
         try:
             for segments, cognateset, alignment in extract_partial_judgements(
@@ -171,12 +203,24 @@ def load_forms_from_tsv(
                 edictor_cognatesets[cognateset].append(
                     (line["id"], segments, alignment)
                 )
-            forms[line["id"]] = line
+            if changed:
+                forms[line["id"]] = line
         except IndexError:
             logger.warning(
-                f"In form with Lingpy-ID {line['']}: Cognateset judgements {line['cognatesetReference']} and alignment {line['alignment']} did not match. At least one morpheme skipped."
+                f"In form with Lingpy-ID {row[0]}: Cognateset judgements {line['cognatesetReference']} and alignment {line['alignment']} did not match. At least one morpheme skipped."
             )
-    edictor_cognatesets.pop(0, None)
+    # COGID 0 marks morphemes without a cognate set. The COGIDs are read as
+    # strings.
+    edictor_cognatesets.pop("0", None)
+
+    if hash_index is not None:
+        logger.info(
+            "%d rows were changed in Edictor, %d rows were not.",
+            len(affected_forms),
+            unchanged,
+        )
+    if not affected_forms:
+        return edictor_cognatesets, affected_forms
 
     columns = {
         (util.cldf_property(column.propertyUrl) or column.name): column.name
@@ -205,6 +249,7 @@ def match_cognatesets(
     reference_cognatesets: t.Mapping[
         types.Cognateset_ID, t.Sequence[t.Tuple[types.Form_ID, range, t.Sequence[str]]]
     ],
+    optimal: bool = False,
 ) -> t.Mapping[int, t.Optional[types.Cognateset_ID]]:
     """Match two different cognateset assignments with each other.
 
@@ -241,37 +286,64 @@ def match_cognatesets(
     (As you see, the function is a bit more general than the type signature
     implies.)
 
+    By default, the new cognatesets are matched greedily, biggest first. With
+    `optimal`, the matching maximizes the total overlap instead, which takes
+    longer for many cognatesets.
+
+    >>> new = {0: ["a", "b", "e", "f"], 1: ["c", "g", "h"]}
+    >>> reference = {"X": ["a", "b", "c", "g"], "Y": ["e"]}
+    >>> match_cognatesets(new, reference)
+    {0: 'X', 1: None}
+    >>> match_cognatesets(new, reference, optimal=True)
+    {0: 'Y', 1: 'X'}
+
     """
+    # Reference cognatesets that contain each form, so that the overlaps of a
+    # new cognateset are counted by walking only through its own forms.
+    cognatesets_by_form: t.DefaultDict[types.Form_ID, t.Set[types.Cognateset_ID]] = (
+        collections.defaultdict(set)
+    )
+    for c, reference_cognateset in reference_cognatesets.items():
+        for s in reference_cognateset:
+            cognatesets_by_form[s[0]].add(c)
+    sizes = {c: len(forms) for c, forms in reference_cognatesets.items()}
+
+    def overlaps(n, exclude=()) -> t.Counter[types.Cognateset_ID]:
+        forms = {s[0] for s in new_cognatesets[n]}
+        overlap: t.Counter[types.Cognateset_ID] = collections.Counter()
+        for form in forms:
+            for c in cognatesets_by_form.get(form, ()):
+                # Reference cognatesets much bigger than the new one are not
+                # candidates.
+                if c not in exclude and sizes[c] <= 2 * len(forms):
+                    overlap[c] += 1
+        return overlap
+
+    matching: t.Dict[int, t.Optional[types.Cognateset_ID]] = {
+        n: None for n in new_cognatesets
+    }
+    if optimal:
+        graph = networkx.Graph()
+        for n in new_cognatesets:
+            for c, overlap in overlaps(n).items():
+                graph.add_edge(("new", n), ("reference", c), weight=overlap)
+        for a, b in networkx.max_weight_matching(graph):
+            if a[0] == "reference":
+                a, b = b, a
+            matching[a[1]] = b[1]
+        return matching
+
     new_cognateset_ids = sorted(
         new_cognatesets, key=lambda x: len(new_cognatesets[x]), reverse=True
     )
-    matching: t.Dict[int, t.Optional[types.Cognateset_ID]] = {}
-    unassigned_reference_cognateset_ids = [
-        (len(forms), c) for c, forms in reference_cognatesets.items()
-    ]
-    unassigned_reference_cognateset_ids.sort(reverse=True)
-    cut = 0
+    assigned: t.Set[types.Cognateset_ID] = set()
     for n in tqdm(new_cognateset_ids):
-        new_cognateset = new_cognatesets[n]
-        forms = {s[0] for s in new_cognateset}
-        best_intersection = 0
-        index, best_reference = None, None
-        for i, (left, right) in enumerate(
-            unassigned_reference_cognateset_ids[cut:], cut
-        ):
-            if left <= best_intersection:
-                break
-            if left > 2 * len(forms):
-                cut = i
-                continue
-            reference_cognateset = reference_cognatesets[right]
-            intersection = len(forms & {s[0] for s in reference_cognateset})
-            if intersection > best_intersection:
-                index, best_reference = (i, right)
-                best_intersection = intersection
-        matching[n] = best_reference
-        if index is not None:
-            del unassigned_reference_cognateset_ids[index]
+        overlap = overlaps(n, assigned)
+        if overlap:
+            # Ties go to the bigger reference cognateset
+            best = max(overlap, key=lambda c: (overlap[c], sizes[c], c))
+            matching[n] = best
+            assigned.add(best)
     return matching
 
 
@@ -288,6 +360,7 @@ def edictor_to_cldf(
     ],
     affected_forms: t.Set[types.Form_ID],
     source: t.List[str] = [],
+    optimal_matching: bool = False,
 ):
     ref_cogsets: t.MutableMapping[
         types.Cognateset_ID, t.List[t.Tuple[types.Form_ID, range, t.Sequence[str]]]
@@ -296,21 +369,49 @@ def edictor_to_cldf(
     judgements_lookup: t.MutableMapping[
         types.Form_ID, t.MutableMapping[types.Cognateset_ID, types.Judgement]
     ] = t.DefaultDict(dict)
-    for j in util.cache_table(dataset, "CognateTable").values():
-        if j["formReference"] in affected_forms:
+    if not affected_forms:
+        return
+    # Cognate sets are matched using all forms in the Edictor file, but only
+    # the judgements of the affected forms are replaced.
+    exported_forms = {
+        form for judgements in new_cogsets.values() for form, _, _ in judgements
+    }
+    exported_forms.update(affected_forms)
+    cognatesets_of_form: t.MutableMapping[types.Form_ID, t.Set[types.Cognateset_ID]] = (
+        t.DefaultDict(set)
+    )
+    judgements = list(util.cache_table(dataset, "CognateTable").values())
+    for j in judgements:
+        if j["formReference"] in exported_forms:
             ref_cogsets[j["cognatesetReference"]].append(
                 (j["formReference"], j["segmentSlice"], j["alignment"])
             )
+            cognatesets_of_form[j["formReference"]].add(j["cognatesetReference"])
+    matches = match_cognatesets(new_cogsets, ref_cogsets, optimal=optimal_matching)
+
+    # A row that did not change in Edictor can still belong to an Edictor
+    # cognate set that now maps to a different cognate set in the dataset, for
+    # example when other forms were moved into its set. Such forms are
+    # affected, too.
+    affected_forms = set(affected_forms)
+    for cognateset, new_judgements in new_cogsets.items():
+        for form, _, _ in new_judgements:
+            if matches[cognateset] not in cognatesets_of_form[form]:
+                affected_forms.add(form)
+
+    for j in judgements:
+        if j["formReference"] in affected_forms:
             judgements_lookup[j["formReference"]][j["cognatesetReference"]] = j
         else:
             cognate.append(j)
-    matches = match_cognatesets(new_cogsets, ref_cogsets)
 
     for cognateset, judgements in new_cogsets.items():
         cognateset = matches[cognateset]
         if cognateset is None:
             cognateset = "_".join(f for f, _, _ in judgements)
         for form, slice, alignment in judgements:
+            if form not in affected_forms:
+                continue
             was: types.Judgement = judgements_lookup.get(form, {}).get(cognateset)
             if was:
                 was["segmentSlice"] = util.indices_to_segment_slice(slice)
@@ -363,6 +464,12 @@ if __name__ == "__main__":
         default="cognate.tsv",
         help="Path to the input file",
     )
+    parser.add_argument(
+        "--optimal-matching",
+        action="store_true",
+        default=False,
+        help="Match Edictor's cognate sets to the existing ones so that the total overlap is maximal, instead of greedily from the biggest cognate set down. This is slower, so use it for small exports.",
+    )
     args = parser.parse_args()
     logger = cli.setup_logging(args)
 
@@ -370,6 +477,7 @@ if __name__ == "__main__":
     new_cogsets, affected_forms = load_forms_from_tsv(
         dataset=dataset,
         input_file=args.input_file,
+        logger=logger,
     )
 
     edictor_to_cldf(
@@ -377,4 +485,5 @@ if __name__ == "__main__":
         new_cogsets=new_cogsets,
         affected_forms=affected_forms,
         source=[args.source],
+        optimal_matching=args.optimal_matching,
     )
@@ -15,7 +15,7 @@ from pathlib import Path
 import openpyxl
 
 from lexedata import cli, util, types
-from lexedata.util.excel import clean_cell_value
+from lexedata.util.excel import clean_cell_value, StreamingSheet
 
 
 def import_interleaved(
@@ -144,7 +144,7 @@ if __name__ == "__main__":
     args = parser.parse_args()
     logger = cli.setup_logging(args)
 
-    ws = openpyxl.load_workbook(args.excel)
+    ws = openpyxl.load_workbook(args.excel, read_only=True)
 
     w = csv.writer(
         open(Path(args.directory) / "forms.csv", "w", newline="", encoding="utf-8")
@@ -158,6 +158,7 @@ if __name__ == "__main__":
 
     ids: t.Set[str] = set()
     for sheetname in args.sheets:
-        sheet = ws[sheetname]
+        sheet = StreamingSheet(ws[sheetname], args.excel)
         for row in import_interleaved(sheet, logger=logger, ids=ids):
             w.writerow(row)
+    ws.close()
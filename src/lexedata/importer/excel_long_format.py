@@ -102,7 +102,16 @@ def read_single_excel_sheet(
     ignore_missing: bool = False,
     ignore_superfluous: bool = False,
     status_update: t.Optional[str] = None,
+    db: t.Optional[DB] = None,
 ) -> t.Mapping[str, ImportLanguageReport]:
+    """Import the forms from one sheet of a long-format Excel file.
+
+    If no `db` is given, the dataset is read into a new DB before importing
+    the sheet and written back afterwards. To import several sheets, pass the
+    same, already cached, DB for every sheet instead, and write the dataset
+    from that DB once all sheets have been imported.
+
+    """
     report: t.Dict[str, ImportLanguageReport] = defaultdict(ImportLanguageReport)
 
     concept_columns: t.Tuple[str, str]
@@ -116,8 +125,10 @@ def read_single_excel_sheet(
             dataset["FormTable", "parameterReference"].name,
             concept_column,
         )
-    db = DB(dataset)
-    db.cache_dataset()
+    write_back = db is None
+    if db is None:
+        db = DB(dataset)
+        db.cache_dataset()
     # required cldf fields of a form
     c_f_id = db.dataset["FormTable", "id"].name
     c_f_language = db.dataset["FormTable", "languageReference"].name
@@ -126,6 +137,8 @@ def read_single_excel_sheet(
     c_f_concept = db.dataset["FormTable", "parameterReference"].name
     if not match_form:
         match_form = [c_f_form, c_f_language]
+    else:
+        match_form = list(match_form)
     if not db.dataset["FormTable", c_f_concept].separator:
         logger.warning(
             "Your metadata does not allow polysemous forms. According to your specifications, "
@@ -236,9 +249,7 @@ def read_single_excel_sheet(
                             new_concept
                             not in db.cache["FormTable"][form_id][c_f_concept]
                         ):
-                            db.cache["FormTable"][form_id][c_f_concept].append(
-                                new_concept
-                            )
+                            db.append_to("FormTable", form_id, c_f_concept, new_concept)
                             logger.info(
                                 f"New form-concept association: Concept {form[c_f_concept]} was added to existing form "
                                 f"{form_id}. If this was not intended "
@@ -273,7 +284,8 @@ def read_single_excel_sheet(
             db.insert_into_db(form)
             report[language_id].new += 1
     # write to cldf
-    db.write_dataset_from_cache()
+    if write_back:
+        db.write_dataset_from_cache()
     return report
 
 
@@ -325,7 +337,10 @@ def add_single_languages(
     if status_update:
         add_status_column_to_table(dataset=dataset, table_name="FormTable")
     report: t.Dict[str, ImportLanguageReport] = defaultdict(ImportLanguageReport)
-    # import all selected sheets
+    # Import all selected sheets into the same in-memory DB, so the dataset is
+    # read and written only once.
+    db = DB(dataset)
+    db.cache_dataset(logger=logger)
     for sheet in sheets:
         for lang, subreport in read_single_excel_sheet(
             dataset=dataset,
@@ -337,8 +352,10 @@ def add_single_languages(
             ignore_missing=ignore_missing,
             ignore_superfluous=ignore_superfluous,
             status_update=status_update,
+            db=db,
         ).items():
             report[lang] += subreport
+    db.write_dataset_from_cache()
     return report
 
 
@@ -348,7 +365,7 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "excel",
-        type=openpyxl.load_workbook,
+        type=Path,
         help="The Excel file to parse",
         metavar="EXCEL",
     )
@@ -417,24 +434,26 @@ if __name__ == "__main__":
     args = parser.parse_args()
     logger = cli.setup_logging(args)
 
+    # The sheets are only read row by row, so we don't need to keep the whole
+    # workbook in memory.
+    workbook = openpyxl.load_workbook(args.excel, read_only=True)
     if not args.sheets:
-        sheets = [
-            sheet for sheet in args.excel if sheet.title not in args.exclude_sheet
-        ]
+        sheets = [sheet for sheet in workbook if sheet.title not in args.exclude_sheet]
         logger.info("No sheets specified explicitly. Parsing sheets: %s", args.sheets)
     else:
-        sheets = [args.excel[s] for s in args.sheets]
+        sheets = [workbook[s] for s in args.sheets]
 
     report = add_single_languages(
         metadata=args.metadata,
         sheets=sheets,
         match_form=args.match_form,
         concept_name=args.concept_name,
-        ignore_missing=args.ignore_missing_excel_columns,
-        ignore_superfluous=args.ignore_superfluous_excel_columns,
+        ignore_missing=args.ignore_missing_columns,
+        ignore_superfluous=args.ignore_superfluous_columns,
         status_update=args.status_update,
         logger=logger,
     )
+    workbook.close()
     if args.report:
         report_data = [report(language) for language, report in report.items()]
         print(
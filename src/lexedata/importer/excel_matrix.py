@@ -5,6 +5,8 @@ import typing as t
 from pathlib import Path
 import logging
 import argparse
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 
 import pycldf
 import openpyxl
@@ -22,10 +24,13 @@ from lexedata.types import (
 from lexedata.util import (
     string_to_id,
     edit_distance,
+    edit_distance_matrix,
+    FuzzyIndex,
 )
 from lexedata.util.excel import (
     clean_cell_value,
     get_cell_comment,
+    StreamingSheet,
 )
 import lexedata.util.excel as cell_parsers
 from lexedata.edit.add_status_column import add_status_column_to_table
@@ -40,6 +45,39 @@ def cells_are_empty(cells: t.Iterable[openpyxl.cell.Cell]) -> bool:
     return not any([clean_cell_value(cell) for cell in cells])
 
 
+def hashable(value: t.Any) -> t.Hashable:
+    """Turn a (possibly list-valued) cell value into something hashable.
+
+    >>> hashable(["a", ["b"]])
+    ('a', ('b',))
+    >>> hashable("a")
+    'a'
+    """
+    if isinstance(value, list):
+        return tuple(hashable(v) for v in value)
+    return value
+
+
+class DetachedCell(t.NamedTuple):
+    """The parts of a cell that survive being sent between processes."""
+
+    value: t.Any
+    coordinate: str
+
+
+class ParsedRow(t.NamedTuple):
+    """A data row of a sheet, parsed but not yet matched against the DB.
+
+    cells holds a (cell, language ID, parsed forms or judgements) triple for
+    each cell in a language column.
+    """
+
+    properties: t.Optional[RowObject]
+    cell_identifier: str
+    has_forms: bool
+    cells: t.List[t.Tuple[t.Any, str, t.List[Object]]]
+
+
 class DB:
     """An in-memobry cache of a dataset.
 
@@ -50,15 +88,30 @@ class DB:
     candidates we get a key error). If you use the CognateParser elsewhere,
     make sure to cache the dataset explicitly, eg. by using DB.from_dataset!
 
+    For exact matches, find_db_candidates uses hash indices of the cached
+    objects, one for each combination of properties that have been matched on
+    so far. For fuzzy matches, it uses one q-gram index (see
+    lexedata.util.FuzzyIndex) per property to avoid computing most edit
+    distances. These indices are kept up to date by insert_into_db and
+    associate, so if you change cached objects in other ways, call reindex
+    afterwards.
+
     """
 
     cache: t.Dict[str, t.Dict[t.Hashable, t.Dict[str, t.Any]]]
     source_ids: t.Set[str]
+    indices: t.Dict[
+        str,
+        t.Dict[t.Tuple[str, ...], t.Dict[t.Hashable, t.Dict[t.Hashable, None]]],
+    ]
+    fuzzy_indices: t.Dict[str, t.Dict[str, FuzzyIndex]]
 
     def __init__(self, output_dataset: pycldf.Wordlist):
         """Create a new *empty* cache associated with a dataset."""
         self.dataset = output_dataset
         self.cache = {}
+        self.indices = {}
+        self.fuzzy_indices = {}
         self.source_ids = set()
 
     @classmethod
@@ -70,6 +123,8 @@ class DB:
 
     def cache_dataset(self, logger: cli.logging.Logger = cli.logger):
         logger.info("Caching dataset into memory…")
+        self.indices = {}
+        self.fuzzy_indices = {}
         for table in self.dataset.tables:
             table_type = (
                 table.common_props.get("dc:conformsTo", "").rsplit("#", 1)[1]
@@ -95,6 +150,7 @@ class DB:
 
     def drop_from_cache(self, table: str):
         self.cache[table] = {}
+        self.reindex(table)
 
     def retrieve(self, table_type: str):
         return self.cache[table_type].values()
@@ -103,6 +159,8 @@ class DB:
         self.source_ids.add(source_id)
 
     def empty_cache(self):
+        self.indices = {}
+        self.fuzzy_indices = {}
         self.cache = {
             # TODO: Is there a simpler way to get the list of all tables?
             table.common_props.get("dc:conformsTo", "").rsplit("#", 1)[1]
@@ -148,21 +206,113 @@ class DB:
                 )
                 self.make_id_unique(judgement)
                 judgements[judgement[id]] = judgement
+                self._index_object("CognateTable", judgement[id], judgement)
                 return True
         elif row.__table__ == "ParameterTable":
             column = self.dataset["FormTable", "parameterReference"]
             id = self.dataset["ParameterTable", "id"].name
 
+        self._unindex_object("FormTable", form_id, form, {column.name})
         if column.separator is None:
             form[column.name] = row[id]
         else:
             form.setdefault(column.name, []).append(row[id])
+        self._index_object("FormTable", form_id, form, {column.name})
         return True
 
+    def append_to(
+        self, table: str, id: t.Hashable, property: str, value: t.Any
+    ) -> None:
+        """Append a value to a list-valued property of a cached object.
+
+        Unlike changing the cached object directly, this keeps the indices of
+        the table up to date.
+
+        """
+        object = self.cache[table][id]
+        self._unindex_object(table, id, object, {property})
+        object.setdefault(property, []).append(value)
+        self._index_object(table, id, object, {property})
+
     def insert_into_db(self, object: Object) -> None:
         id = self.dataset[object.__table__, "id"].name
         assert object[id] not in self.cache[object.__table__]
         self.cache[object.__table__][object[id]] = object
+        self._index_object(object.__table__, object[id], object)
+
+    def index(
+        self, table: str, properties: t.Tuple[str, ...]
+    ) -> t.Dict[t.Hashable, t.Dict[t.Hashable, None]]:
+        """Get the hash index of a table by some properties, building it if necessary.
+
+        The index maps the tuple of values of these properties to the IDs of
+        all cached objects with these values.
+
+        """
+        indices = self.indices.setdefault(table, {})
+        try:
+            return indices[properties]
+        except KeyError:
+            index: t.Dict[t.Hashable, t.Dict[t.Hashable, None]] = {}
+            for id, object in self.cache[table].items():
+                key = tuple(hashable(object.get(p)) for p in properties)
+                index.setdefault(key, {})[id] = None
+            indices[properties] = index
+            return index
+
+    def fuzzy_index(self, table: str, property: str) -> FuzzyIndex:
+        """Get the q-gram index of a table property, building it if necessary."""
+        indices = self.fuzzy_indices.setdefault(table, {})
+        try:
+            return indices[property]
+        except KeyError:
+            index = FuzzyIndex()
+            for id, object in self.cache[table].items():
+                index.add(id, object.get(property))
+            indices[property] = index
+            return index
+
+    def _index_object(
+        self,
+        table: str,
+        id: t.Hashable,
+        object: t.Mapping[str, t.Any],
+        changed: t.Optional[t.Set[str]] = None,
+    ) -> None:
+        for properties, index in self.indices.get(table, {}).items():
+            if changed is not None and changed.isdisjoint(properties):
+                continue
+            key = tuple(hashable(object.get(p)) for p in properties)
+            index.setdefault(key, {})[id] = None
+        for property, fuzzy_index in self.fuzzy_indices.get(table, {}).items():
+            if changed is not None and property not in changed:
+                continue
+            fuzzy_index.add(id, object.get(property))
+
+    def _unindex_object(
+        self,
+        table: str,
+        id: t.Hashable,
+        object: t.Mapping[str, t.Any],
+        changed: t.Optional[t.Set[str]] = None,
+    ) -> None:
+        for properties, index in self.indices.get(table, {}).items():
+            if changed is not None and changed.isdisjoint(properties):
+                continue
+            key = tuple(hashable(object.get(p)) for p in properties)
+            ids = index.get(key, {})
+            ids.pop(id, None)
+            if not ids:
+                index.pop(key, None)
+        for property, fuzzy_index in self.fuzzy_indices.get(table, {}).items():
+            if changed is not None and property not in changed:
+                continue
+            fuzzy_index.remove(id, object.get(property))
+
+    def reindex(self, table: str):
+        """Forget the indices of a table, after its cached objects were changed."""
+        self.indices.pop(table, None)
+        self.fuzzy_indices.pop(table, None)
 
     def make_id_unique(self, object: Object) -> str:
         id = self.dataset[object.__table__, "id"].name
@@ -186,7 +336,51 @@ class DB:
                     return False
                 return edit_distance(x, y) <= edit_dist_threshold
 
+            properties_for_match = list(properties_for_match)
+            if not properties_for_match:
+                return list(self.cache[object.__table__])
+            # Use the q-gram index of each property to rule out most objects,
+            # then compute the edit distances for the remaining ones.
+            candidates: t.Optional[t.Dict[t.Hashable, None]] = None
+            for p in properties_for_match:
+                plausible = self.fuzzy_index(object.__table__, p).candidates(
+                    object.get(p), edit_dist_threshold
+                )
+                if candidates is None:
+                    candidates = dict.fromkeys(plausible)
+                else:
+                    plausible_set = set(plausible)
+                    candidates = {c: None for c in candidates if c in plausible_set}
+            cache = self.cache[object.__table__]
+            for p in properties_for_match:
+                value = object.get(p)
+                ids = list(candidates or ())
+                others = [cache[c].get(p) for c in ids]
+                if (
+                    value
+                    and isinstance(value, str)
+                    and all(o and isinstance(o, str) for o in others)
+                ):
+                    distances = edit_distance_matrix([value], others)[0]
+                    candidates = {
+                        c: None
+                        for c, d in zip(ids, distances)
+                        if d <= edit_dist_threshold
+                    }
+                else:
+                    candidates = {c: None for c in ids if match(cache[c].get(p), value)}
+            return list(candidates or ())
         else:
+            properties_for_match = tuple(properties_for_match)
+            try:
+                key = tuple(hashable(object.get(p)) for p in properties_for_match)
+                return list(
+                    self.index(object.__table__, properties_for_match).get(key, ())
+                )
+            except TypeError:
+                # Some value is not hashable, fall back to comparing with
+                # every cached object.
+                pass
 
             def match(x, y):
                 return x == y
@@ -329,16 +523,63 @@ class ExcelParser(t.Generic[R]):
         status_update: t.Optional[str] = None,
     ) -> None:
         languages = self.parse_all_languages(sheet)
-        row_object: t.Optional[R] = None
+        self.merge_rows(self.read_rows(sheet, languages), status_update=status_update)
+
+    def read_rows(
+        self,
+        sheet: openpyxl.worksheet.worksheet.Worksheet,
+        languages: t.Mapping[int, str],
+    ) -> t.Iterator[ParsedRow]:
+        """Parse the row headers and form cells of a sheet.
+
+        This is the pure parsing part of `parse_cells`: It does not look at or
+        modify the DB, apart from reading column names from the dataset, so it
+        can run in a worker process.
+
+        """
         for row in cli.tq(
             sheet.iter_rows(min_row=self.top),
             task="Parsing cells",
             total=sheet.max_row - self.top,
         ):
             row_header, row_forms = row[: self.left - 1], row[self.left - 1 :]
+            cells = []
+            for cell_with_forms in row_forms:
+                try:
+                    this_lan = languages[cell_with_forms.column]
+                except KeyError:
+                    continue
+                # Parse the cell, which results (potentially) in multiple forms
+                cells.append(
+                    (
+                        cell_with_forms,
+                        this_lan,
+                        list(
+                            self.cell_parser.parse(
+                                cell_with_forms,
+                                this_lan,
+                                f"{sheet.title}.{cell_with_forms.coordinate}",
+                            )
+                        ),
+                    )
+                )
+            yield ParsedRow(
+                properties=self.properties_from_row(row_header),
+                cell_identifier=row[0].coordinate,
+                has_forms=any(c.value for c in row_forms),
+                cells=cells,
+            )
+
+    def merge_rows(
+        self,
+        rows: t.Iterable[ParsedRow],
+        status_update: t.Optional[str] = None,
+    ) -> None:
+        """Add parsed rows to the DB, creating or matching the objects they describe."""
+        row_object: t.Optional[R] = None
+        for properties, cell_identifier, has_forms, cells in rows:
             # Parse the row header, creating or retrieving the associated row
             # object (i.e. a concept or a cognateset)
-            properties = self.properties_from_row(row_header)
             if properties:
                 c_r_id = self.db.dataset[properties.__table__, "id"].name
                 try:
@@ -353,7 +594,7 @@ class ExcelParser(t.Generic[R]):
                     break
                 else:
                     if self.on_row_not_found(
-                        properties, cell_identifier=row[0].coordinate
+                        properties, cell_identifier=cell_identifier
                     ):
                         if c_r_id not in properties:
                             properties[c_r_id] = string_to_id(
@@ -371,31 +612,21 @@ class ExcelParser(t.Generic[R]):
                     row_object = properties
 
             if row_object is None:
-                if any(c.value for c in row_forms):
+                if has_forms:
                     raise AssertionError(
                         "Your first data row didn't have a name. "
                         "Please check your format specification or ensure the first row has a name."
                     )
                 else:
                     continue
-            # Parse the row, cell by cell
-            for cell_with_forms in row_forms:
-                try:
-                    this_lan = languages[cell_with_forms.column]
-                except KeyError:
-                    continue
-
-                # Parse the cell, which results (potentially) in multiple forms
+            # Add the parsed cells, form by form
+            for cell_with_forms, this_lan, parsed_forms in cells:
                 if row_object.__table__ == "FormTable":
                     raise NotImplementedError(
                         "TODO: I am confused why what I'm doing right now ever landed on my agenda, but you seem to have gotten me to attempt it. Please contact the developers and tell them what you did, so they can implement the thing you tried to do properly!"
                     )
                     c_f_form = self.db.dataset[row_object.__table__, "form"].name
-                for params in self.cell_parser.parse(
-                    cell_with_forms,
-                    this_lan,
-                    f"{sheet.title}.{cell_with_forms.coordinate}",
-                ):
+                for params in parsed_forms:
                     if row_object.__table__ == "FormTable":
                         if params[c_f_form] == "?":
                             continue
@@ -757,13 +988,84 @@ def excel_parser_from_dialect(
     return SpecializedExcelParser
 
 
+def cognate_parser_class(
+    dataset: pycldf.Dataset,
+    dialect: t.Optional[argparse.Namespace],
+    logger: logging.Logger = cli.logger,
+) -> t.Type[ExcelCognateParser]:
+    """Pick the cognate Excel parser described by the dataset's dialect."""
+    if dialect:
+        try:
+            return excel_parser_from_dialect(
+                dataset, argparse.Namespace(**dialect.cognates), cognate=True
+            )
+        except (AttributeError, KeyError) as err:
+            field = re.match(r".*?'(.+?)'.+?'(.+?)'$", str(err)).group(2)
+            logger.warning(
+                f"User-defined format specification in the json-file was missing the key {field}, "
+                f"falling back to default parser"
+            )
+            return ExcelCognateParser
+    else:
+        logger.warning(
+            "User-defined format specification in the json-file was missing, falling back to default parser"
+        )
+        return ExcelCognateParser
+
+
+def read_cognate_sheet(
+    metadata: Path,
+    cognate_lexicon: Path,
+    sheet_title: str,
+    languages: t.Mapping[int, str],
+    use_dialect: bool = True,
+) -> t.List[ParsedRow]:
+    """Parse one sheet of a cognate workbook, for merging in another process.
+
+    This re-opens dataset and workbook, so that nothing but paths needs to be
+    sent to the worker process. The cells in the result are detached from the
+    worksheet, so that they can be sent back.
+
+    """
+    dataset = pycldf.Dataset.from_metadata(metadata)
+    if use_dialect:
+        dialect = argparse.Namespace(
+            **dataset.tablegroup.common_props["special:fromexcel"]
+        )
+        ECP = cognate_parser_class(dataset, dialect)(dataset, row_type=CogSet)
+    else:
+        ECP = ExcelCognateParser(dataset, row_type=CogSet)
+    workbook = openpyxl.load_workbook(cognate_lexicon, read_only=True)
+    rows = [
+        row._replace(
+            cells=[
+                (DetachedCell(cell.value, cell.coordinate), language, parsed)
+                for cell, language, parsed in row.cells
+            ]
+        )
+        for row in ECP.read_rows(
+            StreamingSheet(workbook[sheet_title], cognate_lexicon), languages
+        )
+    ]
+    workbook.close()
+    return rows
+
+
 def load_dataset(
     metadata: Path,
     lexicon: t.Optional[str],
     cognate_lexicon: t.Optional[str] = None,
     status_update: t.Optional[str] = None,
     logger: logging.Logger = cli.logger,
+    jobs: int = 1,
 ):
+    """Import a wordlist and/or a cognate workbook into the dataset.
+
+    With jobs > 1, the sheets of a multi-sheet cognate workbook are parsed by
+    that many worker processes. The result is the same as when parsing them
+    one after the other.
+
+    """
     # logging.basicConfig(filename="warnings.log")
     dataset = pycldf.Dataset.from_metadata(metadata)
     # load dialect from metadata
@@ -804,36 +1106,44 @@ def load_dataset(
 
         EP.db.empty_cache()
 
-        lexicon_wb = openpyxl.load_workbook(lexicon).active
-        EP.parse_cells(lexicon_wb, status_update=status_update)
+        lexicon_wb = openpyxl.load_workbook(lexicon, read_only=True)
+        EP.parse_cells(
+            StreamingSheet(lexicon_wb.active, lexicon), status_update=status_update
+        )
+        lexicon_wb.close()
         EP.db.write_dataset_from_cache()
 
     # load cognate dataset if provided by metadata
     if cognate_lexicon:
-        if dialect:
-            try:
-                ECP = excel_parser_from_dialect(
-                    dataset, argparse.Namespace(**dialect.cognates), cognate=True
-                )
-            except (AttributeError, KeyError) as err:
-                field = re.match(r".*?'(.+?)'.+?'(.+?)'$", str(err)).group(2)
-                logger.warning(
-                    f"User-defined format specification in the json-file was missing the key {field}, "
-                    f"falling back to default parser"
-                )
-                ECP = ExcelCognateParser
-        else:
-            logger.warning(
-                "User-defined format specification in the json-file was missing, falling back to default parser"
-            )
-            ECP = ExcelCognateParser
+        ECP_class = cognate_parser_class(dataset, dialect, logger=logger)
         # add Status_Column if not existing
         if status_update:
             add_status_column_to_table(dataset=dataset, table_name="CognateTable")
-        ECP = ECP(dataset, row_type=CogSet)
+        ECP = ECP_class(dataset, row_type=CogSet)
         ECP.db.cache_dataset()
-        for sheet in openpyxl.load_workbook(cognate_lexicon).worksheets:
-            ECP.parse_cells(sheet, status_update=status_update)
+        cognate_wb = openpyxl.load_workbook(cognate_lexicon, read_only=True)
+        sheets = [
+            StreamingSheet(sheet, cognate_lexicon) for sheet in cognate_wb.worksheets
+        ]
+        if jobs > 1 and len(sheets) > 1:
+            # Parsing the cells is the expensive part, and independent between
+            # sheets, so it happens in parallel. Matching the parsed objects
+            # against the DB must happen in order, so it stays in this process.
+            languages = [ECP.parse_all_languages(sheet) for sheet in sheets]
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                for rows in pool.map(
+                    read_cognate_sheet,
+                    repeat(metadata),
+                    repeat(cognate_lexicon),
+                    [sheet.title for sheet in sheets],
+                    languages,
+                    repeat(ECP_class is not ExcelCognateParser),
+                ):
+                    ECP.merge_rows(rows, status_update=status_update)
+        else:
+            for sheet in sheets:
+                ECP.parse_cells(sheet, status_update=status_update)
+        cognate_wb.close()
         ECP.db.write_dataset_from_cache()
 
 
@@ -866,11 +1176,24 @@ if __name__ == "__main__":
         help="Text written to Status_Column. Set to 'None' for no status update. "
         "(default: initial import)",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Parse the sheets of the cognate Excel file in N parallel processes. "
+        "(default: 1)",
+    )
     args = parser.parse_args()
     logger = cli.setup_logging(args)
 
     if args.status_update == "None":
         args.status_update = None
     load_dataset(
-        args.metadata, args.wordlist, args.cogsets, args.status_update, logger=logger
+        args.metadata,
+        args.wordlist,
+        args.cogsets,
+        args.status_update,
+        logger=logger,
+        jobs=args.jobs,
     )
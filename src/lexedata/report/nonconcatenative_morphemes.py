@@ -21,6 +21,7 @@ def segment_to_cognateset(
     cognatesets: t.Container[types.Cognateset_ID],
     logger: cli.logging.Logger = cli.logger,
 ) -> t.Mapping[types.Form_ID, t.List[t.Set[types.Cognateset_ID]]]:
+    dataset = util.DatasetSnapshot.of(dataset, logger=logger)
     # required fields
     c_cognate_cognateset = dataset.column_names.cognates.cognatesetReference
     c_cognate_id = dataset.column_names.cognates.id
@@ -136,9 +137,14 @@ if __name__ == "__main__":
         type=Path,
     )
 
+    cli.add_cache_controls(parser)
     args = parser.parse_args()
     logger = cli.setup_logging(args)
-    dataset = pycldf.Dataset.from_metadata(args.metadata)
+    dataset = util.DatasetSnapshot(
+        pycldf.Dataset.from_metadata(args.metadata),
+        logger=logger,
+        cache=args.cache,
+    )
     which_segment_belongs_to_which_cognateset = segment_to_cognateset(
         dataset=dataset,
         cognatesets=args.cognatesets,
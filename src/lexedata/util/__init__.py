@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 import re
+import csv
 import zipfile
+import functools
 import typing as t
+from pathlib import Path
 
 import unicodedata
 import unidecode as uni
+import numpy
 import networkx
 from lingpy.compare.strings import ldn_swap
 
@@ -14,8 +18,9 @@ from lexedata.cli import tq, logger
 
 from ..types import KeyKeyDict
 from . import fs
+from .snapshot import DatasetSnapshot
 
-__all__ = ["fs", "KeyKeyDict"]
+__all__ = ["fs", "KeyKeyDict", "DatasetSnapshot"]
 
 ID_FORMAT = re.compile("[a-z0-9_]+")
 
@@ -70,16 +75,214 @@ def normalize_string(text: str):
     return unicodedata.normalize("NFC", text.strip())
 
 
+@functools.lru_cache(maxsize=2**16)
+def distance_key(text: t.Optional[str]) -> str:
+    """Transliterate and lower-case a string for computing edit distances.
+
+    The results are cached, because the same strings tend to get compared
+    over and over.
+
+    >>> distance_key("Guaraní")
+    'guarani'
+    """
+    return uni.unidecode(text or "").lower()
+
+
 def edit_distance(text1: str, text2: str) -> float:
     # We request LingPy as dependency anyway, so use its implementation
     if not text1 and not text2:
         return 0.3
-    text1 = uni.unidecode(text1 or "").lower()
-    text2 = uni.unidecode(text2 or "").lower()
+    text1 = distance_key(text1)
+    text2 = distance_key(text2)
     length = max(len(text1), len(text2))
     return ldn_swap(text1, text2, normalized=False) / length
 
 
+def edit_distance_matrix(
+    strings_a: t.Sequence[t.Optional[str]], strings_b: t.Sequence[t.Optional[str]]
+) -> numpy.ndarray:
+    """Compute the edit_distance between all pairs of strings from two lists.
+
+    Each string is transliterated only once, and the distances between one
+    string from `strings_a` and all of `strings_b` are computed together, as
+    one numpy computation per character of the former.
+
+    >>> edit_distance_matrix(["Aché", "test", ""], ["ache", "tets", "", "tést"])
+    array([[0.  , 1.  , 1.  , 1.  ],
+           [1.  , 0.25, 1.  , 0.  ],
+           [1.  , 1.  , 0.3 , 1.  ]])
+
+    The entries are the same as those from edit_distance.
+
+    >>> edit_distance("test", "tets")
+    0.25
+
+    """
+    keys_a = [distance_key(s) for s in strings_a]
+    keys_b = [distance_key(s) for s in strings_b]
+    codes: t.Dict[str, int] = {}
+    for key in keys_a + keys_b:
+        for c in key:
+            codes.setdefault(c, len(codes))
+    n_b = len(keys_b)
+    lengths_b = numpy.array([len(key) for key in keys_b], dtype=int)
+    longest = int(lengths_b.max()) if n_b else 0
+    # Pad strings_b with a code that matches no character.
+    b = numpy.full((n_b, longest), -1, dtype=int)
+    for k, key in enumerate(keys_b):
+        b[k, : len(key)] = [codes[c] for c in key]
+    steps = numpy.arange(longest + 1)
+
+    distances = numpy.zeros((len(keys_a), n_b))
+    for i_a, key in enumerate(keys_a):
+        a = [codes[c] for c in key]
+        # Rows of the Levenshtein matrix, for all strings_b at once.
+        previous = numpy.tile(steps, (n_b, 1))
+        before_previous = previous
+        for i in range(1, len(a) + 1):
+            substitution = previous[:, :-1] + (b != a[i - 1])
+            best = numpy.minimum(previous[:, 1:] + 1, substitution)
+            if i > 1:
+                swap = (b[:, :-1] == a[i - 1]) & (b[:, 1:] == a[i - 2])
+                best[:, 1:] = numpy.where(
+                    swap,
+                    numpy.minimum(best[:, 1:], before_previous[:, :-2] + 1),
+                    best[:, 1:],
+                )
+            row = numpy.empty_like(previous)
+            row[:, 0] = i
+            row[:, 1:] = best
+            # Insertions: row[j] = min(row[j], row[j-1] + 1) for all j
+            row = numpy.minimum.accumulate(row - steps, axis=1) + steps
+            before_previous, previous = previous, row
+        raw = previous[numpy.arange(n_b), lengths_b]
+        length = numpy.maximum(lengths_b, len(a))
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            distances[i_a] = numpy.where(length > 0, raw / length, 0.3)
+    # edit_distance treats two empty strings specially.
+    empty_a = numpy.array([not s for s in strings_a], dtype=bool)
+    empty_b = numpy.array([not s for s in strings_b], dtype=bool)
+    distances[numpy.outer(empty_a, empty_b)] = 0.3
+    return distances
+
+
+class FuzzyIndex:
+    """A q-gram index to find strings within an edit_distance threshold.
+
+    Checking a string against many others with edit_distance is expensive. This
+    index stores the transliterated, lower-cased keys that edit_distance
+    compares, and uses their lengths and shared q-grams to rule out most
+    stored strings before the actual distance is computed. The filter is
+    conservative: Every stored string within the threshold is returned as a
+    candidate, but candidates still need to be checked with edit_distance.
+
+    >>> index = FuzzyIndex()
+    >>> index.add("a", "Aché")
+    >>> index.add("b", "Guaraní")
+    >>> index.add("c", "Ache")
+    >>> list(index.candidates("ache", 0.25))
+    ['a', 'c']
+    >>> [id for id in index.candidates("Guarani", 0.2)]
+    ['b']
+
+    Values that are not strings are always candidates.
+
+    >>> index.add("d", ["a", "list"])
+    >>> list(index.candidates("Guarani", 0.2))
+    ['b', 'd']
+
+    """
+
+    def __init__(self, q: int = 2):
+        self.q = q
+        self.ids_by_key: t.Dict[str, t.Dict[t.Hashable, None]] = {}
+        self.keys_by_length: t.Dict[int, t.Dict[str, None]] = {}
+        self.keys_by_gram: t.Dict[str, t.Dict[str, int]] = {}
+        self.empty: t.Dict[t.Hashable, None] = {}
+        self.other: t.Dict[t.Hashable, None] = {}
+
+    def qgrams(self, key: str) -> t.Dict[str, int]:
+        """Count the q-grams of a key, padded at both ends."""
+        padded = "\0" * (self.q - 1) + key + "\0" * (self.q - 1)
+        counts: t.Dict[str, int] = {}
+        for i in range(len(padded) - self.q + 1):
+            gram = padded[i : i + self.q]
+            counts[gram] = counts.get(gram, 0) + 1
+        return counts
+
+    def add(self, id: t.Hashable, text: t.Any) -> None:
+        if not text:
+            self.empty[id] = None
+            return
+        if not isinstance(text, str):
+            self.other[id] = None
+            return
+        key = distance_key(text)
+        ids = self.ids_by_key.setdefault(key, {})
+        if not ids:
+            self.keys_by_length.setdefault(len(key), {})[key] = None
+            for gram, count in self.qgrams(key).items():
+                self.keys_by_gram.setdefault(gram, {})[key] = count
+        ids[id] = None
+
+    def remove(self, id: t.Hashable, text: t.Any) -> None:
+        if not text:
+            self.empty.pop(id, None)
+            return
+        if not isinstance(text, str):
+            self.other.pop(id, None)
+            return
+        key = distance_key(text)
+        ids = self.ids_by_key.get(key, {})
+        ids.pop(id, None)
+        if not ids:
+            self.ids_by_key.pop(key, None)
+            self.keys_by_length.get(len(key), {}).pop(key, None)
+            for gram in self.qgrams(key):
+                self.keys_by_gram.get(gram, {}).pop(key, None)
+
+    def candidates(self, text: t.Any, threshold: float) -> t.Iterator[t.Hashable]:
+        """Find all stored IDs whose text might be within threshold of text."""
+        if not text:
+            # Two empty strings have distance 0.3, an empty and a non-empty
+            # string never match.
+            if threshold >= 0.3:
+                yield from self.empty
+            yield from self.other
+            return
+        if not isinstance(text, str):
+            yield from self.other
+            return
+        key = distance_key(text)
+        n = len(key)
+        # Each insertion, deletion or substitution changes at most q q-grams,
+        # each transposition at most q+1, so strings at distance k share at
+        # least max(n, m) + q - 1 - k(q+1) of their q-grams.
+        common: t.Optional[t.Dict[str, int]] = None
+        for m, keys in self.keys_by_length.items():
+            longer = max(n, m)
+            max_distance = int(threshold * longer + 1e-9)
+            if abs(n - m) > max_distance:
+                continue
+            required = longer + self.q - 1 - max_distance * (self.q + 1)
+            if required <= 0:
+                candidate_keys: t.Iterable[str] = keys
+            else:
+                if common is None:
+                    common = {}
+                    for gram, count in self.qgrams(key).items():
+                        for other, other_count in self.keys_by_gram.get(
+                            gram, {}
+                        ).items():
+                            common[other] = common.get(other, 0) + min(
+                                count, other_count
+                            )
+                candidate_keys = [k for k in keys if common.get(k, 0) >= required]
+            for k in candidate_keys:
+                yield from self.ids_by_key[k]
+        yield from self.other
+
+
 def load_clics():
     """Load CLICS as networkx Graph.
 
@@ -178,7 +381,7 @@ def cache_table(
     table: t.Optional[str] = None,
     columns: t.Optional[t.Mapping[str, str]] = None,
     index_column: str = "id",
-    filter: t.Callable[[t.Mapping[str, t.Any]], bool] = lambda e: True,
+    filter: t.Optional[t.Callable[[t.Mapping[str, t.Any]], bool]] = None,
 ) -> t.Mapping[str, t.Mapping[str, t.Any]]:
     """Load a dataset table into memory as a dictionary of dictionaries.
 
@@ -218,6 +421,15 @@ def cache_table(
 
     In this case identical values later in the file overwrite earlier ones.
 
+    If the dataset is a DatasetSnapshot, the table is not parsed again. Instead,
+    the result is a read-only view on the snapshot, which builds a new row
+    dictionary every time a row is accessed.
+
+    >>> snapshot = DatasetSnapshot(ds)
+    >>> languages = cache_table(snapshot, "LanguageTable", {"id": "ID"}, index_column="Name")
+    >>> languages["Aché"]
+    {'id': 'ache'}
+
     """
     if table is None:
         table = dataset.primary_table
@@ -229,7 +441,14 @@ def cache_table(
             (cldf_property(c.propertyUrl) if c.propertyUrl else c.name): c.name
             for c in dataset[table].tableSchema.columns
         }
+    if isinstance(dataset, DatasetSnapshot):
+        return dataset.view(table, columns, index_column, filter)
     c_id = dataset[table, index_column].name
+    if filter is None:
+
+        def filter(row: t.Mapping[str, t.Any]) -> bool:
+            return True
+
     return {
         row[c_id]: {prop: row[name] for prop, name in columns.items()}
         for row in tq(
@@ -241,6 +460,110 @@ def cache_table(
     }
 
 
+def _plain_csv(dialect: csvw.Dialect) -> bool:
+    """Check whether the stdlib csv reader alone can parse this dialect."""
+    return (
+        dialect.header
+        and dialect.headerRowCount == 1
+        and not dialect.skipRows
+        and not dialect.skipColumns
+        and not dialect.skipBlankRows
+        and not dialect.commentPrefix
+        and dialect.trim in (False, "false")
+    )
+
+
+def read_columns(
+    dataset,
+    table: str,
+    columns: t.Mapping[str, str],
+) -> t.Iterator[t.Dict[str, t.Any]]:
+    """Read some columns of a table, without parsing the others.
+
+    Yield one dictionary per row, mapping each key of `columns` to the value
+    in the column of that name. Values of columns with a separator are split
+    into lists, and null values are None, or empty lists for columns with a
+    separator.
+
+    Where this is possible – all requested columns contain strings, and the
+    table file is a plain CSV file with one header row – the file is read
+    with the stdlib csv module, and only the requested columns are looked at.
+    If the dataset is a DatasetSnapshot, the values come straight from its
+    column storage. Otherwise, the rows come from the usual table iterator.
+
+    >>> ds = fs.new_wordlist(FormTable=[
+    ...     {"ID": "ache_one", "Language_ID": "ache", "Parameter_ID": "one",
+    ...      "Form": "e.ta.'kɾã", "Comment": "not read"},
+    ...     {"ID": "ache_two", "Language_ID": "ache", "Parameter_ID": "two",
+    ...      "Form": None}])
+    >>> for row in read_columns(ds, "FormTable", {"id": "ID", "form": "Form"}):
+    ...     print(row)
+    {'id': 'ache_one', 'form': "e.ta.'kɾã"}
+    {'id': 'ache_two', 'form': None}
+
+    """
+    csvw_table = dataset[table]
+    specs = [(key, dataset[table, name]) for key, name in columns.items()]
+    if isinstance(dataset, DatasetSnapshot):
+        keys = [key for key, _ in specs]
+        for values in zip(*[csvw_table.columns[column.name] for _, column in specs]):
+            yield {
+                key: list(value) if isinstance(value, list) else value
+                for key, value in zip(keys, values)
+            }
+        return
+    dialect = csvw_table.dialect or dataset.tablegroup.dialect or csvw.Dialect()
+    path = Path(csvw_table.url.resolve(csvw_table.base))
+    if (
+        path.exists()
+        and _plain_csv(dialect)
+        and all(
+            not column.virtual
+            and (column.datatype is None or column.datatype.base == "string")
+            for _, column in specs
+        )
+    ):
+        yield from _read_csv_columns(path, dialect, specs)
+        return
+    for row in csvw_table:
+        yield {key: row[column.name] for key, column in specs}
+
+
+def _read_csv_columns(
+    path: Path, dialect: csvw.Dialect, specs: t.Sequence[t.Tuple[str, t.Any]]
+) -> t.Iterator[t.Dict[str, t.Any]]:
+    encoding = dialect.python_encoding
+    if encoding == "utf-8":
+        # Like csvw, ignore a byte order mark.
+        encoding = "utf-8-sig"
+    parameters = dialect.as_python_formatting_parameters()
+    parameters.pop("lineterminator", None)
+    with path.open(encoding=encoding, newline="") as file:
+        reader = csv.reader(file, **parameters)
+        header = next(reader, None)
+        if header is None:
+            return
+        position = {name: i for i, name in enumerate(header)}
+        fields = [
+            (
+                key,
+                position.get(column.header),
+                column.separator,
+                set(column.null or [""]),
+            )
+            for key, column in specs
+        ]
+        for row in reader:
+            values = {}
+            for key, i, separator, null in fields:
+                value = row[i] if i is not None and i < len(row) else ""
+                if separator:
+                    values[key] = [] if value in null else value.split(separator)
+                else:
+                    values[key] = None if value in null else value
+            yield values
+
+
 def normalize_table_name(name, dataset, logger=logger):
     try:
         return str(dataset[name].url)
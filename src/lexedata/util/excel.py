@@ -5,9 +5,22 @@
 
 import re
 import typing as t
+import functools
 import unicodedata
+from pathlib import Path
 
 import openpyxl as op
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.comments.comment_sheet import CommentSheet
+from openpyxl.packaging.relationship import get_dependents, get_rels_path
+from openpyxl.utils.cell import (
+    coordinate_to_tuple,
+    get_column_letter,
+    range_boundaries,
+)
+from openpyxl.worksheet.hyperlink import Hyperlink
+from openpyxl.xml.constants import COMMENTS_NS, SHEET_MAIN_NS
+from openpyxl.xml.functions import fromstring, iterparse
 
 import pycldf
 
@@ -68,6 +81,469 @@ def normalize_header(row: t.Iterable[op.cell.Cell]) -> t.Iterable[str]:
     return header
 
 
+class StreamedCell:
+    """A cell of a StreamingSheet: Just a value and its position.
+
+    The cell quacks like an openpyxl cell for everything the importers need.
+    Its comment and hyperlink are looked up in the parent sheet on access.
+    """
+
+    __slots__ = ("parent", "row", "column", "value")
+
+    def __init__(self, parent: "StreamingSheet", row: int, column: int, value):
+        self.parent = parent
+        self.row = row
+        self.column = column
+        self.value = value
+
+    @property
+    def coordinate(self) -> str:
+        return f"{get_column_letter(self.column)}{self.row}"
+
+    @property
+    def column_letter(self) -> str:
+        return get_column_letter(self.column)
+
+    @property
+    def comment(self) -> t.Optional[op.comments.Comment]:
+        return self.parent.comment_at(self.row, self.column)
+
+    @property
+    def hyperlink(self) -> t.Optional[Hyperlink]:
+        return self.parent.hyperlink_at(self.row, self.column)
+
+    def __repr__(self):
+        return f"<Cell {self.parent.title!r}.{self.coordinate}>"
+
+
+class StreamingSheet:
+    """A low-memory view of a worksheet opened with ``read_only=True``.
+
+    Rows are streamed as plain values, without building openpyxl's cell
+    objects and their styles. Cell comments and hyperlinks are not available
+    from read-only worksheets, so they are read from the workbook archive in
+    a separate pass – but only once some cell actually asks for one, so
+    sheets where nobody looks at comments or links never pay for them.
+
+    Excel files are stored row by row, so only `iter_rows` really streams.
+    `iter_cols` has to hold the values of its whole range in memory, and
+    `cell` reads the sheet from the top for every new row it looks at, so it
+    is meant for occasional lookups only. The dimensions of the sheet take one
+    more pass, the first time they are needed.
+
+    Reading comments and hyperlinks from the archive relies on openpyxl
+    internals. If those are not there, the sheet is instead loaded normally
+    from `filename` for its comments and links, which costs the memory
+    `read_only` was meant to save.
+
+    >>> import tempfile
+    >>> from openpyxl.comments import Comment
+    >>> wb = op.Workbook()
+    >>> wb.active["A1"] = "header"
+    >>> wb.active["A1"].comment = Comment("A note", "lexedata")
+    >>> wb.active["B2"] = "link"
+    >>> wb.active["B2"].hyperlink = "https://example.org/lexicon/form1"
+    >>> _, filename = tempfile.mkstemp(suffix=".xlsx")
+    >>> wb.save(filename)
+    >>> wb = op.load_workbook(filename, read_only=True)
+    >>> sheet = StreamingSheet(wb.active, filename)
+    >>> [[cell.value for cell in row] for row in sheet.iter_rows()]
+    [['header', None], [None, 'link']]
+    >>> [cell.coordinate for cell in next(sheet.iter_cols(min_col=2))]
+    ['B1', 'B2']
+    >>> get_cell_comment(sheet.cell(1, 1))
+    'A note'
+    >>> sheet.cell(2, 2).hyperlink.target
+    'https://example.org/lexicon/form1'
+    >>> sheet.cell(2, 1).hyperlink is None
+    True
+    >>> wb.close()
+
+    """
+
+    def __init__(self, worksheet, filename: t.Union[str, Path, None] = None):
+        self.worksheet = worksheet
+        self.title = worksheet.title
+        self.filename = filename
+        self._dimensions: t.Optional[t.Tuple[int, int]] = None
+        self._row: t.Tuple[int, t.Tuple[t.Any, ...]] = (0, ())
+        self._comments: t.Optional[t.Dict[t.Tuple[int, int], t.Any]] = None
+        self._hyperlinks: t.Optional[t.Dict[t.Tuple[int, int], Hyperlink]] = None
+
+    @property
+    def max_row(self) -> int:
+        return self.dimensions()[0]
+
+    @property
+    def max_column(self) -> int:
+        return self.dimensions()[1]
+
+    def dimensions(self) -> t.Tuple[int, int]:
+        """Find the last row and column that contain any value.
+
+        The dimensions declared in the file are often wrong (Excel likes to
+        claim all 1048576 rows when a whole column has been formatted), so
+        this counts for itself, in one streaming pass over the values.
+        """
+        if self._dimensions is None:
+            self.worksheet.reset_dimensions()
+            max_row = max_column = 0
+            for r, values in enumerate(self.worksheet.iter_rows(values_only=True), 1):
+                filled = [c for c, value in enumerate(values, 1) if value is not None]
+                if filled:
+                    max_row = r
+                    max_column = max(max_column, filled[-1])
+            self._dimensions = max_row, max_column
+        return self._dimensions
+
+    def iter_rows(
+        self,
+        min_row: int = 1,
+        max_row: t.Optional[int] = None,
+        min_col: int = 1,
+        max_col: t.Optional[int] = None,
+    ) -> t.Iterator[t.Tuple[StreamedCell, ...]]:
+        max_row = max_row or self.max_row
+        max_col = max_col or self.max_column
+        if max_row < min_row:
+            return
+        for r, values in enumerate(
+            self.worksheet.iter_rows(
+                min_row=min_row,
+                max_row=max_row,
+                min_col=min_col,
+                max_col=max_col,
+                values_only=True,
+            ),
+            min_row,
+        ):
+            yield tuple(
+                StreamedCell(self, r, c, value)
+                for c, value in enumerate(values, min_col)
+            )
+
+    def iter_cols(
+        self,
+        min_col: int = 1,
+        max_col: t.Optional[int] = None,
+        min_row: int = 1,
+        max_row: t.Optional[int] = None,
+    ) -> t.Iterator[t.Tuple[StreamedCell, ...]]:
+        # Excel files are stored row by row, so this has to read all rows in
+        # range before it can return the first column. Keep only the plain
+        # values of the range, and build the cells of one column at a time.
+        # Restrict the range where possible.
+        max_row = max_row or self.max_row
+        max_col = max_col or self.max_column
+        if max_row < min_row or max_col < min_col:
+            return
+        columns: t.List[t.List[t.Any]] = [[] for _ in range(min_col, max_col + 1)]
+        for values in self.worksheet.iter_rows(
+            min_row=min_row,
+            max_row=max_row,
+            min_col=min_col,
+            max_col=max_col,
+            values_only=True,
+        ):
+            for column, value in zip(columns, values):
+                column.append(value)
+        for c, values in enumerate(columns, min_col):
+            yield tuple(
+                StreamedCell(self, r, c, value)
+                for r, value in enumerate(values, min_row)
+            )
+            values.clear()
+
+    def cell(self, row: int, column: int) -> StreamedCell:
+        # Remember the last row read, so looking at several cells of the same
+        # row reads it only once.
+        if self._row[0] != row:
+            values: t.Tuple[t.Any, ...] = ()
+            for values in self.worksheet.iter_rows(
+                min_row=row, max_row=row, values_only=True
+            ):
+                break
+            self._row = row, values
+        values = self._row[1]
+        value = values[column - 1] if column <= len(values) else None
+        return StreamedCell(self, row, column, value)
+
+    def comment_at(self, row: int, column: int) -> t.Optional[op.comments.Comment]:
+        if self._comments is None:
+            try:
+                self._comments = self._read_comments()
+            except AttributeError:
+                self._read_full_sheet()
+                assert self._comments is not None
+        return self._comments.get((row, column))
+
+    def hyperlink_at(self, row: int, column: int) -> t.Optional[Hyperlink]:
+        if self._hyperlinks is None:
+            try:
+                self._hyperlinks = self._read_hyperlinks()
+            except AttributeError:
+                self._read_full_sheet()
+                assert self._hyperlinks is not None
+        return self._hyperlinks.get((row, column))
+
+    def _relationships(self):
+        archive = self.worksheet.parent._archive
+        rels_path = get_rels_path(self.worksheet._worksheet_path)
+        if rels_path not in archive.namelist():
+            return []
+        return get_dependents(archive, rels_path)
+
+    def _read_comments(self) -> t.Dict[t.Tuple[int, int], op.comments.Comment]:
+        archive = self.worksheet.parent._archive
+        comments = {}
+        for rel in self._relationships():
+            if rel.Type != COMMENTS_NS:
+                continue
+            comment_sheet = CommentSheet.from_tree(fromstring(archive.read(rel.target)))
+            for ref, comment in comment_sheet.comments:
+                comments[coordinate_to_tuple(ref)] = comment
+        return comments
+
+    def _read_hyperlinks(self) -> t.Dict[t.Tuple[int, int], Hyperlink]:
+        # Hyperlinks are stored in the sheet XML itself, after all the cell
+        # data, so this is a streaming pass over the whole sheet which keeps
+        # nothing but the links.
+        targets = {rel.id: rel.Target for rel in self._relationships()}
+        hyperlinks = {}
+        row_tag = f"{{{SHEET_MAIN_NS}}}row"
+        hyperlink_tag = f"{{{SHEET_MAIN_NS}}}hyperlink"
+        with self.worksheet._get_source() as source:
+            for _, element in iterparse(source):
+                if element.tag == row_tag:
+                    element.clear()
+                elif element.tag == hyperlink_tag:
+                    link = Hyperlink.from_tree(element)
+                    if link.id:
+                        link.target = targets.get(link.id)
+                    min_col, min_row, max_col, max_row = range_boundaries(link.ref)
+                    for r in range(min_row, max_row + 1):
+                        for c in range(min_col, max_col + 1):
+                            hyperlinks[r, c] = link
+        return hyperlinks
+
+    def _read_full_sheet(self) -> None:
+        # The openpyxl internals used above are gone, so load the sheet the
+        # expensive way, and keep nothing but its comments and hyperlinks.
+        self._comments, self._hyperlinks = {}, {}
+        if self.filename is None:
+            cli.logger.warning(
+                f"Cannot read comments and hyperlinks of sheet {self.title} with this version of openpyxl. Treating the sheet as if it had none."
+            )
+            return
+        workbook = op.load_workbook(self.filename)
+        for row in workbook[self.title].iter_rows():
+            for cell in row:
+                if cell.comment:
+                    self._comments[cell.row, cell.column] = cell.comment
+                if cell.hyperlink:
+                    self._hyperlinks[cell.row, cell.column] = cell.hyperlink
+        workbook.close()
+
+
+class WriteOnlySheet:
+    """A buffer in front of a worksheet of a ``write_only=True`` workbook.
+
+    Cells are created with `cell(row=…, column=…, value=…)` like on a normal
+    worksheet, in any order, but only for rows that have not been written
+    yet. `flush` writes the buffered rows in order to the write-only
+    worksheet, after which they are no longer kept in memory.
+
+    >>> wb = op.Workbook(write_only=True)
+    >>> ws = WriteOnlySheet(wb.create_sheet())
+    >>> ws.append(["header"])
+    >>> ws.cell(row=3, column=2, value="b").value
+    'b'
+    >>> ws.cell(row=2, column=1, value="a").value
+    'a'
+    >>> ws.flush()
+    >>> ws.cell(row=3, column=1)
+    Traceback (most recent call last):
+      ...
+    ValueError: Row 3 has already been written.
+    >>> import tempfile
+    >>> wb.save(tempfile.mkstemp(suffix=".xlsx")[1])
+
+    """
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.next_row = 1
+        self.rows: t.Dict[int, t.Dict[int, WriteOnlyCell]] = {}
+
+    def cell(self, row: int, column: int, value=None) -> WriteOnlyCell:
+        if row < self.next_row:
+            raise ValueError(f"Row {row} has already been written.")
+        cell = WriteOnlyCell(self.worksheet, value=value)
+        self.rows.setdefault(row, {})[column] = cell
+        return cell
+
+    def append(self, values: t.Iterable[t.Any]) -> None:
+        """Write a row of values directly after all buffered rows."""
+        self.flush()
+        self.worksheet.append(list(values))
+        self.next_row += 1
+
+    def flush(self, before: t.Optional[int] = None) -> None:
+        """Write all buffered rows before row number `before`, or all rows."""
+        if before is None:
+            before = max(self.rows, default=0) + 1
+        for row in range(self.next_row, before):
+            cells = self.rows.pop(row, {})
+            self.worksheet.append(
+                [cells.get(c) for c in range(1, max(cells, default=0) + 1)]
+            )
+        self.next_row = max(self.next_row, before)
+
+
+class BracketGrammar:
+    """Bracket pairs, compiled for scanning strings in one pass.
+
+    The matching rules are those of `check_brackets` and
+    `components_in_brackets`: At every position, first try to close the
+    innermost open bracket, then try the pairs in order, opening before
+    closing. A compiled pattern of all delimiters lets the scanner jump
+    straight to the next position where any delimiter starts, so the Python
+    loop runs once per delimiter instead of once per character.
+
+    >>> g = BracketGrammar({"(": ")", "[": "]"})
+    >>> g.check("a (b [c]) d")
+    True
+    >>> g.components("a (b [c]) d")
+    ['a ', '(b [c])', ' d']
+    >>> g.split("a (b, c), d", re.compile("([;,])"))
+    (['a (b, c)', ' d'], True)
+    >>> g.split("a (b, c, d", re.compile("([;,])"))
+    (['a (b, c, d'], False)
+    """
+
+    def __init__(self, bracket_pairs: t.Mapping[str, str]):
+        self.bracket_pairs = dict(bracket_pairs)
+        delimiters = set(self.bracket_pairs) | {
+            closing for closing in self.bracket_pairs.values() if closing
+        }
+        self.longest = max((len(d) for d in delimiters), default=1)
+        self.delimiters = re.compile(
+            "|".join(re.escape(d) for d in sorted(delimiters, key=len, reverse=True))
+            or "(?!)"
+        )
+
+    def scan(
+        self,
+        string: str,
+        i: int,
+        waiting_for: t.List[str],
+        stop: int,
+        end: int,
+    ) -> t.Tuple[int, bool]:
+        """Match brackets in string[i:stop], looking no further than end.
+
+        waiting_for is the stack of expected closing brackets, innermost last,
+        and it is updated in place. Return the position where scanning stopped,
+        and False if a closing bracket turned up that was not expected.
+
+        """
+        pairs = self.bracket_pairs.items()
+        while i < stop:
+            if waiting_for and string.startswith(waiting_for[-1], i, end):
+                i += len(waiting_for.pop())
+                continue
+            for opening, closing in pairs:
+                if string.startswith(opening, i, end):
+                    waiting_for.append(closing)
+                    i += len(opening)
+                    break
+                elif closing and string.startswith(closing, i, end):
+                    return i, False
+            else:
+                next_delimiter = self.delimiters.search(string, i + 1, end)
+                i = next_delimiter.start() if next_delimiter else end
+        return i, True
+
+    def check(self, string: str) -> bool:
+        """Check whether all brackets in the string match."""
+        waiting_for: t.List[str] = []
+        _, ok = self.scan(string, 0, waiting_for, len(string), len(string))
+        return ok and not any(waiting_for)
+
+    def components(self, string: str) -> t.List[str]:
+        """Split the string into bracketed elements and the text between them."""
+        elements = []
+        pairs = self.bracket_pairs.items()
+        waiting_for: t.List[str] = []
+        start = i = 0
+        while i < len(string):
+            if waiting_for and string.startswith(waiting_for[-1], i):
+                i += len(waiting_for.pop())
+                if not any(waiting_for):
+                    elements.append(string[start:i])
+                    start = i
+                continue
+            for opening, closing in pairs:
+                if string.startswith(opening, i):
+                    if not any(waiting_for):
+                        elements.append(string[start:i])
+                        start = i
+                    waiting_for.append(closing)
+                    i += len(opening)
+                    break
+            else:
+                next_delimiter = self.delimiters.search(string, i + 1)
+                i = next_delimiter.start() if next_delimiter else len(string)
+        return elements + [string[start:]]
+
+    def split(
+        self, string: str, separator: t.Pattern[str]
+    ) -> t.Tuple[t.List[str], bool]:
+        """Split the string at separators which are not inside brackets.
+
+        Return the pieces, and whether the brackets in the last piece match.
+        Once a piece contains an unexpected closing bracket, the rest of the
+        string stays in that piece.
+
+        """
+        pieces = []
+        waiting_for: t.List[str] = []
+        ok = True
+        start = i = 0
+        for match in separator.finditer(string):
+            before, after = match.span()
+            if ok:
+                # Everything up to here is decided the same way, whatever
+                # follows the separator.
+                i, ok = self.scan(
+                    string, i, waiting_for, before - self.longest + 1, len(string)
+                )
+            if not ok:
+                break
+            # Near the separator, check what the piece would look like if it
+            # ended there, without committing to it.
+            tail = waiting_for[:]
+            _, tail_ok = self.scan(string, i, tail, before, before)
+            if tail_ok and not any(tail):
+                pieces.append(string[start:before])
+                waiting_for = []
+                start = i = after
+        if ok:
+            _, ok = self.scan(string, i, waiting_for, len(string), len(string))
+        pieces.append(string[start:])
+        return pieces, ok and not any(waiting_for)
+
+
+@functools.lru_cache(maxsize=None)
+def _bracket_grammar(bracket_pairs: t.Tuple[t.Tuple[str, str], ...]) -> BracketGrammar:
+    return BracketGrammar(dict(bracket_pairs))
+
+
+def bracket_grammar(bracket_pairs: t.Mapping[str, str]) -> BracketGrammar:
+    """Compile bracket pairs into a grammar, re-using earlier compilations."""
+    return _bracket_grammar(tuple(bracket_pairs.items()))
+
+
 def check_brackets(string, bracket_pairs):
     """Check whether all brackets match.
 
@@ -123,22 +599,7 @@ def check_brackets(string, bracket_pairs):
     >>> check_brackets("!(te[xt!)]", b)
     True
     """
-    waiting_for = []
-    i = 0
-    while i < len(string):
-        if waiting_for and string[i:].startswith(waiting_for[0]):
-            i += len(waiting_for.pop(0))
-        else:
-            for q, p in bracket_pairs.items():
-                if string[i:].startswith(q):
-                    waiting_for.insert(0, p)
-                    i += len(q)
-                    break
-                elif p and string[i:].startswith(p):
-                    return False
-            else:
-                i += 1
-    return not any(waiting_for)
+    return bracket_grammar(bracket_pairs).check(string)
 
 
 def components_in_brackets(form_string, bracket_pairs):
@@ -156,38 +617,7 @@ def components_in_brackets(form_string, bracket_pairs):
     ['', '/aha (exclam. !/ int., also /ah/)']
 
     """
-    elements = []
-
-    i = 0
-    remainder = form_string
-    waiting_for = []
-    while i < len(remainder):
-        if waiting_for and remainder[i:].startswith(waiting_for[0]):
-            i += len(waiting_for.pop(0))
-            if not any(waiting_for):
-                elements.append(remainder[:i])
-                remainder = remainder[i:]
-                i = 0
-        else:
-            for q, p in bracket_pairs.items():
-                if remainder[i:].startswith(q):
-                    if not any(waiting_for):
-                        elements.append(remainder[:i])
-                        remainder = remainder[i:]
-                        i = 0
-                    waiting_for.insert(0, p)
-                    i += len(q)
-                    break
-                # elif p and remainder[i:].startswith(p):
-                #     # TODO: @Geroen: do we need this warning? I think this case is better handled in parse_form...
-                #     logger.info(
-                #         f"{context:}In form {form_string}: Encountered mismatched closing delimiter {p}. "
-                #         f"This could be a bigger problem in the cell, so the form was not imported."
-                #    )
-            else:
-                i += 1
-
-    return elements + [remainder]
+    return bracket_grammar(bracket_pairs).components(form_string)
 
 
 class NaiveCellParser:
@@ -312,6 +742,9 @@ class CellParser(NaiveCellParser):
 
         # Other class attributes
         self.separation_pattern = separation_pattern
+        # Compile the delimiters once, instead of for every cell
+        self.grammar = bracket_grammar(self.bracket_pairs)
+        self.separator = re.compile(separation_pattern)
         self.variant_separator = variant_separator
         self.add_default_source = add_default_source
 
@@ -376,31 +809,25 @@ class CellParser(NaiveCellParser):
         so that the form parser can try to recover as much as possible or throw
         an exception.
         """
-        raw_split = re.split(self.separation_pattern, values)
-        if len(raw_split) <= 1:
-            for form in raw_split:
-                yield form
+        if not self.separator.search(values):
+            yield values
             return
 
-        while len(raw_split) > 1:
-            if check_brackets(raw_split[0], self.bracket_pairs):
-                form = raw_split.pop(0).strip()
-                if form:
-                    yield form
-                raw_split.pop(0)
-            else:
-                raw_split[:2] = ["".join(raw_split[:2])]
-        if not check_brackets(raw_split[0], self.bracket_pairs):
+        raw_split, balanced = self.grammar.split(values, self.separator)
+        for form in raw_split[:-1]:
+            form = form.strip()
+            if form:
+                yield form
+        if not balanced:
             logger.warning(
                 f"{context:}In values {values:}: "
                 "Encountered mismatched closing delimiters. Please check that the "
                 "separation of the cell into multiple entries, for different forms, was correct."
             )
 
-        form = raw_split.pop(0).strip()
+        form = raw_split[-1].strip()
         if form:
             yield form
-        assert not raw_split
 
     def parse_form(
         self,
@@ -432,7 +859,7 @@ class CellParser(NaiveCellParser):
         # '%', see below.
         expect_variant: t.Optional[str] = None
         # Iterate over the delimiter-separated elements of the form.
-        for element in components_in_brackets(form_string, self.bracket_pairs):
+        for element in self.grammar.components(form_string):
             element = element.strip()
 
             if not element:
@@ -441,7 +868,7 @@ class CellParser(NaiveCellParser):
             # If the element has mismatched brackets (tends to happen only for
             # the last element, because a mismatched opening bracket means we
             # are still waiting for the closing one), warn.
-            if not check_brackets(element, self.bracket_pairs):
+            if not self.grammar.check(element):
                 try:
                     delimiter = self.bracket_pairs[element[0]]
                 except KeyError:
@@ -8,6 +8,7 @@ import pycldf
 
 from lexedata import types
 from lexedata.util.add_metadata import add_metadata
+from lexedata.util.snapshot import DatasetSnapshot
 
 
 def new_wordlist(
@@ -61,7 +62,9 @@ def new_wordlist(
     return dataset
 
 
-def get_dataset(fname: Path) -> pycldf.Dataset:
+def get_dataset(
+    fname: Path, cache: bool = False
+) -> t.Union[pycldf.Dataset, DatasetSnapshot]:
     """Load a CLDF dataset.
 
     Load the file as `json` CLDF metadata description file, or as metadata-free
@@ -72,10 +75,16 @@ def get_dataset(fname: Path) -> pycldf.Dataset:
     CLDF module specifications. Directories are checked for the presence of
     any CLDF datasets in undefined order of the dataset types.
 
+    With `cache`, return a DatasetSnapshot of the dataset that keeps parsed
+    tables in the user's cache directory, and re-uses them as long as the
+    table files are unchanged.
+
     Parameters
     ----------
     fname : str or Path
         Path to a CLDF dataset
+    cache : bool
+        Whether to use the on-disk cache of parsed tables
 
     Returns
     -------
@@ -85,8 +94,12 @@ def get_dataset(fname: Path) -> pycldf.Dataset:
     if not fname.exists():
         raise FileNotFoundError("{:} does not exist".format(fname))
     if fname.suffix == ".json":
-        return pycldf.dataset.Dataset.from_metadata(fname)
-    return pycldf.dataset.Dataset.from_data(fname)
+        dataset = pycldf.dataset.Dataset.from_metadata(fname)
+    else:
+        dataset = pycldf.dataset.Dataset.from_data(fname)
+    if cache:
+        return DatasetSnapshot(dataset, cache=True)
+    return dataset
 
 
 def copy_dataset(original: Path, target: Path) -> pycldf.Dataset:
@@ -1,4 +1,8 @@
+import os
+import shutil
 import typing as t
+import tempfile
+from pathlib import Path
 
 import csvw.metadata
 import pycldf
@@ -120,29 +124,14 @@ def update_integer_ids(
         ds[other_table].write(rows)
 
 
-def update_ids(
-    ds: pycldf.Dataset,
-    table: csvw.metadata.Table,
-    mapping: t.Mapping[str, str],
-    logger: cli.logging.Logger = cli.logger,
-):
-    """Update all IDs of the table in the database, also in foreign keys, according to mapping."""
+def foreign_keys_to(
+    ds: pycldf.Dataset, table: csvw.metadata.Table
+) -> t.Dict[str, t.Set[str]]:
+    """Find the columns, by table URL, that reference the ID column of table."""
     c_id = table.get_column("http://cldf.clld.org/v1.0/terms.rdf#id")
-    rows = []
-    for row in cli.tq(
-        ds[table],
-        task=f"Updating ids of {table.url.string}",
-        total=ds[table].common_props.get("dc:extent"),
-    ):
-        row[c_id.name] = mapping.get(row[c_id.name], row[c_id.name])
-        rows.append(row)
-    logger.info(f"Writing {table.url.string} back to file…")
-    table.write(rows)
-
-    c_id.datatype.format = ID_FORMAT.pattern
-
-    foreign_keys_to_here = {
-        other_table.url.string: {
+    references: t.Dict[str, t.Set[str]] = {}
+    for other_table in ds.tables:
+        columns = {
             foreign_key.columnReference[
                 foreign_key.reference.columnReference.index(c_id.name)
             ]
@@ -150,30 +139,111 @@ def update_ids(
             if foreign_key.reference.resource == table.url
             if c_id.name in foreign_key.reference.columnReference
         }
-        for other_table in ds.tables
-    }
+        if columns:
+            references[other_table.url.string] = columns
+    return references
 
-    for other_table, columns in foreign_keys_to_here.items():
+
+def substitute_ids(
+    row: t.Dict[str, t.Any], columns: t.Iterable[str], mapping: t.Mapping[str, t.Any]
+) -> bool:
+    """Replace IDs in some columns of a row, in place.
+
+    Return whether anything changed.
+
+    >>> row = {"ID": "f1", "Parameter_ID": ["one", "two"], "Language_ID": "a"}
+    >>> substitute_ids(row, ["Parameter_ID", "Language_ID"], {"two": "2"})
+    True
+    >>> row
+    {'ID': 'f1', 'Parameter_ID': ['one', '2'], 'Language_ID': 'a'}
+    >>> substitute_ids(row, ["Parameter_ID", "Language_ID"], {"two": "2"})
+    False
+    """
+    changed = False
+    for column in columns:
+        value = row.get(column)
+        if isinstance(value, list):
+            new_value = [mapping.get(v, v) for v in value]
+        else:
+            new_value = mapping.get(value, value)
+        if new_value != value:
+            row[column] = new_value
+            changed = True
+    return changed
+
+
+def rewrite_ids(
+    ds: pycldf.Dataset,
+    mapping: t.Mapping[str, t.Any],
+    columns_by_table: t.Mapping[str, t.Iterable[str]],
+    status_update: t.Optional[str] = None,
+    atomic: bool = False,
+    logger: cli.logging.Logger = cli.logger,
+) -> None:
+    """Apply an ID mapping to some columns of some tables.
+
+    Each table is read once and written once, no matter how many IDs change
+    or how many of its columns are affected. Rows where something changed get
+    the status_update, if given.
+
+    With atomic=True, every table is streamed into a temporary file next to
+    it, which then replaces the original. This never holds a whole table in
+    memory, and a failure half-way leaves the original file untouched.
+
+    """
+    for url, columns in columns_by_table.items():
+        columns = set(columns)
         if not columns:
             continue
-        logger.info(
-            f"Applying changed foreign key to columns {columns:} in {other_table:}…"
-        )
-        rows = []
-        for row in cli.tq(
-            ds[other_table],
-            total=ds[other_table].common_props.get("dc:extent"),
-            task="Replacing changed IDs",
-        ):
-            for column in columns:
-                # TODO: is this enough to handle columns with a separator? like parameterReference in forms table
-                if isinstance(row[column], list):
-                    row[column] = [mapping.get(v, v) for v in row[column]]
-                else:
-                    row[column] = mapping.get(row[column], row[column])
-                rows.append(row)
-        logger.info(f"Writing {other_table} back to file…")
-        ds[other_table].write(rows)
+        table = ds[url]
+        logger.info(f"Applying changed IDs to columns {columns:} in {url:}…")
+
+        def rewritten_rows():
+            for row in cli.tq(
+                table,
+                task=f"Replacing changed IDs in {url:}",
+                total=table.common_props.get("dc:extent"),
+            ):
+                if substitute_ids(row, columns, mapping) and status_update:
+                    row["Status_Column"] = status_update
+                yield row
+
+        if atomic:
+            target = Path(table.url.resolve(table.base))
+            handle, temporary = tempfile.mkstemp(
+                dir=target.parent, prefix=target.name, suffix=".tmp"
+            )
+            os.close(handle)
+            try:
+                table.write(rewritten_rows(), fname=temporary)
+                # mkstemp creates the file only readable by its owner.
+                shutil.copymode(target, temporary)
+                os.replace(temporary, target)
+            except BaseException:
+                os.unlink(temporary)
+                raise
+        else:
+            rows = list(rewritten_rows())
+            logger.info(f"Writing {url} back to file…")
+            table.write(rows)
 
+
+def update_ids(
+    ds: pycldf.Dataset,
+    table: csvw.metadata.Table,
+    mapping: t.Mapping[str, str],
+    logger: cli.logging.Logger = cli.logger,
+    atomic: bool = False,
+):
+    """Update all IDs of the table in the database, also in foreign keys, according to mapping."""
+    c_id = table.get_column("http://cldf.clld.org/v1.0/terms.rdf#id")
+    columns_by_table = foreign_keys_to(ds, table)
+    columns_by_table.setdefault(table.url.string, set()).add(c_id.name)
+
+    rewrite_ids(ds, mapping, columns_by_table, atomic=atomic, logger=logger)
+
+    c_id.datatype.format = ID_FORMAT.pattern
+    for other_table, columns in columns_by_table.items():
         for column in columns:
-            ds[other_table, column].datatype = c_id.datatype
+            if ds[other_table, column] is not c_id:
+                ds[other_table, column].datatype = c_id.datatype
@@ -0,0 +1,430 @@
+"""A read-once, column-oriented snapshot of a CLDF dataset.
+
+Many lexedata functions need the same tables of a dataset, and each of them
+used to go back to the CSV files and let csvw parse and convert every row
+again. A DatasetSnapshot parses each table at most once and keeps its contents
+as one list per column, with the values of ID and reference columns interned.
+
+A snapshot can be used in place of the dataset in all code that only reads
+data: Metadata access (``snapshot["FormTable", "id"]``, ``"CognateTable" in
+snapshot``, ``snapshot.column_names``, …) is passed through to the underlying
+dataset, and iterating over a table yields fresh row dictionaries built from
+the column storage.
+
+Snapshots can also keep a persistent cache of parsed tables on disk, by
+default in a per-user cache directory. A cached table is only used if the
+size, modification time and content hash of its CSV file and its description
+in the metadata are unchanged since it was cached, so editing the dataset by
+any means invalidates the cache.
+
+The cache consists of pickle files, and loading a pickle can run arbitrary
+code. The cache therefore does not live in the dataset directory, which is
+usually shared with others, and every cache directory gets a `.gitignore` so
+it is not committed by accident. Never use a cache directory you got from
+somebody else.
+
+"""
+
+import os
+import sys
+import json
+import pickle
+import hashlib
+import tempfile
+import typing as t
+from pathlib import Path
+
+import pycldf
+
+from lexedata import cli
+
+
+def _is_reference(column) -> bool:
+    """Check whether values of this column should be interned."""
+    url = column.propertyUrl.uri if column.propertyUrl else ""
+    return url.endswith("#id") or url.endswith("Reference") or column.name == "ID"
+
+
+def _fresh(value):
+    """Copy mutable values, so callers cannot change the snapshot by accident."""
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+
+def user_cache_directory() -> Path:
+    """The directory for lexedata's caches of this user.
+
+    This is `lexedata/` in $XDG_CACHE_HOME, or in ~/.cache if that is not set.
+
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "lexedata"
+
+
+def default_cache_directory(dataset: pycldf.Dataset) -> Path:
+    """The per-user cache directory for a dataset, keyed by its location."""
+    location = str(Path(dataset.directory).resolve())
+    key = hashlib.sha1(location.encode("utf-8")).hexdigest()[:16]
+    return user_cache_directory() / key
+
+
+def make_cache_directory(cache_directory: Path) -> None:
+    """Create a cache directory, and keep git from picking it up."""
+    cache_directory.mkdir(parents=True, exist_ok=True)
+    gitignore = cache_directory / ".gitignore"
+    if not gitignore.exists():
+        gitignore.write_text("*\n", encoding="utf-8")
+
+
+def _cache_file(cache_directory: Path, table) -> Path:
+    return cache_directory / (str(table.url).replace("/", "_") + ".pickle")
+
+
+def _fingerprint(table) -> t.Dict[str, t.Any]:
+    """Describe the state of a table's file and metadata.
+
+    If any of these properties changes, cached contents of the table are
+    outdated.
+
+    """
+    path = Path(table.url.resolve(table.base))
+    stat = path.stat()
+    content = hashlib.sha256()
+    with path.open("rb") as data:
+        for block in iter(lambda: data.read(1 << 20), b""):
+            content.update(block)
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "sha256": content.hexdigest(),
+        "schema": json.dumps(table.asdict(), sort_keys=True, default=str),
+    }
+
+
+def invalidate_cache(cache_directory: Path, table) -> None:
+    """Remove the cached contents of a table, if there are any."""
+    try:
+        _cache_file(cache_directory, table).unlink()
+    except FileNotFoundError:
+        pass
+
+
+class SnapshotTable:
+    """The contents of one table, stored column by column.
+
+    Attribute access that is not about the data (``tableSchema``, ``url``,
+    ``common_props``, …) is passed on to the underlying csvw Table.
+
+    If a cache directory is given, the columns are loaded from there if the
+    table has not changed, and stored there after parsing the table otherwise.
+
+    """
+
+    def __init__(
+        self,
+        table,
+        logger: cli.logging.Logger = cli.logger,
+        cache_directory: t.Optional[Path] = None,
+    ):
+        self.table = table
+        self._indices: t.Dict[str, t.Dict[t.Any, int]] = {}
+        if cache_directory is None:
+            self._parse(logger)
+            return
+        try:
+            fingerprint = _fingerprint(table)
+        except OSError:
+            # The table is not backed by a file we can inspect.
+            self._parse(logger)
+            return
+        cache_file = _cache_file(cache_directory, table)
+        try:
+            with cache_file.open("rb") as cache:
+                cached = pickle.load(cache)
+            if cached["fingerprint"] == fingerprint:
+                logger.debug("Loading table %s from %s", table.url, cache_file)
+                self.columns = cached["columns"]
+                self.n_rows = cached["n_rows"]
+                return
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError, TypeError):
+            pass
+        self._parse(logger)
+        self._store(cache_file, fingerprint, logger)
+
+    def _store(self, cache_file: Path, fingerprint: t.Dict[str, t.Any], logger) -> None:
+        try:
+            make_cache_directory(cache_file.parent)
+            handle, temporary = tempfile.mkstemp(dir=cache_file.parent)
+            with os.fdopen(handle, "wb") as cache:
+                pickle.dump(
+                    {
+                        "fingerprint": fingerprint,
+                        "columns": self.columns,
+                        "n_rows": self.n_rows,
+                    },
+                    cache,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(temporary, cache_file)
+        except OSError as e:
+            logger.warning("Could not cache table %s: %s", self.table.url, e)
+
+    def _parse(self, logger: cli.logging.Logger) -> None:
+        table = self.table
+        self.columns: t.Dict[str, t.List[t.Any]] = {
+            c.name: [] for c in table.tableSchema.columns
+        }
+        intern = {c.name for c in table.tableSchema.columns if _is_reference(c)}
+        storage = [
+            (name, values, name in intern) for name, values in self.columns.items()
+        ]
+        n = 0
+        for row in cli.tq(
+            table,
+            task=f"Reading table {table.url}",
+            logger=logger,
+            total=table.common_props.get("dc:extent"),
+        ):
+            for name, values, do_intern in storage:
+                value = row.get(name)
+                if do_intern and isinstance(value, str):
+                    value = sys.intern(value)
+                values.append(value)
+            n += 1
+        self.n_rows = n
+
+    def __getattr__(self, attribute):
+        if attribute == "table":
+            raise AttributeError(attribute)
+        return getattr(self.table, attribute)
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def row(self, i: int) -> t.Dict[str, t.Any]:
+        """Build the i-th row as a new dictionary indexed by column names."""
+        return {name: _fresh(values[i]) for name, values in self.columns.items()}
+
+    def __iter__(self) -> t.Iterator[t.Dict[str, t.Any]]:
+        for i in range(self.n_rows):
+            yield self.row(i)
+
+    def iterdicts(self) -> t.Iterator[t.Dict[str, t.Any]]:
+        return iter(self)
+
+    def index(self, column: str) -> t.Mapping[t.Any, int]:
+        """Map the values of a column to their row number.
+
+        Like in util.cache_table, later rows overwrite earlier ones with the
+        same value.
+
+        """
+        try:
+            return self._indices[column]
+        except KeyError:
+            index = {value: i for i, value in enumerate(self.columns[column])}
+            self._indices[column] = index
+            return index
+
+
+class TableView(t.Mapping[t.Any, t.Dict[str, t.Any]]):
+    """A dictionary-of-dictionaries view on a SnapshotTable.
+
+    This is what util.cache_table returns for snapshots. Every access builds a
+    new row dictionary, so changing a row does not affect the snapshot (or
+    other views).
+
+    """
+
+    def __init__(
+        self,
+        table: SnapshotTable,
+        columns: t.Mapping[str, str],
+        rows: t.Mapping[t.Any, int],
+    ):
+        self.table = table
+        self.columns = [(prop, table.columns[name]) for prop, name in columns.items()]
+        self.rows = rows
+
+    def __getitem__(self, key) -> t.Dict[str, t.Any]:
+        i = self.rows[key]
+        return {prop: _fresh(values[i]) for prop, values in self.columns}
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+
+class DatasetSnapshot:
+    """An in-memory snapshot of a CLDF dataset, parsing every table at most once.
+
+    >>> from lexedata.util import fs, cache_table
+    >>> ds = fs.new_wordlist(FormTable=[
+    ...     {"ID": "f1", "Language_ID": "l1", "Parameter_ID": "c1", "Form": "x"},
+    ...     {"ID": "f2", "Language_ID": "l2", "Parameter_ID": "c1", "Form": "y"}])
+    >>> snapshot = DatasetSnapshot(ds)
+    >>> snapshot["FormTable", "form"].name
+    'Form'
+    >>> [row["Form"] for row in snapshot["FormTable"]]
+    ['x', 'y']
+    >>> cache_table(snapshot)["f2"]["languageReference"]
+    'l2'
+
+    Wrapping a snapshot again returns the same snapshot.
+
+    >>> DatasetSnapshot.of(snapshot) is snapshot
+    True
+
+    With `cache`, parsed tables are kept on disk for the next snapshot of the
+    same dataset: In the given directory, or in `default_cache_directory` for
+    `cache=True`.
+
+    >>> import tempfile
+    >>> cache = Path(tempfile.mkdtemp()) / "cache"
+    >>> snapshot = DatasetSnapshot(ds, cache=cache)
+    >>> len(snapshot["FormTable"])
+    2
+    >>> sorted(p.name for p in cache.iterdir())
+    ['.gitignore', 'forms.csv.pickle']
+
+    """
+
+    def __init__(
+        self,
+        dataset: pycldf.Dataset,
+        logger: cli.logging.Logger = cli.logger,
+        cache: t.Union[bool, Path] = False,
+    ):
+        self.dataset = dataset
+        self.logger = logger
+        self._tables: t.Dict[str, SnapshotTable] = {}
+        self.cache_directory: t.Optional[Path]
+        if cache is True:
+            self.cache_directory = default_cache_directory(dataset)
+        elif cache:
+            self.cache_directory = Path(cache)
+        else:
+            self.cache_directory = None
+
+    @classmethod
+    def of(
+        cls,
+        dataset: t.Union[pycldf.Dataset, "DatasetSnapshot"],
+        logger: cli.logging.Logger = cli.logger,
+    ) -> "DatasetSnapshot":
+        """Return a snapshot of the dataset, or the dataset if it is a snapshot."""
+        if isinstance(dataset, cls):
+            return dataset
+        return cls(dataset, logger=logger)
+
+    def __getattr__(self, attribute):
+        if attribute == "dataset":
+            raise AttributeError(attribute)
+        return getattr(self.dataset, attribute)
+
+    def __contains__(self, item) -> bool:
+        return item in self.dataset
+
+    def __getitem__(self, item):
+        if isinstance(item, tuple):
+            return self.dataset[item]
+        return self.table(item)
+
+    def table(self, table) -> SnapshotTable:
+        """Load a table, if it has not been loaded before, and return it."""
+        csvw_table = self.dataset[table]
+        url = str(csvw_table.url)
+        try:
+            return self._tables[url]
+        except KeyError:
+            self._tables[url] = SnapshotTable(
+                csvw_table, logger=self.logger, cache_directory=self.cache_directory
+            )
+            return self._tables[url]
+
+    def view(
+        self,
+        table: str,
+        columns: t.Mapping[str, str],
+        index_column: str,
+        filter: t.Optional[t.Callable[[t.Mapping[str, t.Any]], bool]] = None,
+    ) -> TableView:
+        """Present a table as dictionary of dictionaries, see util.cache_table."""
+        snapshot_table = self.table(table)
+        c_id = self.dataset[table, index_column].name
+        if filter is None:
+            rows = snapshot_table.index(c_id)
+        else:
+            rows = {
+                snapshot_table.columns[c_id][i]: i
+                for i in range(len(snapshot_table))
+                if filter(snapshot_table.row(i))
+            }
+        return TableView(snapshot_table, columns, rows)
+
+    def foreign_key_indices(
+        self, table: str, column: str, logger: cli.logging.Logger = cli.logger
+    ) -> t.List[t.Optional[t.List[t.Optional[int]]]]:
+        """Resolve a foreign key column to row numbers in the referenced table.
+
+        For every row of `table`, return the list of row numbers in the target
+        table the `column` of that row points to, or None if the row has no
+        reference. References to rows that do not exist are resolved to None,
+        with a warning.
+
+        >>> from lexedata.util import fs
+        >>> ds = fs.new_wordlist(
+        ...     FormTable=[
+        ...         {"ID": "f1", "Language_ID": "l1", "Parameter_ID": "c1", "Form": "x"},
+        ...         {"ID": "f2", "Language_ID": "l2", "Parameter_ID": "c1", "Form": "y"}],
+        ...     CognateTable=[
+        ...         {"ID": "j1", "Form_ID": "f2", "Cognateset_ID": "s1"},
+        ...         {"ID": "j2", "Form_ID": "f3", "Cognateset_ID": "s1"}])
+        >>> DatasetSnapshot(ds).foreign_key_indices("CognateTable", "formReference")
+        [[1], [None]]
+
+        """
+        c_reference = self.dataset[table, column]
+        (foreign_key,) = [
+            key
+            for key in self.dataset[table].tableSchema.foreignKeys
+            if key.columnReference == [c_reference.name]
+        ]
+        target_table = foreign_key.reference.resource.string
+        target = self.table(target_table)
+        (c_target,) = foreign_key.reference.columnReference
+        index = target.index(c_target)
+
+        def resolve(value) -> t.Optional[int]:
+            try:
+                return index[value]
+            except KeyError:
+                logger.warning(
+                    f"Table {table} refers to {value} in its column {c_reference.name}, but there is no such entry in {target_table}."
+                )
+                return None
+
+        result: t.List[t.Optional[t.List[t.Optional[int]]]] = []
+        for value in self.table(table).columns[c_reference.name]:
+            if value is None:
+                result.append(None)
+            elif isinstance(value, list):
+                result.append([resolve(v) for v in value])
+            else:
+                result.append([resolve(value)])
+        return result
+
+    def write(self, **tables):
+        """Write tables to the dataset, and forget their outdated snapshots."""
+        for table in tables:
+            csvw_table = self.dataset[table]
+            self._tables.pop(str(csvw_table.url), None)
+            if self.cache_directory is not None:
+                invalidate_cache(self.cache_directory, csvw_table)
+        return self.dataset.write(**tables)
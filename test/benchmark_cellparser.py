@@ -0,0 +1,86 @@
+"""Compare the compiled bracket grammar of the cell parser with a naive scan.
+
+The naive reference functions live in reference_cellparser.py, where the tests
+use them too. Run this file as a script to time both over the cells of the
+Excel test fixtures, and over some synthetic cells with many forms.
+
+"""
+
+import re
+import sys
+import time
+import typing as t
+from pathlib import Path
+
+import openpyxl
+
+from lexedata.util.excel import BracketGrammar
+from reference_cellparser import (
+    reference_check_brackets,
+    reference_components_in_brackets,
+    reference_split,
+)
+
+BRACKET_PAIRS = {"<": ">", "(": ")", "{": "}", "[": "]", "/": "/"}
+SEPARATION_PATTERN = r"([;,])"
+
+
+def fixture_cells() -> t.List[str]:
+    cells = []
+    for excel in sorted((Path(__file__).parent / "data/excel").glob("*.xlsx")):
+        workbook = openpyxl.load_workbook(excel, read_only=True)
+        for sheet in workbook.worksheets:
+            for row in sheet.iter_rows(values_only=True):
+                cells.extend(v for v in row if isinstance(v, str))
+        workbook.close()
+    return cells
+
+
+def synthetic_cells(n_forms: int) -> t.List[str]:
+    form = "<form> /fɔɾm/ (comment, with comma) {src:1, 2}"
+    return [
+        ", ".join([form] * n_forms),
+        # An unclosed bracket at the start makes the naive splitter re-check
+        # ever longer pieces.
+        "(" + ", ".join([form] * n_forms),
+    ]
+
+
+def timed(function: t.Callable[[], t.Any], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def compare(name: str, cells: t.List[str], repeat: int) -> None:
+    grammar = BracketGrammar(BRACKET_PAIRS)
+    separator = re.compile(SEPARATION_PATTERN)
+
+    def naive():
+        for cell in cells:
+            pieces, _ = reference_split(cell, SEPARATION_PATTERN, BRACKET_PAIRS)
+            for piece in pieces:
+                for element in reference_components_in_brackets(piece, BRACKET_PAIRS):
+                    reference_check_brackets(element, BRACKET_PAIRS)
+
+    def compiled():
+        for cell in cells:
+            pieces, _ = grammar.split(cell, separator)
+            for piece in pieces:
+                for element in grammar.components(piece):
+                    grammar.check(element)
+
+    before = timed(naive, repeat)
+    after = timed(compiled, repeat)
+    print(
+        f"{name:<24} {len(cells):>6} cells  naive {before * 1000:9.2f} ms  "
+        f"compiled {after * 1000:9.2f} ms  speedup {before / after:6.1f}×"
+    )
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    compare("Excel test fixtures", fixture_cells(), repeat)
+    for n_forms in [10, 30, 100]:
+        compare(f"{n_forms} forms in one cell", synthetic_cells(n_forms), repeat)
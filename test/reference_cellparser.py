@@ -0,0 +1,73 @@
+"""Naive bracket scanning, for comparison with the cell parser's grammar.
+
+These are the character-by-character implementations that
+`lexedata.util.excel` used before the cell parser compiled its delimiters
+into a `BracketGrammar`. The cell parser tests check that both agree, and
+benchmark_cellparser.py times them against each other.
+
+"""
+
+import re
+import typing as t
+
+
+def reference_check_brackets(string: str, bracket_pairs: t.Mapping[str, str]) -> bool:
+    waiting_for: t.List[str] = []
+    i = 0
+    while i < len(string):
+        if waiting_for and string[i:].startswith(waiting_for[0]):
+            i += len(waiting_for.pop(0))
+        else:
+            for q, p in bracket_pairs.items():
+                if string[i:].startswith(q):
+                    waiting_for.insert(0, p)
+                    i += len(q)
+                    break
+                elif p and string[i:].startswith(p):
+                    return False
+            else:
+                i += 1
+    return not any(waiting_for)
+
+
+def reference_components_in_brackets(
+    form_string: str, bracket_pairs: t.Mapping[str, str]
+) -> t.List[str]:
+    elements = []
+    i = 0
+    remainder = form_string
+    waiting_for: t.List[str] = []
+    while i < len(remainder):
+        if waiting_for and remainder[i:].startswith(waiting_for[0]):
+            i += len(waiting_for.pop(0))
+            if not any(waiting_for):
+                elements.append(remainder[:i])
+                remainder = remainder[i:]
+                i = 0
+        else:
+            for q, p in bracket_pairs.items():
+                if remainder[i:].startswith(q):
+                    if not any(waiting_for):
+                        elements.append(remainder[:i])
+                        remainder = remainder[i:]
+                        i = 0
+                    waiting_for.insert(0, p)
+                    i += len(q)
+                    break
+            else:
+                i += 1
+    return elements + [remainder]
+
+
+def reference_split(
+    values: str, separation_pattern: str, bracket_pairs: t.Mapping[str, str]
+) -> t.Tuple[t.List[str], bool]:
+    raw_split = re.split(separation_pattern, values)
+    pieces = []
+    while len(raw_split) > 1:
+        if reference_check_brackets(raw_split[0], bracket_pairs):
+            pieces.append(raw_split.pop(0))
+            raw_split.pop(0)
+        else:
+            raw_split[:2] = ["".join(raw_split[:2])]
+    return pieces + raw_split, reference_check_brackets(raw_split[0], bracket_pairs)
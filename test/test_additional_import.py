@@ -10,6 +10,7 @@ from lexedata.importer.excel_long_format import (
     ImportLanguageReport,
     add_single_languages,
 )
+from lexedata.importer.excel_matrix import DB
 from mock_excel import MockSingleExcelSheet
 from helper_functions import copy_metadata, copy_to_temp_no_bib
 
@@ -922,3 +923,43 @@ def test_add_concept_to_existing_form(single_import_parameters):
             concepts=1,
         )
     }
+
+
+def test_add_single_languages_reads_and_writes_once(
+    single_import_parameters, monkeypatch
+):
+    dataset, target, excel, concept_name = single_import_parameters
+    calls = {"cache": 0, "write": 0}
+    cache_dataset, write_dataset_from_cache = (
+        DB.cache_dataset,
+        DB.write_dataset_from_cache,
+    )
+
+    def counting_cache(self, *args, **kwargs):
+        calls["cache"] += 1
+        return cache_dataset(self, *args, **kwargs)
+
+    def counting_write(self, *args, **kwargs):
+        calls["write"] += 1
+        return write_dataset_from_cache(self, *args, **kwargs)
+
+    monkeypatch.setattr(DB, "cache_dataset", counting_cache)
+    monkeypatch.setattr(DB, "write_dataset_from_cache", counting_write)
+    workbook = openpyxl.load_workbook(excel, read_only=True)
+    sheets = list(workbook) * 3
+    add_single_languages(
+        metadata=target,
+        sheets=sheets,
+        match_form=None,
+        concept_name=concept_name,
+        ignore_missing=True,
+        ignore_superfluous=True,
+        status_update=None,
+        logger=logging.getLogger(__name__),
+    )
+    workbook.close()
+    assert calls == {"cache": 1, "write": 1}
+    c_f_id = dataset["FormTable", "id"].name
+    new_form_ids = {row[c_f_id] for row in dataset["FormTable"]}
+    assert "ache_one_1" in new_form_ids
+    assert "ache_one_2" not in new_form_ids
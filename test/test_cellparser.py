@@ -4,6 +4,7 @@ import argparse
 from pathlib import Path
 import json
 import logging
+import random
 import re
 
 import pycldf
@@ -12,6 +13,11 @@ import pycldf
 from lexedata.edit.normalize_unicode import n
 from lexedata.util import excel as c
 from helper_functions import copy_metadata
+from reference_cellparser import (
+    reference_check_brackets,
+    reference_components_in_brackets,
+    reference_split,
+)
 
 
 @pytest.fixture(params=[r"data/cldf/smallmawetiguarani/cldf-metadata.json"])
@@ -458,3 +464,27 @@ def test_mawetiparser_postprocessing(mawetiparser):
         "Source": {"abui1241_s1"},
         "Form": "lεksedata",
     }
+
+
+@pytest.mark.parametrize(
+    "bracket_pairs",
+    [
+        {"<": ">", "(": ")", "{": "}", "/": "/"},
+        {":::": ":::", ":": ":", "(": ")"},
+        {"!(": "", "!)": "", "(": ")", "[": "]"},
+    ],
+)
+def test_bracket_grammar_matches_naive_scan(bracket_pairs):
+    random.seed(len(bracket_pairs))
+    grammar = c.BracketGrammar(bracket_pairs)
+    separator = re.compile(r"([;,])")
+    alphabet = list("ab ;,:!") + list(bracket_pairs) + list(bracket_pairs.values())
+    for _ in range(2000):
+        string = "".join(random.choice(alphabet) for _ in range(random.randrange(20)))
+        assert grammar.check(string) == reference_check_brackets(string, bracket_pairs)
+        assert grammar.components(string) == reference_components_in_brackets(
+            string, bracket_pairs
+        )
+        assert grammar.split(string, separator) == reference_split(
+            string, separator.pattern, bracket_pairs
+        )
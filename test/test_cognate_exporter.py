@@ -72,6 +72,20 @@ def test_sort_cognatesets_4(tiny_dataset):
     assert [s["id"] for s in cognatesets] == ["s3", "s2", "s1", "s5", "s4"]
 
 
+def test_sort_cognatesets_several_columns(tiny_dataset):
+    cognatesets, judgements = tiny_dataset
+    # The first column has priority, then the second, then the size
+    cognatesets[1]["source"] = ["1"]
+    sort_cognatesets(cognatesets, judgements, ["description", "source"], size=True)
+    assert [s["id"] for s in cognatesets] == ["s2", "s3", "s1", "s5", "s4"]
+
+
+def test_sort_cognatesets_given_sizes(tiny_dataset):
+    cognatesets, _ = tiny_dataset
+    sort_cognatesets(cognatesets, sizes={"s1": 2, "s3": 1}, size=True)
+    assert [s["id"] for s in cognatesets] == ["s1", "s3", "s2", "s4", "s5"]
+
+
 def test_cogsets_and_judgements():
     dataset = get_dataset(
         Path(__file__).parent / "data/cldf/smallmawetiguarani/cldf-metadata.json"
@@ -8,6 +8,7 @@ import lexedata.util.fs
 from lexedata import util
 from lexedata.types import WorldSet
 from test_excel_conversion import cldf_wordlist, working_and_nonworking_bibfile  # noqa
+from helper_functions import copy_to_temp
 
 import lexedata.importer.edictor as importer
 import lexedata.exporter.edictor as exporter
@@ -37,6 +38,21 @@ def test_match_cognatesets_2():
     assert matching == {1: "id1", 2: "id2"}
 
 
+def test_match_cognatesets_optimal():
+    edictor_style_cognatesets = {
+        1: [("form1", range(4), []), ("form2", range(4), [])],
+        2: [("form2", range(4), []), ("form3", range(4), [])],
+    }
+    cldf_style_cognatesets = {
+        "id1": [("form1", range(4), []), ("form2", range(4), [])],
+        "id2": [("form3", range(4), [])],
+    }
+    matching = importer.match_cognatesets(
+        edictor_style_cognatesets, cldf_style_cognatesets, optimal=True
+    )
+    assert matching == {1: "id1", 2: "id2"}
+
+
 def test_write_edictor_empty_dataset():
     dataset = lexedata.util.fs.new_wordlist(FormTable=[])
     file = io.StringIO()
@@ -190,3 +206,110 @@ def test_roundtrip(cldf_wordlist, working_and_nonworking_bibfile):  # noqa
     expected = pycldf.Wordlist.from_metadata(target)
     for table in expected.tables:
         assert list(dataset[table.url]) == list(expected[table.url])
+
+
+def test_roundtrip_imports_only_changed_rows(
+    cldf_wordlist, working_and_nonworking_bibfile  # noqa
+):
+    dataset, _ = working_and_nonworking_bibfile(cldf_wordlist)
+    forms, judgements_about_form, cognateset_mapping = exporter.forms_to_tsv(
+        dataset=dataset,
+        languages=WorldSet(),
+        concepts=WorldSet(),
+        cognatesets=WorldSet(),
+    )
+    _, f = tempfile.mkstemp(".tsv", "edictor")
+    filename = Path(f)
+    with filename.open("w", encoding="utf-8") as file:
+        exporter.write_edictor_file(
+            dataset,
+            file,
+            forms,
+            judgements_about_form,
+            cognateset_mapping,
+            row_hashes=True,
+        )
+    judgements = util.cache_table(dataset, "CognateTable")
+
+    new_cogsets, affected_forms = importer.load_forms_from_tsv(
+        dataset=dataset, input_file=filename
+    )
+    assert affected_forms == set()
+    assert new_cogsets
+
+    # Change the comment of a single form
+    lines = filename.read_text(encoding="utf-8").split("\n")
+    header = lines[0].split("\t")
+    row = lines[1].split("\t")
+    row[header.index("comment")] = "Changed in Edictor"
+    lines[1] = "\t".join(row)
+    filename.write_text("\n".join(lines), encoding="utf-8")
+
+    new_cogsets, affected_forms = importer.load_forms_from_tsv(
+        dataset=dataset, input_file=filename
+    )
+    changed_form = row[header.index("CLDF_id")]
+    assert affected_forms == {changed_form}
+    importer.edictor_to_cldf(
+        dataset=dataset, new_cogsets=new_cogsets, affected_forms=affected_forms
+    )
+    assert util.cache_table(dataset)[changed_form]["comment"] == "Changed in Edictor"
+    assert util.cache_table(dataset, "CognateTable") == judgements
+
+
+def edictor_roundtrip_moving_forms(row_hashes):
+    """Move the forms of cognateset four1 onto the COGID of ache_one in Edictor."""
+    dataset, _ = copy_to_temp(
+        Path(__file__).parent / "data/cldf/smallmawetiguarani/cldf-metadata.json"
+    )
+    forms, judgements_about_form, cognateset_mapping = exporter.forms_to_tsv(
+        dataset=dataset,
+        languages=WorldSet(),
+        concepts=WorldSet(),
+        cognatesets=WorldSet(),
+    )
+    _, f = tempfile.mkstemp(".tsv", "edictor")
+    filename = Path(f)
+    with filename.open("w", encoding="utf-8") as file:
+        exporter.write_edictor_file(
+            dataset,
+            file,
+            forms,
+            judgements_about_form,
+            cognateset_mapping,
+            row_hashes=row_hashes,
+        )
+
+    lines = filename.read_text(encoding="utf-8").split("\n")
+    header = lines[0].split("\t")
+    rows = {
+        line.split("\t")[header.index("CLDF_id")]: i
+        for i, line in enumerate(lines)
+        if line.count("\t") == len(header) - 1
+    }
+    target = lines[rows["ache_one"]].split("\t")[header.index("COGID")]
+    for form in ["ache_four_1", "paraguayan_guarani_four", "kaiwa_four"]:
+        row = lines[rows[form]].split("\t")
+        row[header.index("COGID")] = target
+        lines[rows[form]] = "\t".join(row)
+    filename.write_text("\n".join(lines), encoding="utf-8")
+
+    new_cogsets, affected_forms = importer.load_forms_from_tsv(
+        dataset=dataset, input_file=filename
+    )
+    importer.edictor_to_cldf(
+        dataset=dataset, new_cogsets=new_cogsets, affected_forms=affected_forms
+    )
+    return {
+        j["formReference"]: j["cognatesetReference"]
+        for j in util.cache_table(dataset, "CognateTable").values()
+    }
+
+
+def test_roundtrip_moving_forms_into_existing_set():
+    cognatesets = edictor_roundtrip_moving_forms(row_hashes=True)
+    assert cognatesets == edictor_roundtrip_moving_forms(row_hashes=False)
+    assert {
+        cognatesets[form]
+        for form in ["ache_one", "ache_four_1", "paraguayan_guarani_four", "kaiwa_four"]
+    } == {"four1"}
@@ -16,11 +16,12 @@ from helper_functions import (
 )
 from mock_excel import MockSingleExcelSheet
 import lexedata.importer.excel_matrix as f
-from lexedata.exporter.cognates import ExcelWriter
+from lexedata.exporter.cognates import ExcelWriter, Sharding, write_shards
 from lexedata.importer.cognates import (
     import_cognates_from_excel,
 )
 from lexedata import util
+from lexedata.util.excel import StreamingSheet
 
 
 @pytest.fixture(
@@ -99,6 +100,35 @@ def test_fromexcel_correct(excel_wordlist):
     )
 
 
+def test_fromexcel_parallel_sheets(tmp_path):
+    # Split the cognate sheet in two, between cognatesets 'one' and 'two'
+    cogsets = openpyxl.load_workbook(
+        Path(__file__).parent / "data/excel/small_cog.xlsx"
+    )
+    first = cogsets.active
+    second = cogsets.copy_worksheet(first)
+    second.title = "Second half"
+    second.delete_rows(3, 5)
+    first.delete_rows(8, first.max_row)
+    cogsets.save(tmp_path / "cogsets.xlsx")
+
+    tables = []
+    for jobs in [1, 2]:
+        dataset, _ = empty_copy_of_cldf_wordlist(
+            Path(__file__).parent / "data/cldf/smallmawetiguarani/cldf-metadata.json"
+        )
+        f.load_dataset(
+            Path(dataset.tablegroup._fname),
+            str(Path(__file__).parent / "data/excel/small.xlsx"),
+            str(tmp_path / "cogsets.xlsx"),
+            jobs=jobs,
+        )
+        tables.append((list(dataset["CognatesetTable"]), list(dataset["CognateTable"])))
+    assert tables[0] == tables[1]
+    assert tables[0][1]
+    assert {"one", "two"} <= {c["Name"] for c in tables[0][0]}
+
+
 def test_toexcel_runs(cldf_wordlist, working_and_nonworking_bibfile):
     filled_cldf_wordlist = working_and_nonworking_bibfile(cldf_wordlist)
     writer = ExcelWriter(
@@ -116,6 +146,41 @@ def test_toexcel_runs(cldf_wordlist, working_and_nonworking_bibfile):
     writer.wb.save(filename=out_filename)
 
 
+def test_toexcel_streaming_matches_normal(cldf_wordlist, tmp_path):
+    dataset, _ = copy_to_temp(cldf_wordlist)
+    forms = util.cache_table(dataset)
+    languages = util.cache_table(dataset, "LanguageTable").values()
+    judgements = util.cache_table(dataset, "CognateTable").values()
+    cogsets = util.cache_table(dataset, "CognatesetTable").values()
+    contents = []
+    for streaming in [False, True]:
+        writer = ExcelWriter(
+            dataset,
+            database_url="https://example.org/lexicon/{:}",
+            streaming=streaming,
+        )
+        writer.create_excel(
+            rows=cogsets, judgements=judgements, forms=forms, languages=languages
+        )
+        writer.wb.save(filename=tmp_path / f"{streaming}.xlsx")
+        ws = openpyxl.load_workbook(tmp_path / f"{streaming}.xlsx").active
+        contents.append(
+            [
+                (
+                    cell.coordinate,
+                    cell.value,
+                    cell.comment and cell.comment.text,
+                    cell.hyperlink and cell.hyperlink.target,
+                )
+                for row in ws.iter_rows()
+                for cell in row
+                if cell.value is not None
+            ]
+        )
+    assert contents[0] == contents[1]
+    assert any(link for _, _, _, link in contents[1])
+
+
 def test_roundtrip(cldf_wordlist, working_and_nonworking_bibfile):
     filled_cldf_wordlist = working_and_nonworking_bibfile(cldf_wordlist)
     dataset, target = filled_cldf_wordlist
@@ -149,6 +214,59 @@ def test_roundtrip(cldf_wordlist, working_and_nonworking_bibfile):
     assert new_judgements == old_judgements
 
 
+@pytest.mark.parametrize(
+    "sharding,size", [(Sharding.ROWS, 3), (Sharding.PREFIX, 1), (Sharding.CONCEPT, 0)]
+)
+def test_sharded_roundtrip(sharding, size, tmp_path):
+    dataset, _ = copy_to_temp(
+        Path(__file__).parent / "data/cldf/smallmawetiguarani/cldf-metadata.json"
+    )
+    c_formReference = dataset["CognateTable", "formReference"].name
+    c_cogsetReference = dataset["CognateTable", "cognatesetReference"].name
+    old_judgements = {
+        (row[c_formReference], row[c_cogsetReference])
+        for row in dataset["CognateTable"]
+    }
+    writer = ExcelWriter(dataset, database_url="https://example.org/lexicon/{:}")
+    forms = util.cache_table(dataset)
+    languages = list(util.cache_table(dataset, "LanguageTable").values())
+    judgements = util.cache_table(dataset, "CognateTable").values()
+    cogsets = list(util.cache_table(dataset, "CognatesetTable").values())
+    for cogset in cogsets:
+        cogset["parameterReference"] = cogset["id"].rstrip("0123456789")
+    forms_by_row = writer.collect_forms_by_row(judgements, cogsets)
+    shards = writer.shards(cogsets, forms_by_row, forms, sharding, size)
+    assert len(shards) > 1
+    if sharding == Sharding.ROWS:
+        assert all(
+            sum(writer.block_height(forms_by_row[c["id"]], forms) for c in rows) <= size
+            for _, rows in shards
+        )
+    paths = write_shards(
+        ExcelWriter,
+        dataset.tablegroup._fname,
+        shards,
+        languages,
+        forms_by_row,
+        forms,
+        tmp_path / "cognates.xlsx",
+        writer_arguments={"database_url": "https://example.org/lexicon/{:}"},
+        jobs=2,
+    )
+    assert [p.name for p in paths][0].startswith("cognates_")
+
+    dataset["CognateTable"].write([])
+    dataset["CognatesetTable"].write([])
+    workbooks = [openpyxl.load_workbook(p) for p in paths]
+    import_cognates_from_excel([wb.active for wb in workbooks], dataset)
+
+    new_judgements = {
+        (row[c_formReference], row[c_cogsetReference])
+        for row in dataset["CognateTable"]
+    }
+    assert new_judgements == old_judgements
+
+
 def test_roundtrip_separator_column(cldf_wordlist, working_and_nonworking_bibfile):
     """Test whether a CognatesetTable column with separator survives a roundtrip."""
     dataset, target = working_and_nonworking_bibfile(cldf_wordlist)
@@ -188,13 +306,15 @@ def test_roundtrip_separator_column(cldf_wordlist, working_and_nonworking_bibfil
     assert reread_tags == tags
 
 
-def test_cell_comments():
+@pytest.mark.parametrize("read_only", [False, True])
+def test_cell_comments(read_only):
     dataset, _ = copy_to_temp(
         Path(__file__).parent / "data/cldf/minimal/cldf-metadata.json"
     )
     excel_filename = Path(__file__).parent / "data/excel/judgement_cell_with_note.xlsx"
 
-    ws = openpyxl.load_workbook(excel_filename).active
+    wb = openpyxl.load_workbook(excel_filename, read_only=read_only)
+    ws = StreamingSheet(wb.active, excel_filename) if read_only else wb.active
     import_cognates_from_excel(ws, dataset)
     cognates = {
         cog["ID"]: {
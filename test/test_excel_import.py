@@ -7,6 +7,7 @@ import pycldf
 import openpyxl
 
 from helper_functions import copy_metadata, copy_to_temp
+from lexedata import util
 import lexedata.importer.excel_matrix as f
 
 
@@ -202,3 +203,94 @@ def test_cognate_parser_language_not_found():
     ):
         EP.db.cache_dataset()
         EP.parse_cells(lexicon_wb)
+
+
+def test_db_index_follows_insert_and_associate():
+    dataset, _ = copy_to_temp(
+        Path(__file__).parent / "data/cldf/smallmawetiguarani/cldf-metadata.json"
+    )
+    db = f.DB.from_dataset(dataset)
+    c_f_id = dataset["FormTable", "id"].name
+    c_f_form = dataset["FormTable", "form"].name
+    c_f_concept = dataset["FormTable", "parameterReference"].name
+    some_form = next(iter(db.cache["FormTable"].values()))
+    assert db.find_db_candidates(
+        f.Form({c_f_form: some_form[c_f_form]}), [c_f_form]
+    ) == [some_form[c_f_id]]
+
+    new_form = f.Form({c_f_id: "new_form", c_f_form: "xyzzy", c_f_concept: ["one"]})
+    assert db.find_db_candidates(new_form, [c_f_form, c_f_concept]) == []
+    db.insert_into_db(new_form)
+    assert db.find_db_candidates(new_form, [c_f_form, c_f_concept]) == ["new_form"]
+
+    db.associate("new_form", f.Concept({dataset["ParameterTable", "id"].name: "two"}))
+    assert (
+        db.find_db_candidates(
+            f.Form({c_f_form: "xyzzy", c_f_concept: ["one"]}), [c_f_form, c_f_concept]
+        )
+        == []
+    )
+    assert db.find_db_candidates(
+        f.Form({c_f_form: "xyzzy", c_f_concept: ["one", "two"]}),
+        [c_f_form, c_f_concept],
+    ) == ["new_form"]
+
+
+def test_db_index_follows_append_to():
+    dataset, _ = copy_to_temp(
+        Path(__file__).parent / "data/cldf/smallmawetiguarani/cldf-metadata.json"
+    )
+    db = f.DB.from_dataset(dataset)
+    c_f_id = dataset["FormTable", "id"].name
+    c_f_form = dataset["FormTable", "form"].name
+    c_f_concept = dataset["FormTable", "parameterReference"].name
+    new_form = f.Form({c_f_id: "new_form", c_f_form: "xyzzy", c_f_concept: ["one"]})
+    db.insert_into_db(new_form)
+    assert db.find_db_candidates(new_form, [c_f_form, c_f_concept]) == ["new_form"]
+
+    db.append_to("FormTable", "new_form", c_f_concept, "two")
+    assert db.cache["FormTable"]["new_form"][c_f_concept] == ["one", "two"]
+    assert (
+        db.find_db_candidates(
+            f.Form({c_f_form: "xyzzy", c_f_concept: ["one"]}), [c_f_form, c_f_concept]
+        )
+        == []
+    )
+    assert db.find_db_candidates(
+        f.Form({c_f_form: "xyzzy", c_f_concept: ["one", "two"]}),
+        [c_f_form, c_f_concept],
+    ) == ["new_form"]
+
+
+@pytest.mark.parametrize("threshold", [0.2, 0.5, 4])
+def test_db_fuzzy_candidates_match_all_pairs(threshold):
+    dataset, _ = copy_to_temp(
+        Path(__file__).parent / "data/cldf/smallmawetiguarani/cldf-metadata.json"
+    )
+    db = f.DB.from_dataset(dataset)
+    c_f_form = dataset["FormTable", "form"].name
+    c_f_language = dataset["FormTable", "languageReference"].name
+    forms = db.cache["FormTable"]
+
+    def all_pairs(object, properties):
+        def match(x, y):
+            if (not x and y) or (x and not y):
+                return False
+            return util.edit_distance(x, y) <= threshold
+
+        return {
+            id
+            for id, form in forms.items()
+            if all(match(form.get(p), object.get(p)) for p in properties)
+        }
+
+    queries = [dict(form) for form in forms.values()] + [
+        {c_f_form: form[c_f_form][:-1] + "x", c_f_language: form[c_f_language]}
+        for form in forms.values()
+    ]
+    for query in queries:
+        for properties in [[c_f_form], [c_f_form, c_f_language]]:
+            object = f.Form(query)
+            assert set(
+                db.find_db_candidates(object, properties, edit_dist_threshold=threshold)
+            ) == all_pairs(object, properties)
@@ -1,9 +1,16 @@
 import tempfile
+from pathlib import Path
 
 import unicodedata
+import pytest
 import openpyxl as op
 
-from lexedata.util.excel import clean_cell_value, normalize_header
+from lexedata.util.excel import (
+    clean_cell_value,
+    get_cell_comment,
+    normalize_header,
+    StreamingSheet,
+)
 from mock_excel import MockSingleExcelSheet
 
 
@@ -37,3 +44,81 @@ def test_normalize_header():
     sheet = MockSingleExcelSheet([["Language ID", "Gloss (eng)"]])
     for row in sheet.iter_rows():
         assert normalize_header(row) == ["Language_ID", "Gloss_eng"]
+
+
+@pytest.mark.parametrize(
+    "excel, links, comments",
+    [
+        # small_cog.xlsx claims to have 1048576 rows in its header.
+        ("small_cog.xlsx", 0, 7),
+        ("judgement_cell_with_note.xlsx", 1, 3),
+    ],
+)
+def test_streaming_sheet_matches_full_workbook(excel, links, comments):
+    excel = Path(__file__).parent / "data/excel" / excel
+    full = op.load_workbook(excel).active
+    wb = op.load_workbook(excel, read_only=True)
+    streamed = StreamingSheet(wb.active)
+    assert (streamed.max_row, streamed.max_column) == (full.max_row, full.max_column)
+    n_links = n_comments = 0
+    for full_row, streamed_row in zip(full.iter_rows(), streamed.iter_rows()):
+        assert len(full_row) == len(streamed_row)
+        for cell, streamed_cell in zip(full_row, streamed_row):
+            assert streamed_cell.coordinate == cell.coordinate
+            assert clean_cell_value(streamed_cell) == clean_cell_value(cell)
+            assert get_cell_comment(streamed_cell) == get_cell_comment(cell)
+            if cell.hyperlink:
+                n_links += 1
+                assert streamed_cell.hyperlink.target == cell.hyperlink.target
+            else:
+                assert streamed_cell.hyperlink is None
+            n_comments += bool(cell.comment)
+    wb.close()
+    assert (n_links, n_comments) == (links, comments)
+
+
+@pytest.mark.parametrize("excel", ["small_cog.xlsx", "judgement_cell_with_note.xlsx"])
+def test_streaming_sheet_columns_and_cells(excel):
+    excel = Path(__file__).parent / "data/excel" / excel
+    full = op.load_workbook(excel).active
+    wb = op.load_workbook(excel, read_only=True)
+    streamed = StreamingSheet(wb.active)
+    for full_column, streamed_column in zip(
+        full.iter_cols(min_col=2, min_row=2), streamed.iter_cols(min_col=2, min_row=2)
+    ):
+        assert [c.coordinate for c in streamed_column] == [
+            c.coordinate for c in full_column
+        ]
+        assert [c.value for c in streamed_column] == [c.value for c in full_column]
+    for row in range(1, full.max_row + 1):
+        for column in range(1, full.max_column + 2):
+            assert streamed.cell(row, column).value == full.cell(row, column).value
+    wb.close()
+
+
+def test_streaming_sheet_falls_back_without_openpyxl_internals(caplog):
+    excel = Path(__file__).parent / "data/excel/judgement_cell_with_note.xlsx"
+    full = op.load_workbook(excel).active
+    wb = op.load_workbook(excel, read_only=True)
+
+    class PublicWorksheet:
+        # Pretend a later openpyxl release dropped the private attributes
+        # used for reading comments and links straight from the archive.
+        def __getattr__(self, name):
+            if name.startswith("_"):
+                raise AttributeError(name)
+            return getattr(wb.active, name)
+
+    streamed = StreamingSheet(PublicWorksheet(), excel)
+    blind = StreamingSheet(PublicWorksheet())
+    for row in full.iter_rows():
+        for cell in row:
+            streamed_cell = streamed.cell(cell.row, cell.column)
+            assert get_cell_comment(streamed_cell) == get_cell_comment(cell)
+            if cell.hyperlink:
+                assert streamed_cell.hyperlink.target == cell.hyperlink.target
+            else:
+                assert streamed_cell.hyperlink is None
+    assert blind.comment_at(1, 1) is None
+    assert "Cannot read comments and hyperlinks" in caplog.text
+    wb.close()
@@ -0,0 +1,373 @@
+import io
+import csv
+import random
+import subprocess
+import sys
+import typing as t
+from pathlib import Path
+
+import numpy
+import pytest
+import pycldf
+import lxml.etree as ET
+
+from lexedata import util
+from lexedata.util.snapshot import default_cache_directory
+
+from lexedata.exporter.phylogenetics import (
+    BeastWriter,
+    CharacterMatrix,
+    CodingProcedure,
+    AbsenceHeuristic,
+    CsvWriter,
+    IncrementalCoding,
+    Resampling,
+    add_partitions,
+    apply_heuristics,
+    compress_indices,
+    fill_beast,
+    form_concept_index,
+    multistate_code,
+    partition_filters,
+    raw_binary_alignment,
+    raw_multistate_alignment,
+    read_cldf_dataset,
+    resample,
+    root_meaning_code,
+    root_presence_code,
+    write_replicates,
+)
+
+from helper_functions import copy_to_temp
+
+
+def random_wordlist(
+    seed: int, n_languages: int = 12, n_concepts: int = 15, n_roots: int = 30
+) -> t.Dict[str, t.Dict[str, t.Set[str]]]:
+    rng = random.Random(seed)
+    roots = [f"r{i:02d}" for i in range(n_roots)]
+    return {
+        f"l{language}": {
+            f"c{concept:02d}": set(rng.sample(roots, rng.choice([0, 1, 1, 1, 2, 3])))
+            for concept in range(n_concepts)
+            if rng.random() < 0.8
+        }
+        for language in range(n_languages)
+    }
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matrix_root_meaning_matches_lists(seed):
+    dataset = random_wordlist(seed)
+    alignment, blocks = root_meaning_code(dataset)
+    matrix = CharacterMatrix.root_meaning(dataset)
+    assert list(matrix.sequences()) == raw_binary_alignment(alignment)
+    assert matrix.partitions == {
+        concept: list(indices.values())
+        for concept, indices in blocks.items()
+        if indices
+    }
+
+
+def reference_root_presence_code(dataset, relevant_concepts):
+    """Code root presence cell by cell, as root_presence_code used to."""
+    alignment = {}
+    for language, lexicon in dataset.items():
+        attested = set().union(*lexicon.values())
+        alignment[language] = ["0"]
+        for root in sorted(relevant_concepts):
+            if root in attested:
+                alignment[language].append("1")
+                continue
+            n_filled = sum(1 for c in relevant_concepts[root] if lexicon.get(c))
+            if 2 * n_filled >= len(relevant_concepts[root]):
+                alignment[language].append("0")
+            else:
+                alignment[language].append("?")
+    return alignment
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_root_presence_matches_reference(seed):
+    dataset = random_wordlist(seed)
+    rng = random.Random(seed)
+    concepts = sorted({c for lexicon in dataset.values() for c in lexicon})
+    relevant_concepts = {
+        root: rng.sample(concepts, rng.choice([0, 1, 2, 3]))
+        for lexicon in dataset.values()
+        for cognatesets in lexicon.values()
+        for root in cognatesets
+    }
+    reference = reference_root_presence_code(dataset, relevant_concepts)
+    alignment, _ = root_presence_code(dataset, relevant_concepts)
+    assert alignment == reference
+    matrix = CharacterMatrix.root_presence(dataset, relevant_concepts)
+    assert list(matrix.sequences()) == raw_binary_alignment(reference)
+
+
+def test_heuristics_share_snapshot(monkeypatch):
+    dataset = pycldf.Dataset.from_metadata(
+        Path(__file__).parent / "data/cldf/smallmawetiguarani/cldf-metadata.json"
+    )
+    c_f = dataset["CognateTable", "formReference"].name
+    c_s = dataset["CognateTable", "cognatesetReference"].name
+    concepts = {
+        form[dataset["FormTable", "id"].name]: form[
+            dataset["FormTable", "parameterReference"].name
+        ]
+        for form in dataset["FormTable"]
+    }
+    reference: t.Dict[str, t.Set[str]] = {}
+    for judgement in dataset["CognateTable"]:
+        reference.setdefault(judgement[c_s], set()).update(concepts[judgement[c_f]])
+
+    heuristic = AbsenceHeuristic.HALFPRIMARYCONCEPTS
+    assert apply_heuristics(dataset, heuristic) == reference
+
+    parsed: t.List[str] = []
+    parse = util.snapshot.SnapshotTable._parse
+
+    def counting_parse(self, logger):
+        parsed.append(str(self.table.url))
+        parse(self, logger)
+
+    monkeypatch.setattr(util.snapshot.SnapshotTable, "_parse", counting_parse)
+    snapshot = util.DatasetSnapshot(dataset)
+    read_cldf_dataset(snapshot)
+    assert apply_heuristics(snapshot, heuristic) == reference
+    assert (
+        apply_heuristics(
+            snapshot, heuristic, form_concepts=form_concept_index(snapshot)
+        )
+        == reference
+    )
+    assert sorted(parsed) == sorted(set(parsed))
+
+
+@pytest.mark.parametrize("n_roots", [5, 30])
+def test_matrix_multistate_matches_lists(n_roots):
+    dataset = random_wordlist(0, n_concepts=4, n_roots=n_roots)
+    alignment, _ = multistate_code(dataset)
+    sequences, n_symbols = raw_multistate_alignment(alignment)
+    matrix = CharacterMatrix.multistate(dataset)
+    assert matrix.states.dtype == numpy.uint8
+    assert list(matrix.sequences()) == sequences
+    assert matrix.n_symbols == n_symbols
+
+
+def test_multistate_alignment_does_not_change_input():
+    dataset = random_wordlist(2, n_concepts=3, n_roots=40)
+    alignment, _ = multistate_code(dataset)
+    copy = {language: [set(c) for c in cells] for language, cells in alignment.items()}
+    first = raw_multistate_alignment(alignment)
+    assert alignment == copy
+    assert raw_multistate_alignment(alignment) == first
+    assert first[1] > 10
+    assert list(CharacterMatrix.multistate(dataset).sequences()) == first[0]
+
+
+def test_matrix_select_cognatesets():
+    dataset = random_wordlist(1)
+    keep = {"r00", "r03", "r17"}
+    alignment, blocks = root_meaning_code(dataset)
+    exclude = {
+        index
+        for indices in blocks.values()
+        for cognateset, index in indices.items()
+        if cognateset not in keep
+    }
+    matrix = CharacterMatrix.root_meaning(dataset)
+    selected = matrix.select(matrix.cognateset_mask(keep))
+    assert list(selected.sequences()) == [
+        "".join(v for i, v in enumerate(sequence) if i not in exclude)
+        for sequence in alignment.values()
+    ]
+    assert {c for c in selected.cognatesets if c is not None} <= keep
+    assert all(
+        selected.cognatesets[i] in keep
+        for indices in selected.partitions.values()
+        for i in indices
+    )
+
+
+def root_presence_matrix(dataset):
+    relevant_concepts: t.Dict[str, t.Set[str]] = {}
+    for lexicon in dataset.values():
+        for concept, cognatesets in lexicon.items():
+            for root in cognatesets:
+                relevant_concepts.setdefault(root, set()).add(concept)
+    return CharacterMatrix.root_presence(dataset, relevant_concepts)
+
+
+@pytest.mark.parametrize(
+    "coding",
+    [CharacterMatrix.root_meaning, root_presence_matrix, CharacterMatrix.multistate],
+    ids=["rootmeaning", "rootpresence", "multistate"],
+)
+def test_beast_writer_matches_tree(coding):
+    matrix = coding(random_wordlist(2))
+    template = ET.fromstring(
+        "<beast><!-- header --><data /><run><plate range='{languages}'/></run></beast>"
+    )
+    output = io.BytesIO()
+    BeastWriter(output, template).write(matrix)
+    written = ET.fromstring(output.getvalue())
+
+    expected = ET.fromstring("<beast><data /></beast>")
+    fill_beast(expected.find("data"), matrix.languages, matrix.sequences())
+    add_partitions(expected.find("data"), matrix.partitions or {})
+
+    def datas(root):
+        return sorted(
+            (
+                data.get("id"),
+                data.get("filter"),
+                tuple(s.get("value") for s in data.iter("sequence")),
+            )
+            for data in root.iter("data")
+        )
+
+    assert datas(written) == datas(expected)
+    assert written[0].tag is ET.Comment
+    assert written.find("run/plate").get("range") == ",".join(matrix.languages)
+
+
+def test_csv_writer():
+    matrix = CharacterMatrix.multistate(random_wordlist(3, n_roots=30))
+    output = io.StringIO()
+    CsvWriter(output).write(matrix)
+    header, *rows = csv.reader(io.StringIO(output.getvalue()))
+    assert header == ["Language_ID"] + matrix.characters
+    assert rows == [[language] + cells for language, cells in matrix.rows()]
+
+
+def test_bootstrap_keeps_concept_blocks():
+    matrix = CharacterMatrix.root_meaning(random_wordlist(4))
+    replicate = resample(matrix, Resampling.BOOTSTRAP, numpy.random.default_rng(0))
+    assert len(replicate.partitions) == len(matrix.partitions)
+    assert replicate.n_characters == 1 + sum(
+        len(matrix.partitions[name.split(".")[0]]) for name in replicate.partitions
+    )
+    assert (replicate.states[:, 0] == 0).all()
+    for name, indices in replicate.partitions.items():
+        original = matrix.partitions[name.split(".")[0]]
+        assert (replicate.states[:, indices] == matrix.states[:, original]).all()
+        assert (replicate.missing[:, indices] == matrix.missing[:, original]).all()
+
+
+def test_jackknife():
+    matrix = CharacterMatrix.root_meaning(random_wordlist(4))
+    rng = numpy.random.default_rng(0)
+    languages = resample(matrix, Resampling.JACKKNIFELANGUAGES, rng, 0.25)
+    assert len(languages.languages) == 9
+    assert set(languages.languages) < set(matrix.languages)
+    characters = resample(matrix, Resampling.JACKKNIFECHARACTERS, rng, 0.5)
+    assert characters.n_characters == 1 + (matrix.n_characters - 1) // 2
+    assert characters.n_ascertainment == 1
+
+
+def test_parallel_replicates_are_reproducible(tmp_path):
+    matrix = CharacterMatrix.root_meaning(random_wordlist(5))
+    serial = write_replicates(
+        matrix, Resampling.BOOTSTRAP, 4, "nexus", tmp_path / "serial.nex", seed=1
+    )
+    parallel = write_replicates(
+        matrix,
+        Resampling.BOOTSTRAP,
+        4,
+        "nexus",
+        tmp_path / "parallel.nex",
+        seed=1,
+        jobs=2,
+    )
+    assert [p.name for p in serial] == [f"serial_{i}.nex" for i in range(1, 5)]
+    assert [p.read_text() for p in serial] == [p.read_text() for p in parallel]
+    assert len({p.read_text() for p in serial}) > 1
+
+
+@pytest.mark.parametrize(
+    "coding", [CodingProcedure.ROOTMEANING, CodingProcedure.MULTISTATE]
+)
+def test_incremental_coding_matches_full_coding(coding, tmp_path):
+    dataset = random_wordlist(6)
+    IncrementalCoding.code(dataset, coding).store(tmp_path / "coding.npz")
+
+    changed = random_wordlist(6)
+    changed["l0"]["c99"] = {"r00"}
+    del changed["l3"]["c01"]
+    changed["l5"]["c02"] = {"r01", "r29"}
+    del changed["l4"]["c13"]
+    coding_again = IncrementalCoding.load(tmp_path / "coding.npz", coding)
+    assert coding_again.update(changed) == ["c01", "c02", "c13", "c99"]
+
+    fresh = IncrementalCoding.code(changed, coding).matrix
+    assert list(coding_again.matrix.sequences()) == list(fresh.sequences())
+    assert coding_again.matrix.partitions == fresh.partitions
+    assert coding_again.matrix.characters == fresh.characters
+
+
+def test_incremental_coding_from_cli_loads_in_library(tmp_path, monkeypatch):
+    # Running the module as a script makes its classes live in __main__, so
+    # the stored coding must not depend on where the classes are defined.
+    dataset, target = copy_to_temp(
+        Path(__file__).parent / "data/cldf/smallmawetiguarani/cldf-metadata.json"
+    )
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "lexedata.exporter.phylogenetics",
+            "--metadata",
+            str(target),
+            "--coding",
+            "rootmeaning",
+            "--incremental",
+            "-o",
+            str(tmp_path / "alignment.txt"),
+        ],
+        check=True,
+    )
+    stored = default_cache_directory(dataset) / "phylogenetics-rootmeaning.npz"
+    coding = IncrementalCoding.load(stored, CodingProcedure.ROOTMEANING)
+    assert coding is not None
+    fresh = CharacterMatrix.root_meaning(read_cldf_dataset(dataset))
+    assert list(coding.matrix.sequences()) == list(fresh.sequences())
+    assert coding.matrix.characters == fresh.characters
+
+
+def test_incremental_coding_ignores_broken_cache(tmp_path):
+    stored = tmp_path / "coding.npz"
+    stored.write_bytes(b"not a numpy archive")
+    assert IncrementalCoding.load(stored, CodingProcedure.ROOTMEANING) is None
+    assert (
+        IncrementalCoding.load(tmp_path / "missing.npz", CodingProcedure.ROOTMEANING)
+        is None
+    )
+
+
+def test_incremental_coding_new_languages():
+    coding = IncrementalCoding.code(random_wordlist(7), CodingProcedure.ROOTMEANING)
+    dataset = random_wordlist(7, n_languages=13)
+    coding.update(dataset)
+    assert list(coding.matrix.sequences()) == list(
+        CharacterMatrix.root_meaning(dataset).sequences()
+    )
+
+
+def test_partition_filters_match_compress_indices():
+    rng = random.Random(0)
+    partitions = {
+        f"p{p}": rng.sample(range(200), rng.randrange(0, 40)) for p in range(50)
+    }
+    assert partition_filters(partitions) == {
+        name: [(s.start, s.stop) for s in compress_indices(indices)]
+        for name, indices in partitions.items()
+    }
+
+
+def test_compress_fragmented_indices():
+    # Far more fragments than the recursion limit
+    indices = list(range(0, 20000, 2))
+    assert len(list(compress_indices(indices))) == 10000
+    assert len(partition_filters({"p": indices})["p"]) == 10000
@@ -1,10 +1,22 @@
 import pytest
+import random
 import logging
 from pathlib import Path
 
 import pycldf
 
-from lexedata.util import normalize_table_name
+from helper_functions import copy_to_temp
+
+from lexedata.util import (
+    normalize_table_name,
+    cache_table,
+    read_columns,
+    edit_distance,
+    edit_distance_matrix,
+    DatasetSnapshot,
+    FuzzyIndex,
+)
+from lexedata.util.snapshot import default_cache_directory
 
 
 @pytest.fixture(params=["data/cldf/smallmawetiguarani/cldf-metadata.json"])
@@ -21,3 +33,91 @@ def test_normal_table_names(wordlist, caplog):
     with caplog.at_level(logging.WARNING):
         assert normalize_table_name("NonExistingTable", wordlist) is None
     assert "Could not find table NonExistingTable" in caplog.text
+
+
+def test_snapshot_cache_table_matches_dataset(wordlist):
+    snapshot = DatasetSnapshot(wordlist)
+    for table in ["FormTable", "CognateTable", "LanguageTable"]:
+        assert dict(cache_table(snapshot, table)) == cache_table(wordlist, table)
+
+
+def test_snapshot_reads_table_once(wordlist):
+    snapshot = DatasetSnapshot(wordlist)
+    assert snapshot["FormTable"] is snapshot.table("forms.csv")
+    forms = cache_table(snapshot)
+    form_id = next(iter(forms))
+    forms[form_id]["form"] = "changed"
+    assert cache_table(snapshot)[form_id]["form"] != "changed"
+
+
+def test_snapshot_disk_cache_invalidated_by_write(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    dataset, _ = copy_to_temp(
+        Path(__file__).parent / "data/cldf/smallmawetiguarani/cldf-metadata.json"
+    )
+    cache = default_cache_directory(dataset)
+    assert tmp_path in cache.parents
+    forms = list(DatasetSnapshot(dataset, cache=True)["FormTable"])
+    assert (cache / "forms.csv.pickle").exists()
+    assert (cache / ".gitignore").read_text() == "*\n"
+    assert not list(Path(dataset.directory).glob(".lexedata*"))
+    assert list(DatasetSnapshot(dataset, cache=True)["FormTable"]) == forms
+
+    snapshot = DatasetSnapshot(dataset, cache=True)
+    snapshot.write(FormTable=forms[:1])
+    assert not (cache / "forms.csv.pickle").exists()
+    assert len(DatasetSnapshot(dataset, cache=True)["FormTable"]) == 1
+
+
+def test_snapshot_disk_cache_notices_external_changes():
+    dataset, _ = copy_to_temp(
+        Path(__file__).parent / "data/cldf/smallmawetiguarani/cldf-metadata.json"
+    )
+    forms = list(DatasetSnapshot(dataset, cache=True)["FormTable"])
+    dataset.write(FormTable=forms[:2])
+    assert len(DatasetSnapshot(dataset, cache=True)["FormTable"]) == 2
+
+
+@pytest.mark.parametrize("table", ["FormTable", "CognateTable", "LanguageTable"])
+def test_read_columns_matches_dataset(wordlist, table):
+    columns = {c.name: c.name for c in wordlist[table].tableSchema.columns}
+    rows = [{c: row[c] for c in columns} for row in wordlist[table]]
+    assert list(read_columns(wordlist, table, columns)) == rows
+    assert list(read_columns(DatasetSnapshot(wordlist), table, columns)) == rows
+    strings = {
+        c.name: c.name
+        for c in wordlist[table].tableSchema.columns
+        if c.datatype is None or c.datatype.base == "string"
+    }
+    assert list(read_columns(wordlist, table, strings)) == [
+        {c: row[c] for c in strings} for row in rows
+    ]
+
+
+@pytest.mark.parametrize("threshold", [0.1, 0.25, 0.5, 0.8])
+def test_fuzzy_index_finds_everything_within_threshold(threshold):
+    rng = random.Random(threshold)
+    words = [
+        "".join(rng.choice("abcdeé ") for _ in range(rng.randint(1, 9)))
+        for _ in range(300)
+    ]
+    index = FuzzyIndex()
+    for i, word in enumerate(words):
+        index.add(i, word)
+    for query in words[:30] + ["abc", "edcba", "é"]:
+        candidates = set(index.candidates(query, threshold))
+        for i, word in enumerate(words):
+            if edit_distance(query, word) <= threshold:
+                assert i in candidates
+
+
+def test_edit_distance_matrix_agrees_with_edit_distance():
+    rng = random.Random(0)
+    words = [
+        "".join(rng.choice("abcé") for _ in range(rng.randint(1, 7)))
+        for _ in range(100)
+    ] + ["", None]
+    matrix = edit_distance_matrix(words, words[::-1])
+    for i, a in enumerate(words):
+        for j, b in enumerate(words[::-1]):
+            assert matrix[i, j] == pytest.approx(edit_distance(a, b))
@@ -1,6 +1,7 @@
 from pathlib import Path
 
 import pytest
+import csvw.metadata
 
 from lexedata.util.simplify_ids import update_ids, update_integer_ids
 from helper_functions import copy_to_temp
@@ -68,3 +69,50 @@ def test_update_ids(copy_dataset):
         param_refs.extend(f[c_f_concept])
     param_refs = set(param_refs)
     assert {"a", "b", "c"} == concept_ids == param_refs
+
+
+@pytest.mark.parametrize("atomic", [False, True])
+def test_update_ids_writes_each_table_once(copy_dataset, monkeypatch, atomic):
+    dataset, _ = copy_dataset
+    c_f_concept = dataset.column_names.forms.parameterReference
+    c_c_id = dataset.column_names.parameters.id
+    mapping = {
+        c[c_c_id]: f"concept{i}" for i, c in enumerate(dataset["ParameterTable"])
+    }
+    expected_forms = [
+        [mapping[c] for c in f[c_f_concept]] for f in dataset["FormTable"]
+    ]
+
+    written = []
+    original_write = csvw.metadata.Table.write
+
+    def write(table, items, *args, **kwargs):
+        written.append(table.url.string)
+        return original_write(table, items, *args, **kwargs)
+
+    monkeypatch.setattr(csvw.metadata.Table, "write", write)
+    update_ids(
+        ds=dataset, table=dataset["ParameterTable"], mapping=mapping, atomic=atomic
+    )
+    assert sorted(written) == sorted(set(written))
+    assert set(written) == {
+        dataset["ParameterTable"].url.string,
+        dataset["FormTable"].url.string,
+    }
+    assert [f[c_f_concept] for f in dataset["FormTable"]] == expected_forms
+    assert {c[c_c_id] for c in dataset["ParameterTable"]} == set(mapping.values())
+    assert not list(Path(dataset.directory).glob("*.tmp"))
+
+
+def test_update_ids_atomic_keeps_file_mode(copy_dataset):
+    dataset, _ = copy_dataset
+    forms = Path(dataset["FormTable"].url.resolve(dataset.directory))
+    forms.chmod(0o644)
+    c_c_id = dataset.column_names.parameters.id
+    mapping = {
+        c[c_c_id]: f"concept{i}" for i, c in enumerate(dataset["ParameterTable"])
+    }
+    update_ids(
+        ds=dataset, table=dataset["ParameterTable"], mapping=mapping, atomic=True
+    )
+    assert forms.stat().st_mode & 0o777 == 0o644
@@ -8,6 +8,7 @@ from lexedata.report.filter import parser as filter_parser
 from lexedata.exporter.phylogenetics import (
     CodingProcedure,
     AbsenceHeuristic,
+    export_jobs,
     parser as phylo_parser,
 )
 from lexedata.exporter.cognates import parser as cex_parser
@@ -74,15 +75,40 @@ def test_phylo_parser():
             "centralconcept",
         ]
     )
-    assert parameters.format == "beast"
-    assert parameters.output_file.absolute() == Path(ofname).absolute()
+    assert parameters.format == ["beast"]
+    assert [o.absolute() for o in parameters.output_file] == [Path(ofname).absolute()]
     assert parameters.languages == ["l1", "l2", "l3"]
     assert type(parameters.concepts) == types.WorldSet
     assert type(parameters.cognatesets) == types.WorldSet
-    assert parameters.coding == CodingProcedure.ROOTPRESENCE
+    assert parameters.coding == [CodingProcedure.ROOTPRESENCE]
     assert parameters.absence_heuristic == AbsenceHeuristic.CENTRALCONCEPT
 
 
+def test_phylo_parser_several_exports():
+    parameters = phylo_parser().parse_args(
+        [
+            "--coding",
+            "multistate",
+            "--format",
+            "nexus",
+            "-o",
+            "matrix.nex",
+            "--format",
+            "csv",
+            "-o",
+            "matrix.csv",
+        ]
+    )
+    assert export_jobs(
+        parameters.format, parameters.coding, parameters.output_file
+    ) == [
+        (CodingProcedure.MULTISTATE, "nexus", Path("matrix.nex")),
+        (CodingProcedure.MULTISTATE, "csv", Path("matrix.csv")),
+    ]
+    defaults = phylo_parser().parse_args([])
+    assert (defaults.format, defaults.coding, defaults.output_file) == ([], [], [])
+
+
 def test_cex_parser():
     _, fname = tempfile.mkstemp(".xlsx")
     parameters = cex_parser().parse_args([fname, "--add-singletons"])